@@ -0,0 +1,279 @@
+import re
+
+# 不经过大模型、直接用规则回答的快速通道: 只在规则能完全解释输入时返回答案, 否则返回 None 交给模型处理。
+# problem_3 (飞行指令) 与 problem_4 (程序控制指令) 的指令集合来自 train_prompt.json
+
+# ---------- problem_4: 程序控制指令 ----------
+
+ACTION_PATTERNS = {
+    'pause': re.compile(r'\b(?:pause|suspend|halt|stop)\b|暂停|停止|中止|停下'),
+    'start': re.compile(r'\b(?:start|initiate|launch|begin|commence|activate|kick off)\b|(?<!重新)启动|开始|开启|发起'),
+    'continue': re.compile(r'\b(?:resume|continue)\b|恢复|继续|重启|重新启动|续上|接着'),
+    'clear': re.compile(r'\b(?:clear\w*|cancel|reset|erase|wipe)\b|清除|清空|取消|清理|结束'),
+}
+
+# "继续之前暂停的任务" 中的 "暂停的" 只是修饰语, 识别动作前先去掉
+PAUSED_MODIFIER = re.compile(r'\b(?:previously|earlier|erstwhile|once)?\s*(?:paused|suspended|halted|stopped)\b|'
+                             r'(?:之前|先前|刚才)?(?:暂停|停下|中断)(?:了)?的')
+
+SCOPE_PATTERNS = {
+    'fly': re.compile(r'\bfl(?:y|ight|ying)\b|\bcontrol\b|\bnavigation\b|飞行|飞控|控制|操控'),
+    'search': re.compile(r'\bsearch\w*|\bdetect\w*|\bhunt\b|\bseek\w*|\bquest\w*|\bscout\w*|\breconnaissance\b|'
+                         r'\blocate\b|\bobject\b|\btarget\b|搜索|搜寻|检测|寻找|查找|探寻|目标|物体'),
+}
+
+# 标注中含义不一致的词 (例如 "终止" 既标为 clear 也标为 pause, "操作" 既指飞行也指全部任务) 以及否定句, 直接交给模型
+AMBIGUOUS = re.compile(r"\b(?:do not|don't|never|not|then|terminate|operation\w*|command\w*|guid\w*|explor\w*|mission)\b|"
+                       r"终止|操作|探索|并执行|不要|别|不必|再")
+
+
+def parse_program_command(text):
+    lowered = text.lower()
+    if AMBIGUOUS.search(lowered):
+        return None
+    unmodified = PAUSED_MODIFIER.sub(' ', lowered)
+    actions = {name for name, pattern in ACTION_PATTERNS.items() if pattern.search(unmodified)}
+    if len(actions) != 1:
+        return None
+    scopes = {name for name, pattern in SCOPE_PATTERNS.items() if pattern.search(lowered)}
+    if not scopes:
+        return None
+    action = actions.pop()
+    if scopes == {'fly', 'search'}:
+        return f"{action}_task."
+    return f"{action}_{scopes.pop()}_task."
+
+
+# ---------- problem_3: 飞行指令 ----------
+
+EN_CLAUSE_SEPARATOR = re.compile(
+    r'[.!?;]+\s*|,\s*and\b\s*|,?\s*\b(?:and then|then|after that|afterwards|after this|next|subsequently|following that|later|'
+    r'finally|and finally|in the end|and in the end|immediately after|before proceeding further)\b,?\s*')
+
+ZH_CLAUSE_SEPARATOR = re.compile(r'[，。；！？,.;!?]|然后|接着|随后|紧接着|之后|在这之后|接下来|最后|再')
+
+EN_NUMBER_WORDS = {
+    'one': 1, 'two': 2, 'three': 3, 'four': 4, 'five': 5, 'six': 6, 'seven': 7, 'eight': 8, 'nine': 9, 'ten': 10,
+    'eleven': 11, 'twelve': 12, 'fifteen': 15, 'twenty': 20, 'thirty': 30, 'forty': 40, 'fifty': 50, 'sixty': 60,
+    'seventy': 70, 'eighty': 80, 'ninety': 90, 'hundred': 100,
+}
+
+EN_UNITS = [
+    ('cm', r'cm|centimet(?:er|re)s?'),
+    ('m', r'm|met(?:er|re)s?'),
+    ('in', r'in|inch(?:es)?'),
+    ('ft', r'ft|foot|feet'),
+    ('degrees', r'degrees?|°'),
+]
+
+EN_VALUE = re.compile(
+    r'(?P<number>\d+(?:\.\d+)?|\ban?\b|(?:(?:' + '|'.join(EN_NUMBER_WORDS) + r')[\s-]*)+)\s*(?P<unit>' +
+    '|'.join(f'(?P<{name}>{pattern})' if name != 'degrees' else f'(?P<deg>{pattern})' for name, pattern in EN_UNITS)
+    + r')(?![a-z])')
+
+EN_ANY_NUMBER = re.compile(r'\d|\b(?:' + '|'.join(EN_NUMBER_WORDS) + r')\b')
+
+EN_TAKE_OFF = re.compile(r'\btake\s+(?:it\s+|the drone\s+)?off\b|\btake-?off\b|\blift[\s-]*off\b|\blaunch\w*|'
+                         r'\boff the ground\b|\bstart flying\b|\bin(?:to)? the air\b')
+
+EN_LAND = re.compile(r'\bland(?:ing)?\b|\btouch ?down\b|\bset (?:it|the drone) down\b|\b(?:on|to) the ground\b|'
+                     r'\bground level\b|\bdown to earth\b')
+
+EN_TURN_VERB = re.compile(r'\b(?:turn|rotate|spin|tilt|steer|yaw|pivot)\w*\b')
+
+EN_TURN_DIRECTION = {
+    'left': re.compile(r'\bleft\b|\bcounter-?clockwise\b|\banti-?clockwise\b'),
+    'right': re.compile(r'(?<!counter)(?<!counter-)(?<!anti)(?<!anti-)\bclockwise\b|\bright\b'),
+}
+
+EN_MOVE_DIRECTION = {
+    'forward': re.compile(r'\bforwards?\b|\bahead\b|\badvance\w*\b'),
+    'back': re.compile(r'\bback(?:wards?)?\b|\breverse\b'),
+    'left': re.compile(r'\bleft(?:wards?)?\b'),
+    'right': re.compile(r'\bright(?:wards?)?\b'),
+    'up': re.compile(r'\bup(?:wards?)?\b|\bclimb\w*\b|\bascend\w*\b|\brise\b|\braise\b|\belevate\b|\bhigher\b'),
+    'down': re.compile(r'\bdown(?:wards?)?\b|\bdescen\w*\b|\blower\b|\bdrop\b'),
+}
+
+EN_MOVE_VERB = re.compile(r'\b(?:move|fly|go|shift|slide|drift|push|bring|take|send)\b')
+
+# 出现这些词说明句子可能包含规则无法确定的隐含动作或数值 (例如 "turn around", "head left", "a quarter turn"),
+# 整条指令交给模型
+EN_UNSURE = re.compile(r'\b(?:around|head\w*|direction|hover\w*|veer|altitude|height|position|side|bit|little|'
+                       r'while|short|quarter|half|distance|past|again|ground|earth|ascent|engines?|steadily|slightly|'
+                       r'movement|sideways|straight|over|say)\b|\bto \d')
+
+ZH_DIGITS = {'零': 0, '一': 1, '二': 2, '两': 2, '三': 3, '四': 4, '五': 5, '六': 6, '七': 7, '八': 8, '九': 9}
+
+ZH_UNITS = {'厘米': 'cm', '公分': 'cm', '米': 'm', '英寸': 'in', '英尺': 'ft', '度': 'degrees'}
+
+# "一米五" 这类单位后接小数的写法由 tail 捕获, 视为无法确定的数值
+ZH_VALUE = re.compile(r'(?P<number>\d+(?:\.\d+)?|[零一二两三四五六七八九十百千点]+)\s*(?P<unit>厘米|公分|英寸|英尺|米|度)'
+                      r'(?P<tail>[一二两三四五六七八九半]?)')
+
+ZH_TAKE_OFF = re.compile(r'起飞')
+
+ZH_LAND = re.compile(r'降落|着陆|落地')
+
+ZH_TURN = re.compile(r'(?:向|往)?(?P<direction>左|右)(?:旋转|转动|转向|转)|转向(?P<direction2>左|右)')
+
+ZH_MOVE = [
+    ('forward', re.compile(r'前进|(?:向|往)前(?:方)?(?:移动|飞行|飞|移|进)?|前移')),
+    ('back', re.compile(r'后退|(?:向|往)后(?:方)?(?:移动|飞行|飞|移|退)?|后移')),
+    ('left', re.compile(r'(?:向|往)左(?:侧|边)?(?:移动|飞行|飞|移|平移)|左移|左侧移动|左边移动')),
+    ('right', re.compile(r'(?:向|往)右(?:侧|边)?(?:移动|飞行|飞|移|平移)|右移|右侧移动|右边移动')),
+    ('up', re.compile(r'上升|升高|爬升|抬升|拉高|升起|向上')),
+    ('down', re.compile(r'下降|降低|下落|向下')),
+]
+
+# 含运动或观察含义但不是明确指令的字词 ("继续前进"、"看看左边"、"停在地面上"), 出现时整条指令交给模型
+ZH_UNSURE = re.compile(r'移|飞|转|升|降|扬|退|进|调整|掉头|调头|高|低|方向|[前后左右]方|继续|看|查|察|地|停')
+
+
+def zh_number(text):
+    if re.fullmatch(r'\d+(?:\.\d+)?', text):
+        return float(text)
+    if '点' in text:
+        integer, _, decimal = text.partition('点')
+        value = zh_number(integer) if integer else 0
+        if value is None or not decimal or any(ch not in ZH_DIGITS for ch in decimal):
+            return None
+        return value + float('0.' + ''.join(str(ZH_DIGITS[ch]) for ch in decimal))
+    total, digit = 0, None
+    for ch in text:
+        if ch in ZH_DIGITS:
+            if digit is not None:
+                return None
+            digit = ZH_DIGITS[ch]
+        elif ch in '十百千':
+            total += (1 if digit is None else digit) * {'十': 10, '百': 100, '千': 1000}[ch]
+            digit = None
+        else:
+            return None
+    return total + (digit or 0)
+
+
+def en_number(text):
+    if re.fullmatch(r'\d+(?:\.\d+)?', text):
+        return float(text)
+    if text in ('a', 'an'):
+        return 1
+    total = 0
+    for word in re.split(r'[\s-]+', text.strip()):
+        if word == 'hundred':
+            total = max(total, 1) * 100
+        elif word in EN_NUMBER_WORDS:
+            total += EN_NUMBER_WORDS[word]
+        elif word:
+            return None
+    return total
+
+
+def format_value(value):
+    return str(int(value)) if value == int(value) else str(value)
+
+
+def resolve_command(candidates, values, implicit_missing):
+    # candidates 为子句中识别出的指令, values 为 [(数值, 单位)]; 返回 (指令, 是否确定)。
+    # 转向只接受角度, 平移只接受长度; 没有数值时输出 Missing, 但 implicit_missing 中的指令
+    # 在标注里常被理解为起飞/降落或默认角度, 不作判断
+    if len(candidates) != 1 or len(values) > 1:
+        return None, False
+    command = candidates[0]
+    if command in ('take_off', 'land'):
+        return (command, True) if not values else (None, False)
+    if not values:
+        return (None, False) if command in implicit_missing else (f"Missing {command}", True)
+    value, unit = values[0]
+    if value is None or (unit == 'degrees') != command.startswith('turn_'):
+        return None, False
+    return f"{command} {format_value(value)} {unit}", True
+
+
+def parse_en_clause(clause):
+    # 返回 (指令, 是否确定); 无指令的纯描述子句返回 (None, True)
+    values = []
+    for match in EN_VALUE.finditer(clause):
+        unit = next(name for name in ('cm', 'm', 'in', 'ft') if match.group(name)) if not match.group('deg') \
+            else 'degrees'
+        values.append((en_number(match.group('number')), unit))
+    remaining_numbers = EN_ANY_NUMBER.findall(EN_VALUE.sub(' ', clause))
+
+    candidates = []
+    if EN_TAKE_OFF.search(clause):
+        candidates.append('take_off')
+    if EN_LAND.search(clause):
+        candidates.append('land')
+    rest = EN_LAND.sub(' ', EN_TAKE_OFF.sub(' ', clause))
+    if EN_TURN_VERB.search(rest):
+        if EN_MOVE_VERB.search(rest):
+            return None, False
+        candidates.extend(f"turn_{d}" for d, pattern in EN_TURN_DIRECTION.items() if pattern.search(rest))
+    else:
+        candidates.extend(f"move_{d}" for d, pattern in EN_MOVE_DIRECTION.items() if pattern.search(rest))
+
+    if not candidates:
+        sure = not values and not remaining_numbers and not EN_TURN_VERB.search(clause) and \
+            not EN_UNSURE.search(clause) and not EN_MOVE_VERB.search(clause)
+        return None, sure
+    if remaining_numbers or EN_UNSURE.search(rest):
+        return None, False
+    return resolve_command(candidates, values, ('move_up', 'move_down', 'move_left', 'move_right'))
+
+
+def parse_zh_clause(clause):
+    values = [(zh_number(m.group('number')) if not m.group('tail') else None, ZH_UNITS[m.group('unit')])
+              for m in ZH_VALUE.finditer(clause)]
+    candidates = []
+    if ZH_TAKE_OFF.search(clause):
+        candidates.append('take_off')
+    if ZH_LAND.search(clause):
+        candidates.append('land')
+    rest = ZH_LAND.sub(' ', ZH_TAKE_OFF.sub(' ', clause))
+    turn = ZH_TURN.search(rest)
+    if turn:
+        candidates.append(f"turn_{'left' if (turn.group('direction') or turn.group('direction2')) == '左' else 'right'}")
+        rest = ZH_TURN.sub(' ', rest)
+    for direction, pattern in ZH_MOVE:
+        if pattern.search(rest):
+            candidates.append(f"move_{direction}")
+            rest = pattern.sub(' ', rest)
+
+    if not candidates:
+        return None, not values and not ZH_UNSURE.search(clause)
+    if ZH_UNSURE.search(ZH_VALUE.sub(' ', rest)):
+        return None, False
+    return resolve_command(candidates, values, ('move_up', 'move_down', 'turn_left', 'turn_right'))
+
+
+def parse_flight_commands(text):
+    is_zh = re.search(r'[一-鿿]', text) is not None
+    if is_zh:
+        clauses, parse_clause = ZH_CLAUSE_SEPARATOR.split(text), parse_zh_clause
+    else:
+        clauses, parse_clause = EN_CLAUSE_SEPARATOR.split(text.lower()), parse_en_clause
+    commands = []
+    for clause in clauses:
+        if not clause or not clause.strip():
+            continue
+        command, sure = parse_clause(clause)
+        if not sure:
+            return None
+        # "准备降落, 请安全降落" 这类重复的起飞/降落只算一次
+        if command and not (command in ('take_off', 'land') and commands and commands[-1] == command):
+            commands.append(command)
+    if not commands:
+        return None
+    return '; '.join(commands) + '.'
+
+
+FAST_PATH_PARSERS = {
+    'problem_3': parse_flight_commands,
+    'problem_4': parse_program_command,
+}
+
+
+def fast_path(task, user_input):
+    # 返回规则给出的回答; 任务不支持或规则不确定时返回 None
+    parser = FAST_PATH_PARSERS.get(task)
+    return parser(user_input) if parser else None
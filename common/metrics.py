@@ -0,0 +1,136 @@
+import math
+
+SNAPSHOT_QUANTILES = (0.5, 0.95, 0.99)
+
+# 分位数的相对误差上限 (1%): 桶边界按 gamma = (1 + a) / (1 - a) 的等比数列划分
+SKETCH_RELATIVE_ACCURACY = 0.01
+
+
+class LatencySketch:
+    # 对数分桶的可合并延迟直方图: 只保存非空桶的计数, 内存与样本数无关,
+    # 多个进程/文件的 sketch 直接按桶相加即可合并, 任意分位数的相对误差不超过 relative_accuracy
+
+    def __init__(self, relative_accuracy=SKETCH_RELATIVE_ACCURACY):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.buckets = {}
+        self.zero_count = 0
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, value, weight=1):
+        if value > 0:
+            key = math.ceil(math.log(value) / self.log_gamma)
+            self.buckets[key] = self.buckets.get(key, 0) + weight
+        else:
+            self.zero_count += weight
+        self.count += weight
+        self.total += value * weight
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def merge(self, other):
+        if other.gamma != self.gamma:
+            raise ValueError("只能合并相对精度相同的 LatencySketch")
+        for key, count in other.buckets.items():
+            self.buckets[key] = self.buckets.get(key, 0) + count
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.total += other.total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    def mean(self):
+        return self.total / self.count if self.count else math.nan
+
+    def quantile(self, q):
+        if not self.count:
+            return math.nan
+        # 与 np.percentile 的线性插值口径一致: 取第 q * (n - 1) 个样本 (从 0 开始) 所在的桶
+        rank = q * (self.count - 1)
+        seen = self.zero_count
+        if rank < seen:
+            return max(self.min, 0.0)
+        for key in sorted(self.buckets):
+            seen += self.buckets[key]
+            if rank < seen:
+                value = 2 * self.gamma ** key / (self.gamma + 1)
+                return min(max(value, self.min), self.max)
+        return self.max
+
+
+class RunningStats:
+    # Welford 在线均值/方差, 可按 Chan 等人的并行公式合并; variance 为总体方差, 与 np.std 的默认口径一致
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def add(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+    def merge(self, other):
+        if other.count == 0:
+            return self
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta ** 2 * self.count * other.count / count
+        self.count = count
+        return self
+
+    def variance(self):
+        return self.m2 / self.count if self.count else math.nan
+
+    def std(self):
+        return math.sqrt(self.variance()) if self.count else math.nan
+
+
+class StreamingSummary:
+    # RunningStats + LatencySketch: 一次遍历同时得到均值、标准差与分位数, 读取过程中随时可以取快照
+
+    def __init__(self, relative_accuracy=SKETCH_RELATIVE_ACCURACY):
+        self.stats = RunningStats()
+        self.sketch = LatencySketch(relative_accuracy)
+
+    @property
+    def count(self):
+        return self.stats.count
+
+    def add(self, value):
+        self.stats.add(value)
+        self.sketch.add(value)
+
+    def merge(self, other):
+        self.stats.merge(other.stats)
+        self.sketch.merge(other.sketch)
+        return self
+
+    def mean(self):
+        return self.stats.mean if self.count else math.nan
+
+    def std(self):
+        return self.stats.std()
+
+    def quantile(self, q):
+        return self.sketch.quantile(q)
+
+    def min(self):
+        return self.sketch.min if self.count else math.nan
+
+    def max(self):
+        return self.sketch.max if self.count else math.nan
+
+    def snapshot(self, quantiles=SNAPSHOT_QUANTILES):
+        snapshot = {'count': self.count, 'mean': self.mean(), 'std': self.std(), 'min': self.min(), 'max': self.max()}
+        for q in quantiles:
+            snapshot[f"p{q * 100:g}"] = self.quantile(q)
+        return snapshot
@@ -0,0 +1,90 @@
+import re
+
+from common.prompts import FUSED_TASK
+
+# 各任务的输出都是很小的封闭文法 (见 train_prompt.json), 这里给出两种等价的描述:
+#   GBNF_GRAMMARS: llama.cpp 的 GBNF 文法, 由支持 grammar 字段的推理服务在解码时约束 token
+#   OUTPUT_PATTERNS: 对应的正则, 用于客户端判断输出是否合法、是否已经完整 (完整后即可停止生成)
+# 注意: Ollama 的 format 参数只接受 JSON schema, 会把输出变成 JSON, 与微调时的输出格式不一致, 这里不使用
+
+GBNF_RULES = r'''
+objects ::= object ("; " object)* "."
+object ::= [^;.\[\]\n]+
+commands ::= command ("; " command)* "."
+command ::= "take_off" | "land" | move " " number " " unit | turn " " number " degrees" | "Missing " (move | turn)
+move ::= "move_" ("forward" | "back" | "left" | "right" | "up" | "down")
+turn ::= "turn_" ("left" | "right")
+number ::= [0-9]+ ("." [0-9]+)?
+unit ::= "cm" | "m" | "in" | "ft"
+program ::= ("pause" | "start" | "continue" | "clear") "_" ("fly_" | "search_")? "task."
+'''
+
+GBNF_GRAMMARS = {
+    'problem_1': 'root ::= [ABCD] "."',
+    'problem_2': 'root ::= objects' + GBNF_RULES,
+    'problem_3': 'root ::= "None." | commands' + GBNF_RULES,
+    'problem_4': 'root ::= "None." | program' + GBNF_RULES,
+    FUSED_TASK: 'root ::= "A. " objects | "B. " commands | "C. " program | "D."' + GBNF_RULES,
+}
+
+OBJECTS = r'[^;.\[\]\n]+(?:; [^;.\[\]\n]+)*\.'
+
+NUMBER = r'\d+(?:\.\d+)?'
+
+MOVE = r'move_(?:forward|back|left|right|up|down)'
+
+TURN = r'turn_(?:left|right)'
+
+COMMAND = rf'(?:take_off|land|{MOVE} {NUMBER} (?:cm|m|in|ft)|{TURN} {NUMBER} degrees|Missing (?:{MOVE}|{TURN}))'
+
+COMMANDS = rf'{COMMAND}(?:; {COMMAND})*\.'
+
+PROGRAM = r'(?:pause|start|continue|clear)_(?:fly_|search_)?task\.'
+
+OUTPUT_PATTERNS = {
+    'problem_1': re.compile(r'[ABCD]\.'),
+    'problem_2': re.compile(OBJECTS),
+    'problem_3': re.compile(rf'None\.|{COMMANDS}'),
+    'problem_4': re.compile(rf'None\.|{PROGRAM}'),
+    FUSED_TASK: re.compile(rf'A\. {OBJECTS}|B\. {COMMANDS}|C\. {PROGRAM}|D\.'),
+}
+
+# 每个任务最多生成的 token 数 (num_predict): 验证集中最长回答的 token 数再留出余量,
+# problem_3 最长约 270 个字符 (多条指令), problem_1 只有一个字母加句点
+NUM_PREDICT = {
+    'problem_1': 4,
+    'problem_2': 48,
+    'problem_3': 128,
+    'problem_4': 16,
+    FUSED_TASK: 128,
+}
+
+# 所有任务的输出都只有一行, 换行说明模型开始续写下一条 "user input: ..."
+STOP_SEQUENCES = ['\n']
+
+
+def generation_options(task):
+    # Ollama /api/generate 的 options 字段; 未知任务 (例如预热用的 "Hello") 不加限制
+    if task not in NUM_PREDICT:
+        return {}
+    return {'num_predict': NUM_PREDICT[task], 'stop': STOP_SEQUENCES}
+
+
+def is_valid(task, text):
+    pattern = OUTPUT_PATTERNS.get(task)
+    return pattern is not None and pattern.fullmatch(text.strip()) is not None
+
+
+def truncate_to_grammar(task, text):
+    # 返回文法第一次完整时的最短前缀, 例如 "move_up 20 cm.\nuser input: ..." -> "move_up 20 cm.";
+    # 任何前缀都不合法时原样返回。所有输出都以句点结尾, 只需检查每个句点处的前缀
+    pattern = OUTPUT_PATTERNS.get(task)
+    if pattern is None:
+        return text
+    stripped = text.strip()
+    end = stripped.find('.')
+    while end != -1:
+        if pattern.fullmatch(stripped[:end + 1]):
+            return stripped[:end + 1]
+        end = stripped.find('.', end + 1)
+    return text
@@ -0,0 +1,66 @@
+import json
+import os
+from functools import lru_cache
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROMPT_FILE = os.path.join(ROOT_DIR, 'dataset_generation', 'generation_pipeline', 'train_prompt.json')
+
+TASK_TYPES = ['problem_1', 'problem_2', 'problem_3', 'problem_4']
+
+
+@lru_cache(maxsize=None)
+def prompt_templates(prompt_file=PROMPT_FILE):
+    with open(prompt_file, 'r', encoding='utf-8') as f:
+        train_prompt = json.load(f)
+    return {task: value['prompt'][0] for task, value in train_prompt.items()}
+
+
+def render_query(task, user_input):
+    return prompt_templates()[task].replace('{}', user_input)
+
+
+def split_query(query):
+    # 返回 (task, prefix, user_input, suffix); 不匹配任何模板时 task 为 None
+    for task, template in prompt_templates().items():
+        prefix, suffix = template.split('{}', 1)
+        if query.startswith(prefix) and query.endswith(suffix) and len(query) >= len(prefix) + len(suffix):
+            return task, prefix, query[len(prefix):len(query) - len(suffix)], suffix
+    return None, '', query, ''
+
+
+def task_of(query):
+    return split_query(query)[0]
+
+
+def split_system_prompt(query):
+    # 把固定的任务说明移到 system 中, prompt 只保留 "user input: ...\nresponse: " 部分;
+    # 两者以换行拼接后与原 query 完全一致
+    task, prefix, user_input, suffix = split_query(query)
+    if task is None:
+        return '', query
+    cut = prefix.rindex('\n')
+    return prefix[:cut], prefix[cut + 1:] + user_input + suffix
+
+
+# 单次调用同时输出类别与抽取结果的合并任务 (train_prompt.json 中的 "fused" 模板)
+FUSED_TASK = 'fused'
+
+# problem_1 的分类标签与对应的抽取任务; 'D.' (其他) 没有后续任务
+CLASS_TASKS = {'A': 'problem_2', 'B': 'problem_3', 'C': 'problem_4'}
+
+OTHER_CLASS = 'D'
+
+
+def fused_response(label, response=''):
+    # 例如 ('B', 'take_off; land.') -> 'B. take_off; land.'; 其他类只输出 'D.'
+    return f"{label}. {response.strip()}" if response.strip() else f"{label}."
+
+
+def split_fused_response(text):
+    # 返回 (类别, 抽取结果); 开头不是 "X." 形式的类别时类别为 None
+    text = text.strip()
+    label, dot, rest = text.partition('.')
+    if dot and len(label) == 1 and (label in CLASS_TASKS or label == OTHER_CLASS):
+        return label, rest.strip()
+    return None, text
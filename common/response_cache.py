@@ -0,0 +1,131 @@
+import hashlib
+import re
+import sqlite3
+import time
+import unicodedata
+from collections import OrderedDict
+
+from common.prompts import split_query
+
+# 两个数字之间的小数点 (例如 "1.5 m") 与其他标点不同, 去掉会改变含义, 归一化时保留
+PUNCTUATION_PATTERN = re.compile(r'(?<!\d)\.|\.(?!\d)|[^\w\s.]')
+
+WHITESPACE_PATTERN = re.compile(r'\s+')
+
+
+def normalize_input(text):
+    # NFKC 统一全角/半角, 忽略大小写、标点与多余空白: "Take off!" / "take off" / "ｔａｋｅ　ｏｆｆ。" 视为同一输入
+    text = unicodedata.normalize('NFKC', text).lower()
+    text = PUNCTUATION_PATTERN.sub(' ', text)
+    return WHITESPACE_PATTERN.sub(' ', text).strip()
+
+
+def cache_key(query, system=''):
+    # 键 = 模板 (prompt 中用户输入以外的部分与 system) 的摘要 + 归一化后的用户输入;
+    # 不匹配任何模板的 query (例如预热用的 "Hello") 返回 None, 不参与缓存
+    task, prefix, user_input, suffix = split_query(query)
+    if task is None:
+        return None
+    template = f"{system}\0{prefix}\0{suffix}"
+    digest = hashlib.sha1(template.encode('utf-8')).hexdigest()[:16]
+    return f"{digest}:{normalize_input(user_input)}"
+
+
+class ResponseCache:
+    # 推理侧的回答缓存: 内存中按 LRU 保留最多 max_entries 条, 超过 ttl_s 秒的条目视为过期。
+    # 指定 db_file 时同时写入 sqlite 作为第二层: 启动时按最近使用时间加载回内存, 内存未命中时再查一次磁盘。
+    # 键中包含模型名, 不同模型互不共享
+
+    def __init__(self, max_entries=4096, ttl_s=None, db_file=None):
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self.entries = OrderedDict()
+        self.metrics = {'hits': 0, 'misses': 0, 'bypassed': 0, 'expired': 0, 'evictions': 0, 'puts': 0}
+        self.conn = None
+        if db_file:
+            self.conn = sqlite3.connect(db_file)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    model_name TEXT NOT NULL,
+                    cache_key TEXT NOT NULL,
+                    response TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_used_at REAL NOT NULL,
+                    PRIMARY KEY (model_name, cache_key)
+                ) WITHOUT ROWID
+            """)
+            self.conn.commit()
+            self._load()
+
+    def _load(self):
+        if self.ttl_s is not None:
+            self.conn.execute("DELETE FROM responses WHERE created_at < ?", (time.time() - self.ttl_s,))
+            self.conn.commit()
+        rows = self.conn.execute(
+            "SELECT model_name, cache_key, response, created_at FROM responses ORDER BY last_used_at DESC LIMIT ?",
+            (self.max_entries,)).fetchall()
+        for model_name, key, response, created_at in reversed(rows):
+            self.entries[(model_name, key)] = (response, created_at)
+
+    def _remember(self, entry_key, response, created_at):
+        self.entries[entry_key] = (response, created_at)
+        self.entries.move_to_end(entry_key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.metrics['evictions'] += 1
+
+    def _expired(self, created_at):
+        return self.ttl_s is not None and time.time() - created_at > self.ttl_s
+
+    def get(self, model_name, query, system=''):
+        key = cache_key(query, system)
+        if key is None:
+            self.metrics['bypassed'] += 1
+            return None
+        entry_key = (model_name, key)
+        entry = self.entries.get(entry_key)
+        if entry is not None and self._expired(entry[1]):
+            del self.entries[entry_key]
+            self.metrics['expired'] += 1
+            entry = None
+        if entry is None and self.conn is not None:
+            row = self.conn.execute("SELECT response, created_at FROM responses WHERE model_name = ? AND cache_key = ?",
+                                    entry_key).fetchone()
+            if row is not None and not self._expired(row[1]):
+                entry = row
+                self._remember(entry_key, *row)
+        if entry is None:
+            self.metrics['misses'] += 1
+            return None
+        self.entries.move_to_end(entry_key)
+        self.metrics['hits'] += 1
+        if self.conn is not None:
+            self.conn.execute("UPDATE responses SET last_used_at = ? WHERE model_name = ? AND cache_key = ?",
+                              (time.time(), *entry_key))
+            self.conn.commit()
+        return entry[0]
+
+    def put(self, model_name, query, response, system=''):
+        key = cache_key(query, system)
+        if key is None:
+            return
+        entry_key = (model_name, key)
+        now = time.time()
+        self._remember(entry_key, response, now)
+        self.metrics['puts'] += 1
+        if self.conn is not None:
+            self.conn.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                              (*entry_key, response, now, now))
+            self.conn.commit()
+
+    def stats(self):
+        lookups = self.metrics['hits'] + self.metrics['misses']
+        return {**self.metrics, 'size': len(self.entries),
+                'hit_rate_percent': self.metrics['hits'] / lookups * 100 if lookups else 0.0}
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
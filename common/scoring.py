@@ -0,0 +1,231 @@
+import re
+import unicodedata
+from collections import Counter
+from functools import lru_cache
+
+from common.prompts import CLASS_TASKS, FUSED_TASK, OTHER_CLASS, task_of
+
+# 把回答解析为结构化结果后再比较, 对大小写、全角/半角、方括号、多余空白与等价单位 (1 m = 100 cm) 不敏感。
+# parse_response 返回元组, 无法解析时返回 None:
+#   problem_1: ('B',)
+#   problem_2: ('人', '牙刷')                                    按顺序的对象列表
+#   problem_3: (('move_up', 20.0, 'cm'), ('take_off', None, None), ('move_up', None, 'missing'))
+#              距离统一换算为 cm, 角度单位为 degrees; 'None.' 解析为 ()
+#   problem_4: ('pause_task',), 'None.' 解析为 ()
+#   fused:     ('B', <对应抽取任务的结果>...), 其他类为 ('D',)
+
+# 标签后需紧跟句点、右括号、冒号或结尾, 避免把 "a search task" 中的冠词当作标签
+LABEL_PATTERN = re.compile(r'(?<![a-z])([abcd])(?:[.):]|$)')
+
+FUSED_LABEL_PATTERN = re.compile(r'^([abcd])\.\s*')
+
+NONE_PATTERN = re.compile(r'^none\.?$')
+
+ITEM_SEPARATOR = re.compile(r'\s*[;；]\s*')
+
+COMMAND_SEPARATOR = re.compile(r'\s*[;；,，]\s*')
+
+# 对象两侧的方括号、引号与结尾标点 (例如云端模型照抄格式说明输出的 "[person]")
+OBJECT_STRIP = ' \t\n[]【】"\'“”‘’.。'
+
+PROGRAM_PATTERN = re.compile(r'(pause|start|continue|clear)_(?:(fly|search)_)?task')
+
+SIMPLE_COMMANDS = {'take_off': 'take_off', 'takeoff': 'take_off', 'take off': 'take_off', 'land': 'land'}
+
+MOVE_DIRECTIONS = {'forward': 'forward', 'back': 'back', 'backward': 'back', 'left': 'left', 'right': 'right',
+                   'up': 'up', 'down': 'down'}
+
+VALUE_COMMAND_PATTERN = re.compile(
+    r'^(move|turn)_([a-z]+)\s+(\d+(?:\.\d+)?)\s*([a-z°一-鿿]+)?$')
+
+MISSING_COMMAND_PATTERN = re.compile(r'^missing\s+(move|turn)_([a-z]+)$')
+
+# 单位别名 -> (标准单位, 换算到标准单位的系数)
+UNITS = {
+    'cm': ('cm', 1.0), 'centimeter': ('cm', 1.0), 'centimeters': ('cm', 1.0), '厘米': ('cm', 1.0),
+    'm': ('cm', 100.0), 'meter': ('cm', 100.0), 'meters': ('cm', 100.0), '米': ('cm', 100.0),
+    'in': ('cm', 2.54), 'inch': ('cm', 2.54), 'inches': ('cm', 2.54), '英寸': ('cm', 2.54),
+    'ft': ('cm', 30.48), 'foot': ('cm', 30.48), 'feet': ('cm', 30.48), '英尺': ('cm', 30.48),
+    'degrees': ('degrees', 1.0), 'degree': ('degrees', 1.0), 'deg': ('degrees', 1.0), '°': ('degrees', 1.0),
+    '度': ('degrees', 1.0),
+}
+
+# score_response 给出的错误类别, 按判断顺序排列
+ERROR_FIELDS = ['format', 'label', 'order', 'objects', 'count', 'command', 'value']
+
+
+def normalize_text(text):
+    return unicodedata.normalize('NFKC', text).strip().lower()
+
+
+def parse_label(text):
+    match = LABEL_PATTERN.search(text)
+    return (match.group(1).upper(),) if match else None
+
+
+def parse_objects(text):
+    text = text.strip().rstrip('.。').strip()
+    if not text:
+        return None
+    objects = tuple(obj.strip(OBJECT_STRIP) for obj in ITEM_SEPARATOR.split(text))
+    return objects if all(objects) else None
+
+
+def parse_command(segment):
+    if segment in SIMPLE_COMMANDS:
+        return SIMPLE_COMMANDS[segment], None, None
+    match = MISSING_COMMAND_PATTERN.match(segment)
+    if match:
+        kind, direction = match.groups()
+        return f"{kind}_{MOVE_DIRECTIONS.get(direction, direction)}", None, 'missing'
+    match = VALUE_COMMAND_PATTERN.match(segment)
+    if match:
+        kind, direction, value, unit = match.groups()
+        unit, factor = UNITS.get(unit or ('degrees' if kind == 'turn' else ''), (unit, 1.0))
+        return f"{kind}_{MOVE_DIRECTIONS.get(direction, direction)}", round(float(value) * factor, 3), unit
+    # 无法识别的片段原样保留, 比较时一定不匹配
+    return 'invalid', segment, None
+
+
+def parse_commands(text):
+    text = text.strip().rstrip('.。').strip()
+    if NONE_PATTERN.match(text):
+        return ()
+    if not text:
+        return None
+    commands = tuple(parse_command(segment) for segment in COMMAND_SEPARATOR.split(text))
+    return None if all(command[0] == 'invalid' for command in commands) else commands
+
+
+def parse_program(text):
+    match = PROGRAM_PATTERN.search(text)
+    if match:
+        return (match.group(0),)
+    return () if NONE_PATTERN.match(text.strip().rstrip('。')) else None
+
+
+TASK_PARSERS = {
+    'problem_1': parse_label,
+    'problem_2': parse_objects,
+    'problem_3': parse_commands,
+    'problem_4': parse_program,
+}
+
+
+@lru_cache(maxsize=1 << 16)
+def parse_response(task, text):
+    # 同一条标准答案会被每个模型的回答重复解析, 缓存后大规模评分时几乎只剩模型回答的解析开销
+    text = normalize_text(text or '')
+    if task == FUSED_TASK:
+        match = FUSED_LABEL_PATTERN.match(text)
+        if match is None:
+            return None
+        label, rest = match.group(1).upper(), text[match.end():]
+        if label == OTHER_CLASS:
+            return (label,)
+        items = TASK_PARSERS[CLASS_TASKS[label]](rest)
+        return None if items is None else (label,) + items
+    parser = TASK_PARSERS.get(task)
+    return parser(text) if parser is not None else None
+
+
+@lru_cache(maxsize=1 << 16)
+def guess_task(expected):
+    # 日志中只有标准答案、没有 query 时按标准答案的格式推断任务类型;
+    # 'None.' 在 problem_3 与 problem_4 中解析结果相同, 推断为哪一个不影响评分
+    text = normalize_text(expected)
+    if re.fullmatch(r'[abcd]\.', text):
+        return 'problem_1'
+    if PROGRAM_PATTERN.fullmatch(text.rstrip('.')) or NONE_PATTERN.match(text):
+        return 'problem_4'
+    commands = parse_commands(text)
+    if commands and all(command[0] != 'invalid' for command in commands):
+        return 'problem_3'
+    return 'problem_2'
+
+
+def response_task(query, expected):
+    task = task_of(query) if query else None
+    return task or guess_task(expected)
+
+
+def classify_error(task, expected_items, actual_items):
+    if actual_items is None:
+        return 'format'
+    if task in ('problem_1', FUSED_TASK) and expected_items[:1] != actual_items[:1]:
+        return 'label'
+    if task == FUSED_TASK:
+        task = CLASS_TASKS.get(expected_items[0], task)
+        expected_items, actual_items = expected_items[1:], actual_items[1:]
+    if Counter(expected_items) == Counter(actual_items):
+        return 'order'
+    if task == 'problem_2':
+        return 'objects'
+    if len(expected_items) != len(actual_items):
+        return 'count'
+    if task == 'problem_3' and [c[0] for c in expected_items] == [c[0] for c in actual_items]:
+        return 'value'
+    return 'command'
+
+
+def score_response(task, expected, actual):
+    # 返回 exact (去除首尾空白后字符串相同)、match (结构化结果相同)、error (不匹配时的错误类别),
+    # 以及按多重集合计算的 tp/fp/fn (对象、指令或标签的个数), 用于汇总 precision/recall
+    exact = (actual or '').strip() == (expected or '').strip()
+    expected_items = parse_response(task, expected)
+    if expected_items is None:
+        return {'exact': exact, 'match': exact, 'error': None if exact else 'format', 'tp': int(exact),
+                'fp': int(not exact), 'fn': int(not exact)}
+    actual_items = parse_response(task, actual)
+    if actual_items == expected_items:
+        return {'exact': exact, 'match': True, 'error': None, 'tp': len(expected_items), 'fp': 0, 'fn': 0}
+    expected_counts, actual_counts = Counter(expected_items), Counter(actual_items or ())
+    tp = sum((expected_counts & actual_counts).values())
+    return {'exact': exact, 'match': False, 'error': classify_error(task, expected_items, actual_items),
+            'tp': tp, 'fp': sum(actual_counts.values()) - tp, 'fn': sum(expected_counts.values()) - tp}
+
+
+class ScoreSummary:
+    # 可合并的评分汇总: 只保存计数, 多个进程/文件的结果直接相加
+
+    def __init__(self):
+        self.count = 0
+        self.exact = 0
+        self.match = 0
+        self.tp = 0
+        self.fp = 0
+        self.fn = 0
+        self.errors = Counter()
+
+    def add(self, score):
+        self.count += 1
+        self.exact += score['exact']
+        self.match += score['match']
+        self.tp += score['tp']
+        self.fp += score['fp']
+        self.fn += score['fn']
+        if score['error']:
+            self.errors[score['error']] += 1
+
+    def merge(self, other):
+        self.count += other.count
+        self.exact += other.exact
+        self.match += other.match
+        self.tp += other.tp
+        self.fp += other.fp
+        self.fn += other.fn
+        self.errors.update(other.errors)
+        return self
+
+    def summary(self):
+        precision = self.tp / (self.tp + self.fp) if self.tp + self.fp else 0.0
+        recall = self.tp / (self.tp + self.fn) if self.tp + self.fn else 0.0
+        return {
+            'count': self.count,
+            'exact_match_percent': self.exact / self.count * 100 if self.count else 0.0,
+            'structured_match_percent': self.match / self.count * 100 if self.count else 0.0,
+            'item_precision_percent': precision * 100,
+            'item_recall_percent': recall * 100,
+            'item_f1_percent': 2 * precision * recall / (precision + recall) * 100 if precision + recall else 0.0,
+            'errors': {field: self.errors[field] for field in ERROR_FIELDS if self.errors[field]},
+        }
@@ -0,0 +1,165 @@
+import json
+import mmap
+import os
+import struct
+import numpy as np
+
+from common.prompts import FUSED_TASK, TASK_TYPES, prompt_templates, split_query
+
+# 文件布局 (小端):
+#   MAGIC | uint32 头部长度 | JSON 头部 (模板、条数、源文件信息) | 补齐到 8 字节
+#   uint8  task[n]              每条记录的任务类型 (STORE_TASK_TYPES 下标, RAW_TASK 表示未匹配任何模板)
+#   uint64 text_offsets[n + 1]  user input (未匹配模板时为完整 query) 在数据区中的起止位置
+#   uint64 response_offsets[n + 1]
+#   数据区: 所有字符串的 UTF-8 字节依次拼接
+# query 由头部中保存的模板与 user input 还原, 与原 jsonl 中的 query 逐字节一致
+MAGIC = b'LMVS'
+
+VERSION = 2
+
+STORE_SUFFIX = '.lmvs'
+
+RAW_TASK = 255
+
+# 存储的任务类型: 4 类任务加上合并任务 (fused) 的模板; 版本 1 只有 TASK_TYPES
+STORE_TASK_TYPES = TASK_TYPES + [FUSED_TASK]
+
+
+def _align(offset, alignment=8):
+    return (offset + alignment - 1) // alignment * alignment
+
+
+def build_val_store(jsonl_file, store_file=None):
+    store_file = store_file or os.path.splitext(jsonl_file)[0] + STORE_SUFFIX
+    templates = prompt_templates()
+    tasks, texts, responses = [], [], []
+    with open(jsonl_file, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            task, _, user_input, _ = split_query(item['query'])
+            if task in STORE_TASK_TYPES and templates[task].replace('{}', user_input) == item['query']:
+                tasks.append(STORE_TASK_TYPES.index(task))
+                texts.append(user_input.encode('utf-8'))
+            else:
+                tasks.append(RAW_TASK)
+                texts.append(item['query'].encode('utf-8'))
+            responses.append(item['response'].encode('utf-8'))
+
+    text_offsets = np.zeros(len(texts) + 1, dtype='<u8')
+    text_offsets[1:] = np.cumsum([len(t) for t in texts])
+    response_offsets = np.full(len(responses) + 1, text_offsets[-1], dtype='<u8')
+    response_offsets[1:] += np.cumsum([len(r) for r in responses], dtype='<u8')
+
+    source_stat = os.stat(jsonl_file)
+    header = json.dumps({
+        'version': VERSION,
+        'count': len(tasks),
+        'task_types': STORE_TASK_TYPES,
+        'templates': [templates[task] for task in STORE_TASK_TYPES],
+        'source_size': source_stat.st_size,
+        'source_mtime_ns': source_stat.st_mtime_ns,
+    }, ensure_ascii=False).encode('utf-8')
+
+    tmp_file = store_file + '.tmp'
+    with open(tmp_file, 'wb') as f:
+        f.write(MAGIC + struct.pack('<I', len(header)) + header)
+        f.write(b'\0' * (_align(f.tell()) - f.tell()))
+        f.write(np.asarray(tasks, dtype=np.uint8).tobytes())
+        f.write(b'\0' * (_align(f.tell()) - f.tell()))
+        f.write(text_offsets.tobytes())
+        f.write(response_offsets.tobytes())
+        for chunk in texts + responses:
+            f.write(chunk)
+    os.replace(tmp_file, store_file)
+    return store_file
+
+
+class ValStore:
+    # 只读内存映射的验证集: 打开时只解析头部, 记录按需解码; 多个进程打开同一文件时共享页缓存。
+    # 支持 len()、下标/切片访问与迭代, 每条记录以 {'query', 'response'} 字典返回, 可直接替代 load_dataset 的列表
+
+    def __init__(self, store_file):
+        self.store_file = store_file
+        with open(store_file, 'rb') as f:
+            self.buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.buffer[:4] != MAGIC:
+            raise ValueError(f"'{store_file}' 不是验证集存储文件")
+        header_len = struct.unpack_from('<I', self.buffer, 4)[0]
+        self.header = json.loads(self.buffer[8:8 + header_len].decode('utf-8'))
+        n = self.header['count']
+        offset = _align(8 + header_len)
+        self.tasks = np.frombuffer(self.buffer, dtype=np.uint8, count=n, offset=offset)
+        offset = _align(offset + n)
+        self.text_offsets = np.frombuffer(self.buffer, dtype='<u8', count=n + 1, offset=offset)
+        offset += (n + 1) * 8
+        self.response_offsets = np.frombuffer(self.buffer, dtype='<u8', count=n + 1, offset=offset)
+        self.data_offset = offset + (n + 1) * 8
+        self.templates = self.header['templates']
+
+    def __reduce__(self):
+        # 传给工作进程时只传路径, 由子进程重新映射同一文件
+        return ValStore, (self.store_file,)
+
+    def __len__(self):
+        return self.header['count']
+
+    def _string(self, offsets, i):
+        start, end = self.data_offset + int(offsets[i]), self.data_offset + int(offsets[i + 1])
+        return self.buffer[start:end].decode('utf-8')
+
+    def task(self, i):
+        code = self.tasks[i]
+        return None if code == RAW_TASK else self.header['task_types'][code]
+
+    def user_input(self, i):
+        return self._string(self.text_offsets, i)
+
+    def query(self, i):
+        code = self.tasks[i]
+        text = self._string(self.text_offsets, i)
+        return text if code == RAW_TASK else self.templates[code].replace('{}', text)
+
+    def response(self, i):
+        return self._string(self.response_offsets, i)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return {'query': self.query(i), 'response': self.response(i)}
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def indices_of(self, task):
+        return np.flatnonzero(self.tasks == self.header['task_types'].index(task))
+
+    def is_stale(self, jsonl_file):
+        source_stat = os.stat(jsonl_file)
+        return (self.header.get('version') != VERSION or source_stat.st_size != self.header['source_size'] or
+                source_stat.st_mtime_ns != self.header['source_mtime_ns'])
+
+    def close(self):
+        # 先释放指向映射区的 numpy 视图, 否则 mmap 无法关闭
+        self.tasks = self.text_offsets = self.response_offsets = None
+        self.buffer.close()
+
+
+def open_val_store(jsonl_file, store_file=None):
+    # 首次使用或 jsonl 有改动时自动 (重新) 生成存储文件
+    store_file = store_file or os.path.splitext(jsonl_file)[0] + STORE_SUFFIX
+    if os.path.exists(store_file):
+        try:
+            store = ValStore(store_file)
+            if not store.is_stale(jsonl_file):
+                return store
+            store.close()
+        except ValueError:
+            pass
+    return ValStore(build_val_store(jsonl_file, store_file))
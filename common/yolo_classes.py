@@ -0,0 +1,35 @@
+from common.scoring import normalize_text
+
+# 检测模型 (model/yolo/yolo11n-lite_v3.pt, 数据集 "new_yolo_9") 的类别, 下标即 YOLO 的类别编号
+YOLO_CLASS_NAMES = ['biscuit', 'bread', 'cake', 'cola', 'coldrex', 'fanta', 'iodophor', 'painkillers', 'sprite']
+
+YOLO_CLASS_IDS = {name: i for i, name in enumerate(YOLO_CLASS_NAMES)}
+
+# problem_2 抽取出的对象名 -> YOLO 类别名; 中文名取自 find_object_zh_new_yolo_9.jsonl。
+# 只做整词匹配, 例如 "烤面包机" (toaster) 不会匹配到 bread
+OBJECT_ALIASES = {
+    '饼干': 'biscuit', 'biscuits': 'biscuit', 'cookie': 'biscuit', 'cookies': 'biscuit',
+    '面包': 'bread',
+    '蛋糕': 'cake', 'cakes': 'cake',
+    '可乐': 'cola', 'coke': 'cola',
+    '感冒药': 'coldrex',
+    '芬达': 'fanta',
+    '碘伏': 'iodophor',
+    '止疼药': 'painkillers', '止痛药': 'painkillers', 'painkiller': 'painkillers',
+    '雪碧': 'sprite',
+}
+
+
+def yolo_class_filter(objects):
+    # 返回 (YOLO 的 classes 参数, 检测模型不认识的对象); 类别按对象在指令中出现的顺序排列并去重
+    class_ids, unknown = [], []
+    for obj in objects or ():
+        text = normalize_text(obj)
+        if text.startswith('the '):
+            text = text[4:]
+        class_id = YOLO_CLASS_IDS.get(OBJECT_ALIASES.get(text, text))
+        if class_id is None:
+            unknown.append(obj)
+        elif class_id not in class_ids:
+            class_ids.append(class_id)
+    return class_ids, unknown
@@ -0,0 +1,219 @@
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from dedup import NearDuplicateIndex, dedup_splits
+from merge_data import load_templates, read_jsonl, reservoir_sample, source_rng
+
+RECIPE_FILE = 'recipe.json'
+
+WORKERS = os.cpu_count() or 1
+
+
+def format_field(item, field, suffix=''):
+    return f"{item[field]}{suffix}"
+
+
+def format_constant(item, value):
+    return value
+
+
+def format_join_lines(item, field, separator='; ', suffix='.'):
+    return separator.join(item[field].split('\n')) + suffix
+
+
+# recipe 中 "formatter" 可用的回答格式; 新任务只需在此注册格式函数并在 recipe 中引用
+FORMATTERS = {
+    'field': format_field,
+    'constant': format_constant,
+    'join_lines': format_join_lines,
+}
+
+
+def load_recipe(recipe_file=RECIPE_FILE):
+    with open(recipe_file, 'r', encoding='utf-8') as f:
+        recipe = json.load(f)
+    for task, spec in recipe['tasks'].items():
+        for rule in spec.get('sources', []) + spec.get('borrow', []):
+            if rule['formatter'] not in FORMATTERS:
+                raise ValueError(f"{task}: 未知的 formatter '{rule['formatter']}'")
+        for rule in spec.get('borrow', []):
+            if rule['from'] not in recipe['tasks']:
+                raise ValueError(f"{task}: borrow 引用了不存在的任务 '{rule['from']}'")
+    return recipe
+
+
+def keep_item(item, source, skip_words):
+    text = item.get(source['text_field'])
+    if not isinstance(text, str) or any(word in text for word in skip_words):
+        return False
+    if 'languages' in source and item.get('language') not in source['languages']:
+        return False
+    return source.get('min_chars', 0) <= len(text) <= source.get('max_chars', len(text))
+
+
+def source_key(source, item):
+    # 去重比较的 (用户输入, 回答): 只有输入相近且回答相同的样本才算重复
+    return item[source['text_field']], FORMATTERS[source['formatter']](item, **source.get('args', {}))
+
+
+def sample_source(job):
+    # 在工作进程中执行: 流式读取 -> 过滤 -> (来源内去重) -> 蓄水池抽样, 只把抽中的样本返回给主进程
+    source, skip_words, dedup, seed = job
+    counts = {'read': 0, 'kept': 0, 'duplicates': 0}
+    if not os.path.exists(source['file']):
+        return source['file'], counts, None
+    index = NearDuplicateIndex(dedup['threshold']) if dedup else None
+
+    def kept_items():
+        for item in read_jsonl(source['file']):
+            counts['read'] += 1
+            if not keep_item(item, source, skip_words):
+                continue
+            if index is not None and index.add(*source_key(source, item)) is not None:
+                counts['duplicates'] += 1
+                continue
+            counts['kept'] += 1
+            yield item
+
+    sample = reservoir_sample(kept_items(), source['quota'], source_rng(seed, source['file']))
+    return source['file'], counts, sample
+
+
+def collect_samples(recipe, workers=WORKERS):
+    jobs = [(source, recipe['skip_words'], recipe.get('dedup'), recipe['seed'])
+            for spec in recipe['tasks'].values() for source in spec.get('sources', [])]
+    if workers <= 1:
+        results = [sample_source(job) for job in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(sample_source, jobs))
+    return {file_name: (counts, sample) for file_name, counts, sample in results}
+
+
+def group_samples(recipe, sampled):
+    # 每类任务的样本为 (来源配置, 原始记录) 列表, 合并后按任务再洗牌一次
+    samples = {}
+    for task, spec in recipe['tasks'].items():
+        entries = []
+        for source in spec.get('sources', []):
+            counts, sample = sampled[source['file']]
+            if sample is None:
+                print(f"警告: 数据来源 '{source['file']}' 不存在, 已跳过。")
+                continue
+            duplicate_rate = counts['duplicates'] / max(counts['read'], 1) * 100
+            print(f"  - [{task}] {source['file']}: 读取 {counts['read']} 条, 近似重复 {counts['duplicates']} 条 "
+                  f"({duplicate_rate:.2f}%), 保留 {counts['kept']} 条, 抽取 {len(sample)} 条")
+            entries.extend((source, item) for item in sample)
+        source_rng(recipe['seed'], task).shuffle(entries)
+        samples[task] = entries
+    return samples
+
+
+def task_records(recipe, samples):
+    # 按 recipe 顺序逐类产出 (任务, 用户输入, 回答); borrow 规则从其他任务的样本中取前 count 条,
+    # 套用本任务的模板与回答格式 (例如分类任务借用各类指令并标注类别)
+    for task, spec in recipe['tasks'].items():
+        for source, item in samples[task]:
+            yield task, item[source['text_field']], FORMATTERS[source['formatter']](item, **source.get('args', {}))
+        for rule in spec.get('borrow', []):
+            for source, item in samples[rule['from']][:rule['count']]:
+                yield task, item[source['text_field']], FORMATTERS[rule['formatter']](item, **rule.get('args', {}))
+
+
+def split_records(recipe, records, templates):
+    train, val = [], []
+    position = {}
+    for record in records:
+        task = record[0]
+        i = position.get(task, 0)
+        position[task] = i + 1
+        (val if i % recipe['val_every'] == 0 else train).append(record)
+
+    dedup_stats = None
+    if recipe.get('dedup'):
+        train, val, dedup_stats = dedup_splits(train, val, recipe['dedup']['threshold'])
+
+    rng = source_rng(recipe['seed'], 'split')
+    rng.shuffle(train)
+    rng.shuffle(val)
+    train, val = ([{'query': templates[task].replace('{}', text), 'response': response}
+                   for task, text, response in split] for split in (train, val))
+    return train, val, dedup_stats
+
+
+def write_shard(job):
+    path, records = job
+    tmp_path = path + '.tmp'
+    digest = hashlib.sha256()
+    with open(tmp_path, 'wb') as f:
+        for record in records:
+            line = (json.dumps(record, ensure_ascii=False) + '\n').encode('utf-8')
+            digest.update(line)
+            f.write(line)
+    os.replace(tmp_path, path)
+    return {'file': os.path.basename(path), 'records': len(records), 'sha256': digest.hexdigest()}
+
+
+def write_shards(output_dir, split, records, shard_size, executor):
+    jobs = [(os.path.join(output_dir, f"{split}-{i // shard_size:05d}.jsonl"), records[i:i + shard_size])
+            for i in range(0, len(records), shard_size)]
+    if executor is None:
+        return [write_shard(job) for job in jobs]
+    return list(executor.map(write_shard, jobs))
+
+
+def build(recipe_file=RECIPE_FILE, workers=WORKERS):
+    with open(recipe_file, 'rb') as f:
+        recipe_sha256 = hashlib.sha256(f.read()).hexdigest()
+    recipe = load_recipe(recipe_file)
+    templates = load_templates(recipe['prompt_file'])
+    output_dir = recipe['output_dir']
+    os.makedirs(output_dir, exist_ok=True)
+
+    print(f"[1/3] 并行抽样 {sum(len(s.get('sources', [])) for s in recipe['tasks'].values())} 个数据来源...")
+    sampled = collect_samples(recipe, workers)
+    samples = group_samples(recipe, sampled)
+
+    print("[2/3] 渲染模板并划分训练/验证集...")
+    train, val, dedup_stats = split_records(recipe, task_records(recipe, samples), templates)
+    if dedup_stats:
+        print(f"  - 去重: 训练集内 {dedup_stats['train_duplicates']} 条, 验证集内 {dedup_stats['val_duplicates']} 条, "
+              f"验证集与训练集重复 (已从验证集删除) {dedup_stats['val_leaked']} 条")
+
+    print(f"[3/3] 写出分片到 '{output_dir}'...")
+    shard_size = recipe['shard_size']
+    if workers <= 1:
+        shards = {'train': write_shards(output_dir, 'train', train, shard_size, None),
+                  'val': write_shards(output_dir, 'val', val, shard_size, None)}
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            shards = {'train': write_shards(output_dir, 'train', train, shard_size, executor),
+                      'val': write_shards(output_dir, 'val', val, shard_size, executor)}
+
+    # 删除上一次构建留下、本次未重写的旧分片, 保证目录内容与清单一致
+    written = {shard['file'] for split_shards in shards.values() for shard in split_shards}
+    for file_name in os.listdir(output_dir):
+        if file_name.startswith(('train-', 'val-')) and file_name.endswith('.jsonl') and file_name not in written:
+            os.remove(os.path.join(output_dir, file_name))
+
+    manifest = {
+        'recipe_file': os.path.basename(recipe_file),
+        'recipe_sha256': recipe_sha256,
+        'seed': recipe['seed'],
+        'sources': {file_name: {**counts, 'sampled': len(sample) if sample is not None else 0}
+                    for file_name, (counts, sample) in sampled.items()},
+        'tasks': {task: len(entries) for task, entries in samples.items()},
+        'dedup': {**recipe['dedup'], **dedup_stats} if dedup_stats else None,
+        'splits': {split: {'records': sum(s['records'] for s in split_shards), 'shards': split_shards}
+                   for split, split_shards in shards.items()},
+    }
+    with open(os.path.join(output_dir, 'manifest.json'), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    print(f"训练集 {len(train)} 条 ({len(shards['train'])} 个分片), 验证集 {len(val)} 条 ({len(shards['val'])} 个分片)")
+    return manifest
+
+
+if __name__ == "__main__":
+    build()
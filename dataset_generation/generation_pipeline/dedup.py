@@ -0,0 +1,154 @@
+import os
+import unicodedata
+import zlib
+import numpy as np
+
+from merge_data import read_jsonl
+
+# 估计 Jaccard 相似度不低于该值的两条文本视为近似重复
+JACCARD_THRESHOLD = 0.8
+
+# MinHash 签名长度 = LSH_BANDS * LSH_ROWS; 候选阈值约为 (1 / LSH_BANDS) ** (1 / LSH_ROWS) ≈ 0.5,
+# 低于 JACCARD_THRESHOLD, 候选对再用签名估计的相似度复核
+NUM_PERM = 64
+
+LSH_BANDS = 16
+
+LSH_ROWS = 4
+
+# 中文按字切分信息量高, 用 2-gram; 英文等字母文字用 4-gram
+NGRAM_SIZE_CJK = 2
+
+NGRAM_SIZE_OTHER = 4
+
+MINHASH_SEED = 0
+
+RECIPE_FILE = 'recipe.json'
+
+
+def normalize(text):
+    # NFKC 统一全角/半角, 只保留字母数字 (含汉字), 忽略大小写、空白与标点差异
+    return ''.join(ch for ch in unicodedata.normalize('NFKC', text).lower() if ch.isalnum())
+
+
+def is_cjk(ch):
+    return '一' <= ch <= '鿿' or '㐀' <= ch <= '䶿'
+
+
+def shingles(text):
+    text = normalize(text)
+    n = NGRAM_SIZE_CJK if any(is_cjk(ch) for ch in text) else NGRAM_SIZE_OTHER
+    if len(text) <= n:
+        grams = {text} if text else set()
+    else:
+        grams = {text[i:i + n] for i in range(len(text) - n + 1)}
+    # crc32 与 Python 的 hash() 不同, 不受 PYTHONHASHSEED 影响, 多进程与多次运行结果一致
+    return np.fromiter((zlib.crc32(g.encode('utf-8')) for g in grams), dtype=np.uint64, count=len(grams))
+
+
+class MinHasher:
+    def __init__(self, num_perm=NUM_PERM, seed=MINHASH_SEED):
+        rng = np.random.default_rng(seed)
+        # multiply-shift 哈希族: (a * x + b) mod 2^64 取高 32 位, a 为奇数
+        self.a = rng.integers(1, 2 ** 63, size=num_perm, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+        self.b = rng.integers(0, 2 ** 63, size=num_perm, dtype=np.uint64)
+
+    def signature(self, hashes):
+        if hashes.size == 0:
+            return None
+        with np.errstate(over='ignore'):
+            values = (self.a[:, None] * hashes[None, :] + self.b[:, None]) >> np.uint64(32)
+        return values.min(axis=1).astype(np.uint32)
+
+
+class NearDuplicateIndex:
+    # MinHash + LSH 分桶: 每条文本只与同一桶内的已收录文本比较, 整体近似线性;
+    # 只保存已收录文本的签名 (NUM_PERM * 4 字节) 与桶索引, 不保存原文。
+    # group 用于限定比较范围 (例如相同的回答): 输入相近但回答不同的样本是有价值的对比样本, 不视为重复
+
+    def __init__(self, threshold=JACCARD_THRESHOLD, hasher=None):
+        self.threshold = threshold
+        self.hasher = hasher or MinHasher()
+        self.signatures = []
+        self.buckets = [{} for _ in range(LSH_BANDS)]
+
+    def band_keys(self, signature, group):
+        return [(group, signature[i * LSH_ROWS:(i + 1) * LSH_ROWS].tobytes()) for i in range(LSH_BANDS)]
+
+    def find(self, text, group=None, signature=None):
+        # 返回与 text 近似重复的已收录文本编号, 没有则返回 None
+        if signature is None:
+            signature = self.hasher.signature(shingles(text))
+        if signature is None:
+            return None
+        candidates = set()
+        for bucket, key in zip(self.buckets, self.band_keys(signature, group)):
+            candidates.update(bucket.get(key, ()))
+        for candidate in sorted(candidates):
+            if np.mean(self.signatures[candidate] == signature) >= self.threshold:
+                return candidate
+        return None
+
+    def add(self, text, group=None):
+        # 不重复时收录并返回 None, 重复时返回已收录文本的编号 (不收录)
+        signature = self.hasher.signature(shingles(text))
+        if signature is None:
+            return None
+        duplicate_of = self.find(text, group, signature)
+        if duplicate_of is not None:
+            return duplicate_of
+        item_id = len(self.signatures)
+        self.signatures.append(signature)
+        for bucket, key in zip(self.buckets, self.band_keys(signature, group)):
+            bucket.setdefault(key, []).append(item_id)
+        return None
+
+
+def dedup_splits(train, val, threshold=JACCARD_THRESHOLD):
+    # train/val 为 (任务, 用户输入, 回答) 列表。同一任务、同一回答内: 先去除训练集内部的近似重复,
+    # 再去除验证集内部以及与训练集近似重复的样本 (泄漏的样本从验证集中删除, 训练集保持不变)
+    hasher = MinHasher()
+    train_index, val_index = {}, {}
+    stats = {'train_duplicates': 0, 'val_duplicates': 0, 'val_leaked': 0}
+    kept_train = []
+    for task, text, response in train:
+        if train_index.setdefault(task, NearDuplicateIndex(threshold, hasher)).add(text, response) is None:
+            kept_train.append((task, text, response))
+        else:
+            stats['train_duplicates'] += 1
+    kept_val = []
+    for task, text, response in val:
+        if task in train_index and train_index[task].find(text, response) is not None:
+            stats['val_leaked'] += 1
+        elif val_index.setdefault(task, NearDuplicateIndex(threshold, hasher)).add(text, response) is None:
+            kept_val.append((task, text, response))
+        else:
+            stats['val_duplicates'] += 1
+    return kept_train, kept_val, stats
+
+
+def main():
+    # 与 build_dataset.py 的来源内去重口径一致: 同一来源内输入相近且回答相同才算重复
+    from build_dataset import load_recipe, source_key
+
+    recipe = load_recipe(RECIPE_FILE)
+    threshold = recipe.get('dedup', {}).get('threshold', JACCARD_THRESHOLD)
+    print(f"--- 数据来源近似重复率 (估计 Jaccard >= {threshold}) ---")
+    print(f"{'数据来源':<40} | {'总数':<8} | {'重复':<8} | {'重复率':<8}")
+    print("-" * 75)
+    for spec in recipe['tasks'].values():
+        for source in spec.get('sources', []):
+            if not os.path.exists(source['file']):
+                print(f"{source['file']:<40} | {'N/A':<8} | {'N/A':<8} | 文件不存在")
+                continue
+            index = NearDuplicateIndex(threshold)
+            total = duplicates = 0
+            for item in read_jsonl(source['file']):
+                total += 1
+                if index.add(*source_key(source, item)) is not None:
+                    duplicates += 1
+            print(f"{source['file']:<40} | {total:<8} | {duplicates:<8} | {duplicates / max(total, 1) * 100:.2f}%")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,134 +1,189 @@
 import json
+import os
 import random
 
-random.seed(0)
-
+SEED = 0
 
 skip_words = ['"', '\n', "'", '*', ':', '：']
 
+PROMPT_FILE = 'train_prompt.json'
 
-with open('data0.jsonl', 'r', encoding='utf-8') as file:
-    t_data = json.loads('[' + ','.join(file.readlines()) + ']')
-
-    filtered_data = [i for i in t_data if all(word not in i for word in skip_words)]
-    random.shuffle(filtered_data)
-    o_problem_1_dataset: list = filtered_data[:2000]
-random.shuffle(o_problem_1_dataset)
-
-
-with open('find_object_en_new_yolo_9.jsonl', 'r', encoding='utf-8') as file:
-    t_data = json.loads('[' + ','.join(file.readlines()) + ']')
-
-    filtered_data = [i for i in t_data if all(word not in i for word in skip_words)]
-    random.shuffle(filtered_data)
-    o_problem_2_dataset: list = filtered_data[:5000]
-with open('find_object_zh_new_yolo_9.jsonl', 'r', encoding='utf-8') as file:
-    t_data = json.loads('[' + ','.join(file.readlines()) + ']')
-
-    filtered_data = [i for i in t_data if all(word not in i for word in skip_words)]
-    random.shuffle(filtered_data)
-    o_problem_2_dataset.extend(filtered_data[:5000])
-random.shuffle(o_problem_2_dataset)
-
-
-with open('data_B.jsonl', 'r', encoding='utf-8') as file:
-    t_data = json.loads('[' + ','.join(file.readlines()) + ']')
-
-    filtered_data = [i for i in t_data if all(word not in i for word in skip_words)]
-    random.shuffle(filtered_data)
-    o_problem_3_dataset: list = filtered_data[:10000]
-random.shuffle(o_problem_3_dataset)
-
-
-with open('fly_control.jsonl', 'r', encoding='utf-8') as file:
-    t_data = json.loads('[' + ','.join(file.readlines()) + ']')
-
-    filtered_data = [i for i in t_data if all(word not in i for word in skip_words)]
-    random.shuffle(filtered_data)
-    o_problem_4_dataset: list = filtered_data[:5000]
-with open('fly_control_en.jsonl', 'r', encoding='utf-8') as file:
-    t_data = json.loads('[' + ','.join(file.readlines()) + ']')
+TRAIN_OUTPUT_FILE = '../train_dataset_swift_4_type_new_yolo_9.jsonl'
 
-    filtered_data = [i for i in t_data if all(word not in i for word in skip_words)]
-    random.shuffle(filtered_data)
-    o_problem_4_dataset.extend(filtered_data[:5000])
-random.shuffle(o_problem_4_dataset)
+VAL_OUTPUT_FILE = '../val_dataset_swift_4_type_new_yolo_9.jsonl'
 
+# 为 True 时额外生成合并任务 (train_prompt.json 中的 "fused" 模板) 的数据集: 一次生成同时输出类别与抽取结果,
+# 例如 "B. take_off; land."。样本与上面的训练/验证划分一一对应, 不会把验证集样本混入合并任务的训练集
+BUILD_FUSED = True
 
-with open('train_prompt.json', 'r', encoding='utf-8') as file:
-    train_prompt = json.loads(''.join(file.readlines()))
+FUSED_TASK = 'fused'
 
+FUSED_TRAIN_OUTPUT_FILE = '../train_dataset_swift_fused_new_yolo_9.jsonl'
 
-problem_1_dataset = []
-problem_2_dataset = []
-problem_3_dataset = []
-problem_4_dataset = []
+FUSED_VAL_OUTPUT_FILE = '../val_dataset_swift_fused_new_yolo_9.jsonl'
 
+# 每类任务的数据来源: (文件名, 用户输入字段, 抽样数量)
+SOURCES = {
+    'problem_1': [('data0.jsonl', 'word', 2000)],
+    'problem_2': [('find_object_en_new_yolo_9.jsonl', 'words', 5000),
+                  ('find_object_zh_new_yolo_9.jsonl', 'words', 5000)],
+    'problem_3': [('data_B.jsonl', 'user input', 10000)],
+    'problem_4': [('fly_control.jsonl', 'words', 5000),
+                  ('fly_control_en.jsonl', 'words', 5000)],
+}
 
-for i in o_problem_1_dataset:
-    t_query = train_prompt['problem_1']['prompt'][0].replace('{}', i['word'])
-    t_response = f"{i['type']}."
-    problem_1_dataset.append({'query': t_query, 'response': t_response})
+# 分类任务 (problem_1) 额外从其余三类的抽样结果中各取前 n 条, 并标注对应的类别
+CLASSIFICATION_SOURCES = [('problem_2', 'A', 2000), ('problem_3', 'B', 2000), ('problem_4', 'C', 2000)]
 
-for i in o_problem_2_dataset[:2000]:
-    t_query = train_prompt['problem_1']['prompt'][0].replace('{}', i['words'])
-    t_response = f"A."
-    problem_1_dataset.append({'query': t_query, 'response': t_response})
+# 合并任务中 "其他" 类的标签, 只输出类别
+OTHER_CLASS = 'D'
 
-for i in o_problem_3_dataset[:2000]:
-    t_query = train_prompt['problem_1']['prompt'][0].replace('{}', i['user input'])
-    t_response = f"B."
-    problem_1_dataset.append({'query': t_query, 'response': t_response})
+# 每类任务内按顺序每 VAL_EVERY 条取 1 条作为验证集
+VAL_EVERY = 5
 
-for i in o_problem_4_dataset[:2000]:
-    t_query = train_prompt['problem_1']['prompt'][0].replace('{}', i['words'])
-    t_response = f"C."
-    problem_1_dataset.append({'query': t_query, 'response': t_response})
 
+def read_jsonl(file_path):
+    with open(file_path, 'r', encoding='utf-8') as file:
+        for line in file:
+            if line.strip():
+                yield json.loads(line)
 
-for i in o_problem_2_dataset:
-    t_query = train_prompt['problem_2']['prompt'][0].replace('{}', i['words'])
-    t_response = f"{i['key_objects']}"
-    problem_2_dataset.append({'query': t_query, 'response': t_response})
 
+def filter_items(items, text_field):
+    for item in items:
+        if all(word not in item[text_field] for word in skip_words):
+            yield item
 
-for i in o_problem_3_dataset:
-    t_query = train_prompt['problem_3']['prompt'][0].replace('{}', i['user input'])
-    t_i_r = '; '.join(i['flight control command'].split('\n')) + '.'
-    t_response = f"{t_i_r}"
-    problem_3_dataset.append({'query': t_query, 'response': t_response})
 
-
-for i in o_problem_4_dataset:
-    t_query = train_prompt['problem_4']['prompt'][0].replace('{}', i['words'])
-    t_response = f"{i['key_objects']}."
-    problem_4_dataset.append({'query': t_query, 'response': t_response})
-
-
-train_dataset = []
-val_dataset = []
-
-
-def split_dataset(dataset, train_list, val_list):
-    for i, d in enumerate(dataset):
-        if i % 5 == 0:
-            val_list.append(d)
+def reservoir_sample(items, k, rng):
+    # Algorithm R: 单次遍历等概率抽取 k 条, 内存只与 k 有关
+    sample = []
+    for n, item in enumerate(items):
+        if n < k:
+            sample.append(item)
         else:
-            train_list.append(d)
-
-
-datasets = [problem_1_dataset, problem_2_dataset, problem_3_dataset, problem_4_dataset]
-
-for dataset in datasets:
-    split_dataset(dataset, train_dataset, val_dataset)
-
-random.shuffle(train_dataset)
-random.shuffle(val_dataset)
-
-
-with open('../train_dataset_swift_4_type_new_yolo_9.jsonl', 'w', encoding='utf-8') as f:
-    for entry in train_dataset:
-        f.write(json.dumps(entry, ensure_ascii=False) + '\n')
-with open('../val_dataset_swift_4_type_new_yolo_9.jsonl', 'w', encoding='utf-8') as f:
-    for entry in val_dataset:
-        f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+            j = rng.randrange(n + 1)
+            if j < k:
+                sample[j] = item
+    rng.shuffle(sample)
+    return sample
+
+
+def source_rng(seed, name):
+    # 每个来源使用独立的随机数序列, 增删或扩充某个来源不会改变其他来源的抽样结果
+    return random.Random(f"{seed}:{name}")
+
+
+def sample_task(task, seed=SEED):
+    samples = []
+    for file_name, text_field, quota in SOURCES[task]:
+        if not os.path.exists(file_name):
+            print(f"警告: 数据来源 '{file_name}' 不存在, 已跳过。")
+            continue
+        sample = reservoir_sample(filter_items(read_jsonl(file_name), text_field), quota, source_rng(seed, file_name))
+        print(f"  - {file_name}: 抽取 {len(sample)} 条")
+        samples.extend(sample)
+    source_rng(seed, task).shuffle(samples)
+    return samples
+
+
+def render(task, item, templates, label=None):
+    text_field = SOURCES[task][0][1]
+    if label is not None:
+        return {'query': templates['problem_1'].replace('{}', item[text_field]), 'response': f"{label}."}
+    query = templates[task].replace('{}', item[text_field])
+    if task == 'problem_1':
+        response = f"{item['type']}."
+    elif task == 'problem_2':
+        response = f"{item['key_objects']}"
+    elif task == 'problem_3':
+        response = '; '.join(item['flight control command'].split('\n')) + '.'
+    else:
+        response = f"{item['key_objects']}."
+    return {'query': query, 'response': response}
+
+
+def render_fused(task, item, templates, label=None):
+    # problem_2/3/4 的样本输出 "类别. 抽取结果", problem_1 中的其他类样本只输出 "D."
+    text_field = SOURCES[task][0][1]
+    query = templates[FUSED_TASK].replace('{}', item[text_field])
+    if task == 'problem_1':
+        return {'query': query, 'response': f"{OTHER_CLASS}."}
+    class_label = next(class_label for source_task, class_label, _ in CLASSIFICATION_SOURCES if source_task == task)
+    return {'query': query, 'response': f"{class_label}. {render(task, item, templates)['response']}"}
+
+
+def fused_references(refs, samples):
+    # 只保留能给出完整回答的引用: 抽取任务本身的样本, 以及 problem_1 中的其他类样本。
+    # 借用到分类任务中的样本与抽取任务的样本重复, data0 中的 A/B 类没有抽取标注, 都不使用
+    for task, i, label in refs:
+        if label is None and (task != 'problem_1' or samples[task][i]['type'] == OTHER_CLASS):
+            yield task, i, label
+
+
+def task_references(samples):
+    # 只生成 (任务, 样本下标, 分类标签) 引用, 渲染推迟到写出时进行
+    yield from (('problem_1', i, None) for i in range(len(samples['problem_1'])))
+    for task, label, count in CLASSIFICATION_SOURCES:
+        yield from ((task, i, label) for i in range(min(count, len(samples[task]))))
+    for task in ['problem_2', 'problem_3', 'problem_4']:
+        yield from ((task, i, None) for i in range(len(samples[task])))
+
+
+def split_references(samples):
+    # 与原实现一致: 在每类任务 (problem_1 含额外的分类样本) 内部按顺序每 VAL_EVERY 条取 1 条进验证集
+    train_refs, val_refs = [], []
+    position = {}
+    for ref in task_references(samples):
+        group = 'problem_1' if ref[0] == 'problem_1' or ref[2] is not None else ref[0]
+        i = position.get(group, 0)
+        position[group] = i + 1
+        (val_refs if i % VAL_EVERY == 0 else train_refs).append(ref)
+    return train_refs, val_refs
+
+
+def write_dataset(output_file, refs, samples, templates, renderer=render):
+    tmp_file = output_file + '.tmp'
+    count = 0
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        for task, i, label in refs:
+            f.write(json.dumps(renderer(task, samples[task][i], templates, label), ensure_ascii=False) + '\n')
+            count += 1
+    os.replace(tmp_file, output_file)
+    return count
+
+
+def load_templates(prompt_file=PROMPT_FILE):
+    with open(prompt_file, 'r', encoding='utf-8') as file:
+        train_prompt = json.load(file)
+    return {task: value['prompt'][0] for task, value in train_prompt.items()}
+
+
+def main(seed=SEED):
+    templates = load_templates()
+    samples = {}
+    for task in SOURCES:
+        print(f"[{task}] 正在流式读取并抽样...")
+        samples[task] = sample_task(task, seed)
+
+    train_refs, val_refs = split_references(samples)
+    rng = source_rng(seed, 'split')
+    rng.shuffle(train_refs)
+    rng.shuffle(val_refs)
+
+    write_dataset(TRAIN_OUTPUT_FILE, train_refs, samples, templates)
+    write_dataset(VAL_OUTPUT_FILE, val_refs, samples, templates)
+    print(f"训练集 {len(train_refs)} 条 -> '{TRAIN_OUTPUT_FILE}'")
+    print(f"验证集 {len(val_refs)} 条 -> '{VAL_OUTPUT_FILE}'")
+
+    if BUILD_FUSED:
+        fused_train = write_dataset(FUSED_TRAIN_OUTPUT_FILE, fused_references(train_refs, samples), samples, templates,
+                                    render_fused)
+        fused_val = write_dataset(FUSED_VAL_OUTPUT_FILE, fused_references(val_refs, samples), samples, templates,
+                                  render_fused)
+        print(f"合并任务训练集 {fused_train} 条 -> '{FUSED_TRAIN_OUTPUT_FILE}'")
+        print(f"合并任务验证集 {fused_val} 条 -> '{FUSED_VAL_OUTPUT_FILE}'")
+
+
+if __name__ == "__main__":
+    main()
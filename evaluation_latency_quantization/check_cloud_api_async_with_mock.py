@@ -0,0 +1,159 @@
+import asyncio
+import os
+import sys
+import tempfile
+from openai import AsyncOpenAI, APIStatusError
+
+import mock_inference_server as mock
+import test_cloud_api_async as runner
+from progress_index import ProgressIndex, open_log_for_append
+
+# 在进程内启动 mock_inference_server.py 并开启错误注入, 用 test_cloud_api_async.run_model 跑一遍合成数据集,
+# 检查重试/退避次数、MAX_FAILED_ITEMS 停止以及 AIMD 在限流下收缩并发上限; 任一检查失败时以非零状态退出
+
+MODEL = "mock-cloud-model"
+
+NUM_ITEMS = 200
+
+# 场景一: 部分请求返回带 Retry-After 的 429, 按 Retry-After 等待后重试
+THROTTLE_ERROR_RATES = {429: 0.25}
+
+RETRY_AFTER_S = 0.2
+
+# 场景二: 预检通过后所有请求返回 500, 失败数据项超过 MAX_FAILED_ITEMS 后停止; 不重试, 数据项一失败即计数,
+# 否则停止前大部分数据项的第一次请求已经在重试等待期间发出
+FAILING_ERROR_RATES = {500: 1.0}
+
+MAX_FAILED_ITEMS = 5
+
+# 缩短 runner 的限流与退避参数, 整个检查在几秒内完成
+RUNNER_SETTINGS = {
+    'REQUESTS_PER_SECOND': 500.0,
+    'BURST_SIZE': 50,
+    'INITIAL_CONCURRENCY': 16,
+    'BACKOFF_COOLDOWN_S': 0.05,
+    'RETRY_BASE_DELAY_S': 0.01,
+    'PROGRESS_PRINT_EVERY': NUM_ITEMS,
+}
+
+
+class RecordingConcurrency(runner.AdaptiveConcurrency):
+    # 记录并发上限被减半的次数与最低值
+    instances = []
+
+    def __init__(self, initial, minimum, maximum):
+        super().__init__(initial, minimum, maximum)
+        self.min_limit = self.limit
+        self.backoffs = 0
+        RecordingConcurrency.instances.append(self)
+
+    async def release(self, outcome):
+        before = self.limit
+        await super().release(outcome)
+        if self.limit < before:
+            self.backoffs += 1
+        self.min_limit = min(self.min_limit, self.limit)
+
+
+class SwitchingProgress(ProgressIndex):
+    # run_model 在预检通过后才读取待测试的数据项, 此时切换 mock 的错误注入, 预检本身不受影响
+    def __init__(self, log_file, error_rates):
+        super().__init__(log_file)
+        self.error_rates = error_rates
+
+    def pending_indices(self, model_name, total):
+        mock.ERROR_RATES = self.error_rates
+        return super().pending_indices(model_name, total)
+
+
+def synthetic_dataset():
+    # mock 对未知 prompt 返回 FALLBACK_ANSWER, 以它作为标准答案
+    return [{'query': f"user input: mock item {i}\nresponse: ", 'response': mock.FALLBACK_ANSWER}
+            for i in range(NUM_ITEMS)]
+
+
+async def run_scenario(warmup_error_rates, run_error_rates, directory):
+    # 返回 (run_model 的结果, mock 服务端, 重试延迟列表 [(状态码, 秒)], 并发控制器)
+    mock.ERROR_RATES = warmup_error_rates
+    server = mock.MockInferenceServer({}, [])
+    tcp_server = await asyncio.start_server(server.handle_connection, mock.HOST, 0)
+    port = tcp_server.sockets[0].getsockname()[1]
+
+    delays = []
+    retry_delay = runner.retry_delay
+
+    def recording_retry_delay(error, attempt):
+        delay = retry_delay(error, attempt)
+        delays.append((error.status_code if isinstance(error, APIStatusError) else None, delay))
+        return delay
+
+    runner.retry_delay = recording_retry_delay
+    RecordingConcurrency.instances.clear()
+    log_file = os.path.join(directory, f"progress_{port}.jsonl")
+    progress = SwitchingProgress(log_file, run_error_rates)
+    client = AsyncOpenAI(api_key="mock", base_url=f"http://{mock.HOST}:{port}/v1", max_retries=0)
+    try:
+        async with tcp_server:
+            with open_log_for_append(log_file) as log_f:
+                result = await runner.run_model(client, MODEL, synthetic_dataset(), progress, log_f)
+    finally:
+        runner.retry_delay = retry_delay
+        await client.close()
+        progress.close()
+    return result, server, delays, RecordingConcurrency.instances[-1]
+
+
+def check(failures, condition, message):
+    print(f"  - [{'通过' if condition else '失败'}] {message}")
+    if not condition:
+        failures.append(message)
+
+
+async def main_async():
+    print("--- test_cloud_api_async.py 与 mock 服务端的端到端检查 ---")
+    mock.TTFT_DISTRIBUTION = {'type': 'constant', 'value': 0.005}
+    mock.TOKENS_PER_SECOND = 0
+    mock.DISCONNECT_RATE = 0.0
+    mock.RETRY_AFTER_S = RETRY_AFTER_S
+    for name, value in RUNNER_SETTINGS.items():
+        setattr(runner, name, value)
+    runner.AdaptiveConcurrency = RecordingConcurrency
+    failures = []
+
+    with tempfile.TemporaryDirectory() as directory:
+        print(f"\n[1/2] 限流场景: {THROTTLE_ERROR_RATES}, Retry-After {RETRY_AFTER_S}s, 最多重试 {runner.MAX_RETRIES} 次")
+        result, server, delays, limiter = await run_scenario(THROTTLE_ERROR_RATES, THROTTLE_ERROR_RATES, directory)
+        check(failures, not result.get('failed_warmup'), "预检通过")
+        check(failures, result.get('total_count', 0) + result.get('failed_count', 0) == NUM_ITEMS,
+              f"所有数据项都有结果 (完成 {result.get('total_count')}, 失败 {result.get('failed_count')})")
+        # 每个注入的 429 要么被重试, 要么是某个数据项用尽重试后的最后一次失败
+        check(failures, len(delays) + result.get('failed_count', 0) == server.error_count,
+              f"重试次数与注入的 429 一致 (重试 {len(delays)}, 注入 {server.error_count})")
+        check(failures, delays and all(status == 429 and delay >= RETRY_AFTER_S for status, delay in delays),
+              "每次重试都等待了 Retry-After")
+        check(failures, limiter.backoffs > 0 and limiter.min_limit < runner.INITIAL_CONCURRENCY,
+              f"AIMD 收缩了并发上限 (减半 {limiter.backoffs} 次, 最低 {limiter.min_limit:.1f}, "
+              f"初始 {runner.INITIAL_CONCURRENCY})")
+
+        print(f"\n[2/2] 失败场景: 预检后 {FAILING_ERROR_RATES}, MAX_FAILED_ITEMS = {MAX_FAILED_ITEMS}, 不重试")
+        runner.MAX_FAILED_ITEMS = MAX_FAILED_ITEMS
+        runner.MAX_RETRIES = 0
+        result, server, delays, limiter = await run_scenario({}, FAILING_ERROR_RATES, directory)
+        failed = result.get('failed_count', 0)
+        check(failures, not result.get('failed_warmup') and result.get('total_count') == 0, "预检通过, 没有完成的数据项")
+        # 停止时已经发出的请求仍可能失败, 但不会超过初始并发上限
+        max_failed = MAX_FAILED_ITEMS + 1 + runner.INITIAL_CONCURRENCY
+        check(failures, MAX_FAILED_ITEMS < failed <= max_failed,
+              f"失败数据项超过 MAX_FAILED_ITEMS 后停止 (失败 {failed})")
+        check(failures, not delays and failed == server.error_count,
+              f"每个失败的数据项只发出一次请求 (失败 {failed}, 注入 {server.error_count})")
+        check(failures, server.request_count <= 1 + max_failed,
+              f"停止后剩余数据项不再发出请求 (共 {server.request_count} 个请求, 其中 1 个为预检)")
+        check(failures, limiter.backoffs > 0, f"5xx 同样触发 AIMD 减半 (减半 {limiter.backoffs} 次)")
+
+    print(f"\n检查完成: {'全部通过' if not failures else f'{len(failures)} 项失败'}。")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main_async()))
@@ -0,0 +1,411 @@
+import asyncio
+import json
+import os
+import random
+import re
+import sys
+import time
+from datetime import datetime, timezone
+
+HOST = "127.0.0.1"
+
+PORT = 18000
+
+DATASET_FILE = "val_dataset_swift_4_type_new_yolo_9.jsonl"
+
+# 用于回放真实回答与延迟的日志文件, 不存在时对所有请求返回 FALLBACK_ANSWER
+REPLAY_LOG_FILE = "cloud_api_test_progress.jsonl"
+
+FALLBACK_ANSWER = "None."
+
+SEED = 0
+
+# 首 token 延迟 (prompt 处理时间) 的分布, 单位为秒。type 可选:
+#   constant: {'value'}
+#   uniform: {'low', 'high'}
+#   normal: {'mean', 'std'}
+#   lognormal: {'median', 'sigma'}
+#   replay: 从 REPLAY_LOG_FILE 的 latency 字段中随机抽样 (此时不再叠加解码时间)
+TTFT_DISTRIBUTION = {'type': 'lognormal', 'median': 0.03, 'sigma': 0.4}
+
+# 模拟服务端的前缀 KV cache: 与同一模型上一次请求相同的前缀 token 不再计入 prompt eval
+PREFIX_CACHE = True
+
+# prompt eval 速度 (tokens/s), 未命中前缀缓存的 token 按该速度叠加到首 token 延迟上, 为 0 时不模拟
+PROMPT_EVAL_TOKENS_PER_SECOND = 1500.0
+
+# 解码速度 (tokens/s), 为 0 时不模拟解码耗时
+TOKENS_PER_SECOND = 80.0
+
+# 错误注入: 以给定概率返回对应的 HTTP 状态码
+ERROR_RATES = {
+    429: 0.02,
+    500: 0.01,
+}
+
+# 注入的 429 响应中 Retry-After 头的秒数
+RETRY_AFTER_S = 1
+
+# 以给定概率在返回响应前直接断开连接
+DISCONNECT_RATE = 0.0
+
+# 以给定概率在回答之后继续生成 RUNOFF_TEXT, 模拟小模型没有及时输出结束 token、开始续写下一条样本;
+# 请求 options 中的 stop / num_predict 会截断这部分输出
+RUNOFF_RATE = 0.0
+
+RUNOFF_TEXT = "\nuser input: Fly up 20 centimeters.\nresponse: move_up 20 cm."
+
+# /api/tags 返回的模型列表 (名称 -> 文件大小 GB), 未列出的模型名按 DEFAULT_MODEL_SIZE_GB 处理
+MOCK_MODELS = {
+    "qwen2.5_0.5b_drone_f16:latest": 0.97,
+    "qwen2.5_0.5b_drone_q4:latest": 0.34,
+    "qwen2.5_1.5b_drone_q4:latest": 0.91,
+    "qwen2.5_3b_drone_q4:latest": 1.8,
+    "llama3.2_1b_drone_q4:latest": 0.75,
+}
+
+DEFAULT_MODEL_SIZE_GB = 0.5
+
+# 模拟冷启动: 每 GB 模型的加载耗时 (秒)
+LOAD_SECONDS_PER_GB = 0.5
+
+# 每隔多少秒打印一次请求统计, 为 0 时不打印
+STATS_INTERVAL_S = 10
+
+STATUS_TEXT = {200: "OK", 400: "Bad Request", 404: "Not Found", 429: "Too Many Requests",
+               500: "Internal Server Error", 503: "Service Unavailable"}
+
+TOKEN_PATTERN = re.compile(r'\w+|[^\w\s]|\s+')
+
+
+def load_replay_answers(dataset_file, log_file):
+    answers, latencies = {}, []
+    if not os.path.exists(dataset_file) or not os.path.exists(log_file):
+        print(f"警告: 未找到 '{dataset_file}' 或 '{log_file}', 将对所有请求返回 '{FALLBACK_ANSWER}'。")
+        return answers, latencies
+
+    with open(dataset_file, 'r', encoding='utf-8') as f:
+        dataset = [json.loads(line) for line in f]
+
+    with open(log_file, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                log_entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if log_entry.get('latency'):
+                latencies.append(log_entry['latency'])
+            index = log_entry.get('index')
+            if index is None or index >= len(dataset):
+                continue
+            item = dataset[index]
+            if log_entry.get('is_correct'):
+                answers[item['query']] = item['response']
+            else:
+                answers[item['query']] = log_entry.get('failure_details', {}).get('actual_response', FALLBACK_ANSWER)
+    return answers, latencies
+
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall(text) or ['']
+
+
+def apply_options(answer, options):
+    # 按 Ollama options 中的 stop (输出不包含停止符本身) 与 num_predict 截断回答, 返回 (tokens, done_reason)
+    stops = [answer.index(stop) for stop in options.get('stop') or [] if stop and stop in answer]
+    if stops:
+        answer = answer[:min(stops)]
+    tokens = tokenize(answer)
+    num_predict = options.get('num_predict')
+    if num_predict is not None and 0 <= num_predict < len(tokens):
+        return tokens[:num_predict], 'length'
+    return tokens, 'stop'
+
+
+class MockInferenceServer:
+    def __init__(self, answers, replay_latencies, seed=SEED):
+        self.answers = answers
+        self.replay_latencies = replay_latencies
+        self.rng = random.Random(seed)
+        self.request_count = 0
+        self.error_count = 0
+        self.started = time.monotonic()
+        self.loaded_models = {}
+        self.last_prompt_tokens = {}
+
+    def sample_ttft(self):
+        dist = TTFT_DISTRIBUTION
+        if dist['type'] == 'constant':
+            return dist['value']
+        if dist['type'] == 'uniform':
+            return self.rng.uniform(dist['low'], dist['high'])
+        if dist['type'] == 'normal':
+            return max(0.0, self.rng.gauss(dist['mean'], dist['std']))
+        if dist['type'] == 'lognormal':
+            return dist['median'] * self.rng.lognormvariate(0, dist['sigma'])
+        if dist['type'] == 'replay' and self.replay_latencies:
+            return self.rng.choice(self.replay_latencies)
+        raise ValueError(f"未知的延迟分布: {dist}")
+
+    def token_delay(self):
+        if TOKENS_PER_SECOND <= 0 or TTFT_DISTRIBUTION['type'] == 'replay':
+            return 0.0
+        return 1 / TOKENS_PER_SECOND
+
+    def pick_error(self):
+        roll = self.rng.random()
+        for status, rate in ERROR_RATES.items():
+            if roll < rate:
+                return status
+            roll -= rate
+        return None
+
+    def lookup_answer(self, prompt, system=''):
+        if prompt in self.answers:
+            return self.answers[prompt]
+        return self.answers.get(system + '\n' + prompt, self.answers.get(system + prompt, FALLBACK_ANSWER))
+
+    def prompt_eval(self, model_name, prompt, system=''):
+        # 返回 (实际计算的 prompt token 数, 模拟的 prompt eval 耗时)
+        prompt_tokens = tokenize(system + '\n' + prompt if system else prompt)
+        cached = 0
+        if PREFIX_CACHE:
+            cached = len(os.path.commonprefix([self.last_prompt_tokens.get(model_name, []), prompt_tokens]))
+            self.last_prompt_tokens[model_name] = prompt_tokens
+        prompt_eval_count = max(len(prompt_tokens) - cached, 1)
+        if PROMPT_EVAL_TOKENS_PER_SECOND <= 0:
+            return prompt_eval_count, 0.0
+        return prompt_eval_count, prompt_eval_count / PROMPT_EVAL_TOKENS_PER_SECOND
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode('latin-1').split(' ', 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    key, value = line.decode('latin-1').split(':', 1)
+                    headers[key.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get('content-length', 0)))
+
+                if not await self.route(method, path.split('?', 1)[0], body, writer):
+                    break
+                await writer.drain()
+                if headers.get('connection', '').lower() == 'close':
+                    break
+        except (ConnectionResetError, BrokenPipeError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def route(self, method, path, body, writer):
+        # 返回 False 表示需要关闭连接
+        self.request_count += 1
+        if method == 'GET' and path == '/metrics':
+            self.send_json(writer, 200, self.stats())
+            return True
+        if method == 'GET' and path == '/api/tags':
+            self.send_json(writer, 200, {"models": [
+                {"name": name, "model": name, "size": int(size_gb * 1024 ** 3)} for name, size_gb in MOCK_MODELS.items()
+            ]})
+            return True
+        if method == 'GET' and path == '/api/ps':
+            self.send_json(writer, 200, {"models": [
+                {"name": name, "model": name, "size": int(size_gb * 1024 ** 3), "size_vram": int(size_gb * 1024 ** 3)}
+                for name, size_gb in self.loaded_models.items()
+            ]})
+            return True
+
+        if method == 'POST' and path == '/api/generate':
+            handler = self.handle_ollama_generate
+        elif method == 'POST' and path.endswith('/chat/completions'):
+            handler = self.handle_chat_completions
+        else:
+            self.send_json(writer, 404, {"error": f"unknown endpoint {method} {path}"})
+            return True
+
+        try:
+            payload = json.loads(body)
+        except json.JSONDecodeError:
+            self.send_json(writer, 400, {"error": "invalid json"})
+            return True
+
+        if self.rng.random() < DISCONNECT_RATE:
+            self.error_count += 1
+            return False
+
+        error_status = self.pick_error()
+        if error_status:
+            self.error_count += 1
+            self.send_json(writer, error_status, {"error": {"message": "injected error", "code": error_status}},
+                           extra_headers={"Retry-After": str(RETRY_AFTER_S)} if error_status == 429 else None)
+            return True
+
+        await handler(payload, writer)
+        return True
+
+    async def load_model(self, model_name):
+        if model_name in self.loaded_models:
+            return 0.0
+        size_gb = MOCK_MODELS.get(model_name, DEFAULT_MODEL_SIZE_GB)
+        load_time = size_gb * LOAD_SECONDS_PER_GB
+        await asyncio.sleep(load_time)
+        self.loaded_models[model_name] = size_gb
+        return load_time
+
+    async def handle_ollama_generate(self, payload, writer):
+        model_name = payload.get('model', 'mock')
+        prompt, system = payload.get('prompt', ''), payload.get('system', '')
+        if payload.get('keep_alive') == 0 and not prompt:
+            self.loaded_models.pop(model_name, None)
+            self.send_json(writer, 200, {"model": model_name, "response": "", "done": True, "done_reason": "unload"})
+            return
+        load_time = await self.load_model(model_name)
+        answer = self.lookup_answer(prompt, system)
+        if RUNOFF_RATE and self.rng.random() < RUNOFF_RATE:
+            answer += RUNOFF_TEXT
+        tokens, done_reason = apply_options(answer, payload.get('options') or {})
+        prompt_eval_count, prompt_eval_time = self.prompt_eval(model_name, prompt, system)
+
+        start_time = time.perf_counter() - load_time
+        ttft = self.sample_ttft() + prompt_eval_time
+        await asyncio.sleep(ttft)
+        base = {"model": model_name, "created_at": datetime.now(timezone.utc).isoformat()}
+
+        if payload.get('stream', True):
+            self.start_chunked(writer, 'application/x-ndjson')
+            for token in tokens:
+                self.write_chunk(writer, json.dumps({**base, "response": token, "done": False}) + '\n')
+                await writer.drain()
+                await asyncio.sleep(self.token_delay())
+        else:
+            await asyncio.sleep(self.token_delay() * len(tokens))
+
+        total = time.perf_counter() - start_time
+        final = {
+            **base,
+            "response": "" if payload.get('stream', True) else ''.join(tokens),
+            "done": True,
+            "done_reason": done_reason,
+            "total_duration": int(total * 1e9),
+            "load_duration": int(load_time * 1e9),
+            "prompt_eval_count": prompt_eval_count,
+            # 只报告模拟的 prompt 处理时间; 基础首 token 延迟 (网络/调度) 只计入 total_duration
+            "prompt_eval_duration": int(prompt_eval_time * 1e9),
+            "eval_count": len(tokens),
+            "eval_duration": int(max(total - load_time - ttft, 0) * 1e9),
+        }
+        if payload.get('stream', True):
+            self.write_chunk(writer, json.dumps(final) + '\n')
+            self.end_chunked(writer)
+        else:
+            self.send_json(writer, 200, final)
+
+    async def handle_chat_completions(self, payload, writer):
+        prompt = payload['messages'][-1]['content']
+        system = ''.join(m['content'] for m in payload['messages'][:-1] if m.get('role') == 'system')
+        answer = self.lookup_answer(prompt, system)
+        tokens = tokenize(answer)
+        usage = {"prompt_tokens": len(tokenize(system + prompt)), "completion_tokens": len(tokens),
+                 "total_tokens": len(tokenize(system + prompt)) + len(tokens)}
+        base = {"id": f"chatcmpl-mock-{self.request_count}", "created": int(time.time()),
+                "model": payload.get('model', 'mock')}
+
+        await asyncio.sleep(self.sample_ttft())
+
+        if not payload.get('stream'):
+            await asyncio.sleep(self.token_delay() * len(tokens))
+            self.send_json(writer, 200, {
+                **base,
+                "object": "chat.completion",
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": answer},
+                             "finish_reason": "stop"}],
+                "usage": usage,
+            })
+            return
+
+        self.start_chunked(writer, 'text/event-stream')
+        for token in tokens:
+            chunk = {**base, "object": "chat.completion.chunk",
+                     "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}]}
+            self.write_chunk(writer, f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n")
+            await writer.drain()
+            await asyncio.sleep(self.token_delay())
+        final = {**base, "object": "chat.completion.chunk",
+                 "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+        self.write_chunk(writer, f"data: {json.dumps(final)}\n\n")
+        if (payload.get('stream_options') or {}).get('include_usage'):
+            self.write_chunk(writer, f"data: {json.dumps({**base, 'object': 'chat.completion.chunk', 'choices': [], 'usage': usage})}\n\n")
+        self.write_chunk(writer, "data: [DONE]\n\n")
+        self.end_chunked(writer)
+
+    def stats(self):
+        elapsed = time.monotonic() - self.started
+        return {"requests": self.request_count, "errors": self.error_count,
+                "requests_per_second": self.request_count / elapsed if elapsed > 0 else 0}
+
+    def send_json(self, writer, status, obj, extra_headers=None):
+        body = json.dumps(obj, ensure_ascii=False).encode('utf-8')
+        headers = [f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}",
+                   "Content-Type: application/json",
+                   f"Content-Length: {len(body)}"]
+        for key, value in (extra_headers or {}).items():
+            headers.append(f"{key}: {value}")
+        writer.write(('\r\n'.join(headers) + '\r\n\r\n').encode('latin-1') + body)
+
+    def start_chunked(self, writer, content_type):
+        writer.write(f"HTTP/1.1 200 OK\r\nContent-Type: {content_type}\r\n"
+                     f"Transfer-Encoding: chunked\r\n\r\n".encode('latin-1'))
+
+    def write_chunk(self, writer, text):
+        data = text.encode('utf-8')
+        writer.write(f"{len(data):x}\r\n".encode('latin-1') + data + b"\r\n")
+
+    def end_chunked(self, writer):
+        writer.write(b"0\r\n\r\n")
+
+
+async def report_stats(server):
+    while True:
+        await asyncio.sleep(STATS_INTERVAL_S)
+        stats = server.stats()
+        print(f"  - [统计] 请求数: {stats['requests']} | 注入错误: {stats['errors']} | "
+              f"平均 {stats['requests_per_second']:.1f} req/s")
+
+
+async def serve(host=HOST, port=PORT):
+    answers, replay_latencies = load_replay_answers(DATASET_FILE, REPLAY_LOG_FILE)
+    if TTFT_DISTRIBUTION['type'] == 'replay' and not replay_latencies:
+        print(f"错误: TTFT_DISTRIBUTION 为 replay, 但 '{REPLAY_LOG_FILE}' 中没有可回放的 latency 记录。")
+        return 1
+    server = MockInferenceServer(answers, replay_latencies)
+    tcp_server = await asyncio.start_server(server.handle_connection, host, port, backlog=1024)
+    print(f"Mock 推理服务已启动 (回放 {len(answers)} 条回答):")
+    print(f"  - Ollama: http://{host}:{port}/api/generate")
+    print(f"  - OpenAI: http://{host}:{port}/v1/chat/completions")
+    stats_task = asyncio.create_task(report_stats(server)) if STATS_INTERVAL_S else None
+    try:
+        async with tcp_server:
+            await tcp_server.serve_forever()
+    finally:
+        if stats_task is not None:
+            stats_task.cancel()
+    return 0
+
+
+if __name__ == "__main__":
+    try:
+        # uvloop 为可选依赖, 安装后可进一步提升高并发压测时的吞吐量
+        import uvloop
+        uvloop.install()
+    except ImportError:
+        pass
+    try:
+        sys.exit(asyncio.run(serve()))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,130 @@
+import json
+import time
+from contextlib import contextmanager
+
+# Jetson Xavier NX 为 8 GB 统一内存, 预留给系统与 YOLO 后约 6 GB 可用于常驻大模型
+MEMORY_BUDGET_GB = 6.0
+
+# 模型文件大小到运行时常驻内存的估算系数 (KV cache、计算缓冲区等额外开销)
+MEMORY_OVERHEAD_FACTOR = 1.2
+
+MODEL_LOAD_LOG_FILE = "model_load_times.jsonl"
+
+COLD_START_PROMPT = "Hello"
+
+
+def api_base_url(generate_url):
+    return generate_url.rsplit('/api/', 1)[0]
+
+
+def list_server_models(session, base_url):
+    r = session.get(f"{base_url}/api/tags", timeout=30)
+    r.raise_for_status()
+    return [{'name': m['name'], 'size_gb': m['size'] / 1024 ** 3} for m in r.json().get('models', [])]
+
+
+def list_loaded_models(session, base_url):
+    try:
+        r = session.get(f"{base_url}/api/ps", timeout=30)
+        r.raise_for_status()
+    except Exception as e:
+        print(f"  - [警告] 无法获取已加载模型列表: {e}")
+        return []
+    return [{'name': m['name'], 'size_gb': m.get('size', 0) / 1024 ** 3,
+             'size_vram_gb': m.get('size_vram', 0) / 1024 ** 3} for m in r.json().get('models', [])]
+
+
+def unload_model(session, base_url, model_name):
+    # keep_alive 为 0 的空请求会让 Ollama 立即卸载该模型
+    try:
+        r = session.post(f"{base_url}/api/generate", timeout=120, json={"model": model_name, "keep_alive": 0})
+        r.raise_for_status()
+    except Exception as e:
+        print(f"  - [警告] 卸载模型 {model_name} 失败: {e}")
+
+
+def estimated_memory_gb(model_info):
+    return model_info['size_gb'] * MEMORY_OVERHEAD_FACTOR
+
+
+def plan_phases(models, budget_gb=MEMORY_BUDGET_GB):
+    # First-Fit Decreasing 装箱: 每个阶段内的模型可同时常驻, 阶段之间显式卸载
+    phases, phase_usage, skipped = [], [], []
+    for model_info in sorted(models, key=estimated_memory_gb, reverse=True):
+        need = estimated_memory_gb(model_info)
+        if need > budget_gb:
+            skipped.append(model_info)
+            continue
+        for i, used in enumerate(phase_usage):
+            if used + need <= budget_gb:
+                phases[i].append(model_info)
+                phase_usage[i] += need
+                break
+        else:
+            phases.append([model_info])
+            phase_usage.append(need)
+    # 阶段内按模型名排序, 让同一模型的 q4/f16 变体尽量相邻
+    return [sorted(phase, key=lambda m: m['name']) for phase in phases], skipped
+
+
+def run_schedule(session, base_url, phases):
+    for phase_index, phase in enumerate(phases):
+        phase_names = {m['name'] for m in phase}
+        print(f"\n=== 阶段 {phase_index + 1}/{len(phases)}: {', '.join(sorted(phase_names))} "
+              f"(预计占用 {sum(estimated_memory_gb(m) for m in phase):.2f} GB) ===")
+        for loaded in list_loaded_models(session, base_url):
+            if loaded['name'] not in phase_names:
+                print(f"  - [调度] 卸载不属于本阶段的模型 {loaded['name']} ({loaded['size_gb']:.2f} GB)")
+                unload_model(session, base_url, loaded['name'])
+        for model_info in phase:
+            yield {**model_info, 'phase': phase_index}
+        for model_name in sorted(phase_names):
+            unload_model(session, base_url, model_name)
+
+
+@contextmanager
+def exclusive_models(session, base_url, model_names):
+    # 只使用固定几个模型的测试模式 (不按阶段调度): 开始前卸载其他已加载的模型, 结束后卸载这些模型
+    for loaded in list_loaded_models(session, base_url):
+        if loaded['name'] not in model_names:
+            print(f"  - [调度] 卸载本模式不使用的模型 {loaded['name']} ({loaded['size_gb']:.2f} GB)")
+            unload_model(session, base_url, loaded['name'])
+    try:
+        yield
+    finally:
+        for model_name in sorted(set(model_names)):
+            unload_model(session, base_url, model_name)
+
+
+def measure_cold_start(session, base_url, model_info):
+    model_name = model_info['name']
+    if any(m['name'] == model_name for m in list_loaded_models(session, base_url)):
+        unload_model(session, base_url, model_name)
+
+    t_json = {"model": model_name, "prompt": COLD_START_PROMPT, 'stream': False, "keep_alive": -1}
+    start_time = time.perf_counter()
+    r = session.post(f"{base_url}/api/generate", timeout=600, json=t_json)
+    r.raise_for_status()
+    cold_latency = time.perf_counter() - start_time
+    cold_result = r.json()
+
+    start_time = time.perf_counter()
+    r = session.post(f"{base_url}/api/generate", timeout=600, json=t_json)
+    r.raise_for_status()
+    warm_latency = time.perf_counter() - start_time
+
+    loaded = next((m for m in list_loaded_models(session, base_url) if m['name'] == model_name), {})
+    record = {
+        'model_name': model_name,
+        'phase': model_info.get('phase'),
+        'size_gb': model_info['size_gb'],
+        'resident_size_gb': loaded.get('size_gb'),
+        'resident_vram_gb': loaded.get('size_vram_gb'),
+        'cold_start_latency': cold_latency,
+        'load_duration': cold_result.get('load_duration', 0) / 1e9,
+        'warm_latency': warm_latency,
+        'timestamp': time.time(),
+    }
+    with open(MODEL_LOAD_LOG_FILE, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(record, ensure_ascii=False) + '\n')
+    return record
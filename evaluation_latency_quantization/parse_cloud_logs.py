@@ -1,16 +1,13 @@
 import json
 from collections import defaultdict
-import numpy as np
+from parse_edge_device_logs import (SNAPSHOT_EVERY, display_accuracy, display_snapshot, display_streaming_metrics,
+                                    new_model_state, structured_score, summarize_model_state, update_model_state)
 
 LOG_FILE = 'cloud_api_test_progress.jsonl'
 
 
 def analyze_logs(log_file_path):
-    total_tests = 0
-    correct_predictions = 0
-    latencies = []
-    response_lengths = []
-    failure_cases = []
+    state = new_model_state()
 
     failure_reasons = defaultdict(int)
 
@@ -20,24 +17,17 @@ def analyze_logs(log_file_path):
                 try:
                     data = json.loads(line)
 
-                    total_tests += 1
-                    latencies.append(data.get('latency', 0))
-                    response_lengths.append(data.get('response_length', 0))
-
-                    if data.get('is_correct', False):
-                        correct_predictions += 1
-                    else:
-                        failure_case_info = {
-                            'index': data.get('index'),
-                            'model': data.get('model_name'),
-                            'details': data.get('failure_details', {})
-                        }
-                        failure_cases.append(failure_case_info)
-
-                        if 'expected_response' in failure_case_info['details']:
-                            failure_reasons['content_mismatch'] += 1
+                    update_model_state(state, data)
+                    if SNAPSHOT_EVERY and state['total_tests'] % SNAPSHOT_EVERY == 0:
+                        display_snapshot(data.get('model_name', 'cloud'), state)
+
+                    if not data.get('is_correct', False):
+                        # 结构化结果相同的失败只是格式差异, 其余按错误类别 (标签/对象/顺序/指令/数值等) 归类
+                        structured_correct, error_field = structured_score(data)
+                        if structured_correct:
+                            failure_reasons['format_only'] += 1
                         else:
-                            failure_reasons['unknown'] += 1
+                            failure_reasons[error_field or 'unknown'] += 1
 
                 except json.JSONDecodeError:
                     print(f"Warning: Could not decode line: {line.strip()}")
@@ -46,27 +36,8 @@ def analyze_logs(log_file_path):
         print(f"Error: Log file not found at '{log_file_path}'")
         return None
 
-
-    accuracy = (correct_predictions / total_tests) * 100
-
-    avg_latency_s = np.mean(latencies)
-    std_latency_s = np.std(latencies)
-
-    p95_latency_s = np.percentile(latencies, 95)  # 95分位延迟
-    max_latency_s = np.max(latencies)
-    inferences_per_second = 1 / avg_latency_s if avg_latency_s > 0 else 0
-
-    results = {
-        "total_tests": total_tests,
-        "correct_predictions": correct_predictions,
-        "incorrect_predictions": total_tests - correct_predictions,
-        "accuracy_percent": accuracy,
-        "average_latency_s": avg_latency_s,
-        "std_dev_latency_s": std_latency_s,
-        "p95_latency_s": p95_latency_s,
-        "max_latency_s": max_latency_s,
-        "inferences_per_second (IPS)": inferences_per_second,
-    }
+    results = summarize_model_state(state)
+    results['failure_reasons'] = dict(failure_reasons)
 
     return results
 
@@ -79,17 +50,19 @@ def display_results(results):
         print(f"\n--- 模型名称: {model_name} ---")
         print("-" * (len(model_name) + 16))
 
-        print("\n[ 指令解析精度 ]")
-        print(f"  总测试样本数: {metrics['total_tests']}")
-        print(f"    - 正确解析:   {metrics['correct_predictions']}")
-        print(f"    - 解析错误:   {metrics['incorrect_predictions']}")
-        print(f"  整体准确率: {metrics['accuracy_percent']:.4f}%")
+        display_accuracy(metrics)
 
         print("\n[ 性能与延迟 (单位: 秒) ]")
         print(f"  平均推理延迟: {metrics['average_latency_s']:.3f} s (标准差: {metrics['std_dev_latency_s']:.3f} s)")
+        print(f"  P50 / P99 分位延迟: {metrics['p50_latency_s']:.3f} s / {metrics['p99_latency_s']:.3f} s")
         print(f"  P95 分位延迟: {metrics['p95_latency_s']:.3f} s  (95%的请求延迟低于此值)")
         print(f"  最大推理延迟: {metrics['max_latency_s']:.3f} s")
         print(f"  平均吞吐量 (IPS): {metrics['inferences_per_second (IPS)']:.4f} inferences/second")
+        display_streaming_metrics(metrics)
+
+        print("\n[ 失败原因 ]")
+        for reason, count in sorted(metrics['failure_reasons'].items(), key=lambda x: -x[1]):
+            print(f"  {reason}: {count}")
     print("Detailed Failure Cases:")
     print("=" * 50)
 
@@ -1,18 +1,145 @@
+import html
 import json
-from collections import defaultdict
-import numpy as np
 import os
+import sys
+import time
+from collections import Counter, defaultdict
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common.metrics import RunningStats, StreamingSummary
+from common.scoring import ERROR_FIELDS, guess_task, score_response
 
 LOG_FILE = 'test_progress.jsonl'
 
+MODEL_LOAD_LOG_FILE = 'model_load_times.jsonl'
+
+# 读取日志时每累计多少条记录打印一次滚动快照 (0 表示不打印), 便于在长时间测试中途查看指标
+SNAPSHOT_EVERY = 0
+
+# 跟随模式: 测试仍在进行时从上次读到的字节偏移量继续读取新增日志, 在终端原地刷新各模型指标,
+# 并定期重写 JSON/HTML 汇总文件 (设为 None 则不写), 按 Ctrl+C 退出并打印完整报告
+FOLLOW_MODE = False
+
+FOLLOW_INTERVAL_S = 2.0
+
+LIVE_SUMMARY_JSON_FILE = 'live_summary.json'
+
+LIVE_SUMMARY_HTML_FILE = 'live_summary.html'
+
+# 跟随模式每次读取的字节数: 首次读取已有的长日志时也按块处理, 内存不随日志大小增长
+FOLLOW_CHUNK_BYTES = 1 << 20
+
+# 未以换行结尾的半行最多保留的字节数; 超过时丢弃 (不是有效的日志行), 避免没有换行的文件让 pending 无限增长
+MAX_PENDING_BYTES = 1 << 20
+
+# 每个模型最多保留的失败样本数; 失败总数与各错误类别的计数不受限制, 长时间跟踪日志时内存保持不变
+MAX_FAILURE_SAMPLES = 20
+
+LIVE_SUMMARY_COLUMNS = [
+    ('total_tests', '样本数', '{:d}'),
+    ('accuracy_percent', '准确率 (%)', '{:.2f}'),
+    ('structured_accuracy_percent', '结构化 (%)', '{:.2f}'),
+    ('inferences_per_second (IPS)', 'IPS', '{:.3f}'),
+    ('average_latency_s', '平均 (s)', '{:.3f}'),
+    ('p50_latency_s', 'P50 (s)', '{:.3f}'),
+    ('p95_latency_s', 'P95 (s)', '{:.3f}'),
+    ('p99_latency_s', 'P99 (s)', '{:.3f}'),
+    ('max_latency_s', '最大 (s)', '{:.3f}'),
+]
+
+
+def new_model_state():
+    return {
+        'total_tests': 0,
+        'correct_predictions': 0,
+        'structured_correct': 0,
+        'error_fields': Counter(),
+        'latency': StreamingSummary(),
+        'response_length': RunningStats(),
+        'failure_cases': [],
+        'ttft': StreamingSummary(),
+        'decode_tokens_per_s': StreamingSummary()
+    }
+
+
+def structured_score(data):
+    # 返回 (结构化结果是否正确, 错误类别)。新日志由测试脚本直接记录; 旧日志只在失败记录中保存了期望/实际回答,
+    # 按标准答案推断任务类型后重新评分 (字符串完全相同的记录结构化结果必然相同)
+    if data.get('is_correct', False):
+        return True, None
+    if 'structured_correct' in data:
+        return data['structured_correct'], data.get('error_field')
+    details = data.get('failure_details') or {}
+    if 'expected_response' not in details:
+        return False, None
+    expected = details['expected_response']
+    score = score_response(guess_task(expected), expected, details.get('actual_response', ''))
+    return score['match'], score['error']
+
+
+def update_model_state(state, data):
+    state['total_tests'] += 1
+    state['latency'].add(data.get('latency', 0))
+    state['response_length'].add(data.get('response_length', 0))
+    if data.get('ttft') is not None:
+        state['ttft'].add(data['ttft'])
+    if data.get('decode_tokens_per_s') is not None:
+        state['decode_tokens_per_s'].add(data['decode_tokens_per_s'])
+
+    structured_correct, error_field = structured_score(data)
+    state['structured_correct'] += structured_correct
+    if error_field:
+        state['error_fields'][error_field] += 1
+
+    is_correct = data.get('is_correct', False)
+    if is_correct:
+        state['correct_predictions'] += 1
+    elif len(state['failure_cases']) < MAX_FAILURE_SAMPLES:
+        state['failure_cases'].append({
+            'index': data.get('index'),
+            'details': data.get('failure_details', {})
+        })
+
+
+def summarize_model_state(state):
+    total_tests = state['total_tests']
+    correct_predictions = state['correct_predictions']
+    latency = state['latency']
+    avg_latency_s = latency.mean()
+
+    metrics = {
+        "total_tests": total_tests,
+        "correct_predictions": correct_predictions,
+        "incorrect_predictions": total_tests - correct_predictions,
+        "accuracy_percent": (correct_predictions / total_tests) * 100,
+        "structured_accuracy_percent": state['structured_correct'] / total_tests * 100,
+        "error_fields": {field: state['error_fields'][field] for field in ERROR_FIELDS if state['error_fields'][field]},
+        "average_latency_s": avg_latency_s,
+        "std_dev_latency_s": latency.std(),
+        "p50_latency_s": latency.quantile(0.50),
+        "p95_latency_s": latency.quantile(0.95),
+        "p99_latency_s": latency.quantile(0.99),
+        "max_latency_s": latency.max(),
+        "inferences_per_second (IPS)": 1 / avg_latency_s if avg_latency_s > 0 else 0,
+        "failure_cases": state['failure_cases']
+    }
+    metrics.update(streaming_metrics(state['ttft'], state['decode_tokens_per_s']))
+    return metrics
+
+
+def display_snapshot(model_name, state):
+    latency = state['latency']
+    print(f"  [快照] {model_name} | 已读取 {state['total_tests']} 条 | "
+          f"准确率 {state['correct_predictions'] / state['total_tests'] * 100:.2f}% | "
+          f"平均 {latency.mean():.3f} s | P50 {latency.quantile(0.50):.3f} s | "
+          f"P95 {latency.quantile(0.95):.3f} s | P99 {latency.quantile(0.99):.3f} s")
+
 
 def analyze_jetson_logs(log_file_path):
-    results_by_model = defaultdict(lambda: {
-        'latencies': [],
-        'response_lengths': [],
-        'is_correct_list': [],
-        'failure_cases': []
-    })
+    # 每个模型只保存计数与流式统计量 (Welford + 延迟 sketch), 内存不随日志行数增长;
+    # 分位数为 sketch 估计值, 相对误差不超过 1%
+    results_by_model = defaultdict(new_model_state)
 
     if not os.path.exists(log_file_path):
         print(f"错误: 日志文件 '{log_file_path}' 不存在。")
@@ -28,54 +155,172 @@ def analyze_jetson_logs(log_file_path):
                 if not model_name:
                     continue
 
-                results_by_model[model_name]['latencies'].append(data.get('latency', 0))
-                results_by_model[model_name]['response_lengths'].append(data.get('response_length', 0))
-
-                is_correct = data.get('is_correct', False)
-                results_by_model[model_name]['is_correct_list'].append(is_correct)
-
-                if not is_correct:
-                    failure_info = {
-                        'index': data.get('index'),
-                        'details': data.get('failure_details', {})
-                    }
-                    results_by_model[model_name]['failure_cases'].append(failure_info)
+                state = results_by_model[model_name]
+                update_model_state(state, data)
+                if SNAPSHOT_EVERY and state['total_tests'] % SNAPSHOT_EVERY == 0:
+                    display_snapshot(model_name, state)
 
             except json.JSONDecodeError:
                 print(f"警告: 无法解析行: {line.strip()}")
 
-    final_metrics = {}
-    for model_name, data in results_by_model.items():
-        total_tests = len(data['is_correct_list'])
-        if total_tests == 0:
-            continue
+    return {model_name: summarize_model_state(state)
+            for model_name, state in results_by_model.items() if state['total_tests'] > 0}
 
-        correct_predictions = sum(data['is_correct_list'])
 
-        accuracy = (correct_predictions / total_tests) * 100
+def read_new_lines(chunk, pending):
+    # 只返回以换行结尾的完整行; 末尾尚未写完的半行留在 pending 中, 与下次读到的内容拼接
+    lines = (pending + chunk).split(b'\n')
+    pending = lines.pop()
+    if len(pending) > MAX_PENDING_BYTES:
+        # 被丢弃的半行的剩余部分之后会作为一行读到, JSON 解析失败后跳过
+        pending = b''
+    return lines, pending
 
-        latencies = data['latencies']
-        avg_latency_s = np.mean(latencies)
-        std_latency_s = np.std(latencies)
 
-        p95_latency_s = np.percentile(latencies, 95)
-        max_latency_s = np.max(latencies)
-        inferences_per_second = 1 / avg_latency_s if avg_latency_s > 0 else 0
+def apply_log_line(results_by_model, line):
+    if not line.strip():
+        return
+    try:
+        data = json.loads(line)
+    except json.JSONDecodeError:
+        return
+    if data.get('model_name'):
+        update_model_state(results_by_model[data['model_name']], data)
+
+
+def live_summary(results_by_model):
+    return {model_name: {key: value for key, value in summarize_model_state(state).items() if key != 'failure_cases'}
+            for model_name, state in results_by_model.items() if state['total_tests'] > 0}
+
+
+def write_atomic(path, content):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+
+
+def write_live_summary(summary, log_file_path, updated_at):
+    if LIVE_SUMMARY_JSON_FILE:
+        write_atomic(LIVE_SUMMARY_JSON_FILE, json.dumps(
+            {'log_file': log_file_path, 'updated_at': updated_at, 'models': summary}, ensure_ascii=False, indent=2))
+    if LIVE_SUMMARY_HTML_FILE:
+        header = ''.join(f'<th>{html.escape(title)}</th>' for _, title, _ in LIVE_SUMMARY_COLUMNS)
+        rows = ''.join(
+            f'<tr><td>{html.escape(model_name)}</td>' +
+            ''.join(f'<td>{fmt.format(metrics[key])}</td>' for key, _, fmt in LIVE_SUMMARY_COLUMNS) + '</tr>'
+            for model_name, metrics in summary.items())
+        write_atomic(LIVE_SUMMARY_HTML_FILE, (
+            f'<!DOCTYPE html><html><head><meta charset="utf-8">'
+            f'<meta http-equiv="refresh" content="{max(1, round(FOLLOW_INTERVAL_S))}">'
+            f'<title>{html.escape(log_file_path)}</title></head><body>'
+            f'<h3>{html.escape(log_file_path)} (更新于 {time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(updated_at))})</h3>'
+            f'<table border="1" cellpadding="4"><tr><th>模型名称</th>{header}</tr>{rows}</table></body></html>'))
+
+
+def display_live_summary(summary, log_file_path, offset, updated_at):
+    # 清屏并把光标移回左上角, 实现原地刷新
+    print('\033[H\033[J', end='')
+    print(f"跟随日志 '{log_file_path}' | 已读取 {offset} 字节 | "
+          f"{time.strftime('%H:%M:%S', time.localtime(updated_at))} | Ctrl+C 退出")
+    print(f"{'模型名称':<40} | " + ' | '.join(f'{title:<10}' for _, title, _ in LIVE_SUMMARY_COLUMNS))
+    print("-" * 150)
+    for model_name, metrics in summary.items():
+        print(f"{model_name:<40} | " +
+              ' | '.join(f'{fmt.format(metrics[key]):<10}' for key, _, fmt in LIVE_SUMMARY_COLUMNS))
+
+
+def follow_jetson_logs(log_file_path, interval_s=FOLLOW_INTERVAL_S):
+    results_by_model = defaultdict(new_model_state)
+    offset, pending = 0, b''
+    try:
+        while True:
+            log_size = os.path.getsize(log_file_path) if os.path.exists(log_file_path) else 0
+            if log_size < offset:
+                # 日志被截断或替换 (例如重新开始一轮测试), 从头重新统计
+                results_by_model.clear()
+                offset, pending = 0, b''
+            if log_size > offset:
+                with open(log_file_path, 'rb') as f:
+                    f.seek(offset)
+                    while True:
+                        chunk = f.read(FOLLOW_CHUNK_BYTES)
+                        if not chunk:
+                            break
+                        lines, pending = read_new_lines(chunk, pending)
+                        for line in lines:
+                            apply_log_line(results_by_model, line)
+                    offset = f.tell()
+
+            updated_at = time.time()
+            summary = live_summary(results_by_model)
+            display_live_summary(summary, log_file_path, offset, updated_at)
+            write_live_summary(summary, log_file_path, updated_at)
+            time.sleep(interval_s)
+    except KeyboardInterrupt:
+        print()
+    return {model_name: summarize_model_state(state)
+            for model_name, state in results_by_model.items() if state['total_tests'] > 0}
 
-        final_metrics[model_name] = {
-            "total_tests": total_tests,
-            "correct_predictions": correct_predictions,
-            "incorrect_predictions": total_tests - correct_predictions,
-            "accuracy_percent": accuracy,
-            "average_latency_s": avg_latency_s,
-            "std_dev_latency_s": std_latency_s,
-            "p95_latency_s": p95_latency_s,
-            "max_latency_s": max_latency_s,
-            "inferences_per_second (IPS)": inferences_per_second,
-            "failure_cases": data['failure_cases']
-        }
 
-    return final_metrics
+def analyze_load_times(load_log_path):
+    # 冷启动记录由 test_edge_latency_quantization.py 的调度器写入, 每次加载一行
+    load_times = defaultdict(lambda: {'cold_start_latency': RunningStats(), 'load_duration': RunningStats(),
+                                      'warm_latency': RunningStats()})
+    if not os.path.exists(load_log_path):
+        return {}
+    with open(load_log_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                data = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            for key in ('cold_start_latency', 'load_duration', 'warm_latency'):
+                if data.get(key) is not None:
+                    load_times[data['model_name']][key].add(data[key])
+    return {model_name: {f"avg_{key}_s": stats.mean for key, stats in data.items() if stats.count}
+            for model_name, data in load_times.items()}
+
+
+def streaming_metrics(ttft, decode_tokens_per_s):
+    metrics = {}
+    if ttft.count:
+        metrics.update({
+            "p50_ttft_s": ttft.quantile(0.50),
+            "p95_ttft_s": ttft.quantile(0.95),
+            "p99_ttft_s": ttft.quantile(0.99),
+        })
+    if decode_tokens_per_s.count:
+        # 解码速度越低越差, 因此报告低分位 (P5) 而不是高分位
+        metrics.update({
+            "p5_decode_tokens_per_s": decode_tokens_per_s.quantile(0.05),
+            "p50_decode_tokens_per_s": decode_tokens_per_s.quantile(0.50),
+            "p95_decode_tokens_per_s": decode_tokens_per_s.quantile(0.95),
+        })
+    return metrics
+
+
+def display_streaming_metrics(metrics):
+    if 'p50_ttft_s' not in metrics and 'p50_decode_tokens_per_s' not in metrics:
+        return
+    print("\n[ 首 token 延迟与解码速度 ]")
+    if 'p50_ttft_s' in metrics:
+        print(f"  首 token 延迟 (TTFT): P50 {metrics['p50_ttft_s']:.3f} s | "
+              f"P95 {metrics['p95_ttft_s']:.3f} s | P99 {metrics['p99_ttft_s']:.3f} s")
+    if 'p50_decode_tokens_per_s' in metrics:
+        print(f"  解码速度 (tokens/s): P5 {metrics['p5_decode_tokens_per_s']:.2f} | "
+              f"P50 {metrics['p50_decode_tokens_per_s']:.2f} | P95 {metrics['p95_decode_tokens_per_s']:.2f}")
+
+
+def display_accuracy(metrics):
+    print("\n[ 指令解析精度 ]")
+    print(f"  总测试样本数: {metrics['total_tests']}")
+    print(f"    - 正确解析:   {metrics['correct_predictions']}")
+    print(f"    - 解析错误:   {metrics['incorrect_predictions']}")
+    print(f"  整体准确率: {metrics['accuracy_percent']:.4f}%")
+    print(f"  结构化准确率: {metrics['structured_accuracy_percent']:.4f}% (忽略大小写、方括号、空白与等价单位等格式差异)")
+    if metrics['error_fields']:
+        print("  错误类别: " + ' | '.join(f"{field} {count}" for field, count in metrics['error_fields'].items()))
 
 
 def display_results(all_metrics):
@@ -91,22 +336,29 @@ def display_results(all_metrics):
         print(f"\n--- 模型名称: {model_name} ---")
         print("-" * (len(model_name) + 16))
 
-        print("\n[ 指令解析精度 ]")
-        print(f"  总测试样本数: {metrics['total_tests']}")
-        print(f"    - 正确解析:   {metrics['correct_predictions']}")
-        print(f"    - 解析错误:   {metrics['incorrect_predictions']}")
-        print(f"  整体准确率: {metrics['accuracy_percent']:.4f}%")
+        display_accuracy(metrics)
 
         print("\n[ 性能与延迟 (单位: 秒) ]")
         print(f"  平均推理延迟: {metrics['average_latency_s']:.3f} s (标准差: {metrics['std_dev_latency_s']:.3f} s)")
+        print(f"  P50 / P99 分位延迟: {metrics['p50_latency_s']:.3f} s / {metrics['p99_latency_s']:.3f} s")
         print(f"  P95 分位延迟: {metrics['p95_latency_s']:.3f} s  (95%的请求延迟低于此值)")
         print(f"  最大推理延迟: {metrics['max_latency_s']:.3f} s")
         print(f"  平均吞吐量 (IPS): {metrics['inferences_per_second (IPS)']:.4f} inferences/second")
+        display_streaming_metrics(metrics)
+
+        if 'avg_cold_start_latency_s' in metrics:
+            print("\n[ 冷启动 (不计入上面的推理延迟) ]")
+            print(f"  平均冷启动延迟: {metrics['avg_cold_start_latency_s']:.3f} s "
+                  f"(其中模型加载 {metrics.get('avg_load_duration_s', 0):.3f} s)")
+            print(f"  预热后同一请求延迟: {metrics.get('avg_warm_latency_s', 0):.3f} s")
 
         print("-" * 80)
 
 
 if __name__ == "__main__":
-    analysis_results = analyze_jetson_logs(LOG_FILE)
+    analysis_results = follow_jetson_logs(LOG_FILE) if FOLLOW_MODE else analyze_jetson_logs(LOG_FILE)
     if analysis_results:
+        for model_name, load_metrics in analyze_load_times(MODEL_LOAD_LOG_FILE).items():
+            if model_name in analysis_results:
+                analysis_results[model_name].update(load_metrics)
         display_results(analysis_results)
\ No newline at end of file
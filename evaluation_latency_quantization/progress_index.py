@@ -0,0 +1,141 @@
+import json
+import os
+import sqlite3
+
+INDEX_SUFFIX = ".idx.sqlite"
+
+SUMMARY_FIELDS = ['total_count', 'correct_count', 'failed_count', 'latency_sum', 'response_length_sum']
+
+
+class ProgressIndex:
+    # 进度日志 (jsonl) 的 sqlite 旁路索引: 记录已完成的 (model_name, index) 以及每个模型的汇总计数。
+    # 索引同时保存已同步到的日志字节偏移量, 启动时只需解析该偏移量之后新增的日志行。
+
+    def __init__(self, log_file, index_file=None):
+        self.log_file = log_file
+        self.index_file = index_file or log_file + INDEX_SUFFIX
+        self.conn = sqlite3.connect(self.index_file)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS completed (
+                model_name TEXT NOT NULL,
+                item_index INTEGER NOT NULL,
+                PRIMARY KEY (model_name, item_index)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS model_summary (
+                model_name TEXT PRIMARY KEY,
+                total_count INTEGER NOT NULL DEFAULT 0,
+                correct_count INTEGER NOT NULL DEFAULT 0,
+                failed_count INTEGER NOT NULL DEFAULT 0,
+                latency_sum REAL NOT NULL DEFAULT 0,
+                response_length_sum INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            );
+        """)
+        self.conn.commit()
+        self.sync()
+
+    def log_offset(self):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'log_offset'").fetchone()
+        return row[0] if row else 0
+
+    def sync(self):
+        # 日志被截断或替换时重建索引, 否则只补齐索引之后追加的日志行 (例如上次运行在写索引前中断)
+        log_size = os.path.getsize(self.log_file) if os.path.exists(self.log_file) else 0
+        offset = self.log_offset()
+        if log_size < offset:
+            print(f"警告: 日志文件 '{self.log_file}' 比索引记录的短, 正在重建索引...")
+            self.conn.executescript("DELETE FROM completed; DELETE FROM model_summary; DELETE FROM meta;")
+            offset = 0
+        if log_size == offset:
+            return
+
+        with open(self.log_file, 'rb') as f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b'\n'):
+                    # 最后一行尚未写完, 留到下次同步
+                    break
+                offset += len(line)
+                try:
+                    log_entry = json.loads(line)
+                except json.JSONDecodeError:
+                    print(f"警告: 日志文件中发现无效行: {line.decode('utf-8', 'replace').strip()}")
+                    continue
+                if 'model_name' in log_entry and 'index' in log_entry:
+                    self._insert(log_entry)
+        self._set_offset(offset)
+        self.conn.commit()
+
+    def _insert(self, log_entry):
+        cursor = self.conn.execute(
+            "INSERT OR IGNORE INTO completed (model_name, item_index) VALUES (?, ?)",
+            (log_entry['model_name'], log_entry['index']))
+        if cursor.rowcount == 0:
+            return
+        self.conn.execute("INSERT OR IGNORE INTO model_summary (model_name) VALUES (?)", (log_entry['model_name'],))
+        self.conn.execute("""
+            UPDATE model_summary SET
+                total_count = total_count + 1,
+                correct_count = correct_count + ?,
+                latency_sum = latency_sum + ?,
+                response_length_sum = response_length_sum + ?
+            WHERE model_name = ?
+        """, (int(bool(log_entry.get('is_correct'))), log_entry.get('latency', 0),
+              log_entry.get('response_length', 0), log_entry['model_name']))
+
+    def _set_offset(self, offset):
+        self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('log_offset', ?)", (offset,))
+
+    def record(self, log_entry, log_offset):
+        # log_offset 为写入该行之后日志文件的字节位置 (二进制追加模式下的 f.tell())
+        self._insert(log_entry)
+        self._set_offset(log_offset)
+        self.conn.commit()
+
+    def record_failure(self, model_name):
+        self.conn.execute("INSERT OR IGNORE INTO model_summary (model_name) VALUES (?)", (model_name,))
+        self.conn.execute("UPDATE model_summary SET failed_count = failed_count + 1 WHERE model_name = ?",
+                          (model_name,))
+        self.conn.commit()
+
+    def completed_count(self, model_name=None):
+        if model_name is None:
+            return self.conn.execute("SELECT COUNT(*) FROM completed").fetchone()[0]
+        return self.conn.execute("SELECT COUNT(*) FROM completed WHERE model_name = ?", (model_name,)).fetchone()[0]
+
+    def pending_indices(self, model_name, total):
+        done = {row[0] for row in self.conn.execute(
+            "SELECT item_index FROM completed WHERE model_name = ?", (model_name,))}
+        return [i for i in range(total) if i not in done]
+
+    def summary(self, model_name):
+        row = self.conn.execute(
+            f"SELECT {', '.join(SUMMARY_FIELDS)} FROM model_summary WHERE model_name = ?", (model_name,)).fetchone()
+        return dict(zip(SUMMARY_FIELDS, row or [0] * len(SUMMARY_FIELDS)))
+
+    def close(self):
+        self.conn.close()
+
+
+def open_log_for_append(log_file):
+    # 上次运行中断时日志末尾可能残留半行, 先补一个换行, 避免与新写入的记录粘连成一行
+    log_f = open(log_file, 'ab')
+    if log_f.tell() > 0:
+        with open(log_file, 'rb') as f:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b'\n':
+                log_f.write(b'\n')
+                log_f.flush()
+    return log_f
+
+
+def append_log_entry(log_f, progress, log_entry):
+    # log_f 需由 open_log_for_append 以二进制追加模式打开, 以便 tell() 返回准确的字节偏移量
+    log_f.write((json.dumps(log_entry, ensure_ascii=False) + '\n').encode('utf-8'))
+    log_f.flush()
+    progress.record(log_entry, log_f.tell())
@@ -0,0 +1,274 @@
+import asyncio
+import os
+import random
+import sys
+import time
+from openai import AsyncOpenAI, APIConnectionError, APIStatusError, APITimeoutError
+
+from progress_index import ProgressIndex, append_log_entry, open_log_for_append
+from test_cloud_api_latency_quantization import API_KEY, BASE_URL, MODELS_TO_TEST, DATASET_FILE, LOG_FILE, load_dataset
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common.prompts import task_of
+from common.scoring import score_response
+
+# 令牌桶限流: 平均每秒请求数与允许的突发请求数
+REQUESTS_PER_SECOND = 10.0
+
+BURST_SIZE = 20
+
+# 自适应并发 (AIMD): 成功时缓慢增加并发上限, 遇到 429/5xx/超时 时减半
+INITIAL_CONCURRENCY = 8
+
+MIN_CONCURRENCY = 1
+
+MAX_CONCURRENCY = 64
+
+# 释放并发名额时的请求结果: 成功时增加并发上限, 被限流 (429/5xx/超时) 时减半, 其他失败 (例如 400) 不调整
+SUCCESS, THROTTLED, FAILED = 'success', 'throttled', 'failed'
+
+# 两次并发减半之间的最短间隔, 避免一批同时返回的 429 把并发直接压到最低
+BACKOFF_COOLDOWN_S = 2.0
+
+MAX_RETRIES = 6
+
+RETRY_BASE_DELAY_S = 1.0
+
+RETRY_MAX_DELAY_S = 60.0
+
+REQUEST_TIMEOUT_S = 600
+
+# 重试耗尽后仍失败的数据项超过该数量时, 停止该模型的剩余测试
+MAX_FAILED_ITEMS = 50
+
+PROGRESS_PRINT_EVERY = 100
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class AdaptiveConcurrency:
+    def __init__(self, initial, minimum, maximum):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.in_flight = 0
+        self.last_backoff = 0.0
+        self.condition = asyncio.Condition()
+
+    async def acquire(self):
+        async with self.condition:
+            await self.condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+
+    async def release(self, outcome):
+        async with self.condition:
+            self.in_flight -= 1
+            now = time.monotonic()
+            if outcome == THROTTLED:
+                if now - self.last_backoff >= BACKOFF_COOLDOWN_S:
+                    self.limit = max(self.minimum, self.limit / 2)
+                    self.last_backoff = now
+            elif outcome == SUCCESS:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self.condition.notify_all()
+
+
+class StopRequested(Exception):
+    # 模型测试已被停止 (失败数据项过多), 尚未发出的请求不再发送
+    pass
+
+
+def is_retryable(error):
+    if isinstance(error, (APIConnectionError, APITimeoutError)):
+        return True
+    if isinstance(error, APIStatusError):
+        return error.status_code == 429 or error.status_code >= 500
+    return False
+
+
+def retry_delay(error, attempt):
+    retry_after = None
+    if isinstance(error, APIStatusError):
+        retry_after = error.response.headers.get('retry-after')
+    if retry_after:
+        try:
+            return float(retry_after) + random.uniform(0, RETRY_BASE_DELAY_S)
+        except ValueError:
+            pass
+    # full jitter 指数退避
+    return random.uniform(0, min(RETRY_MAX_DELAY_S, RETRY_BASE_DELAY_S * 2 ** attempt))
+
+
+async def query_cloud_api_async(client, bucket, limiter, prompt, model, stop_event=None):
+    for attempt in range(MAX_RETRIES + 1):
+        # 排队等待令牌与并发名额期间可能已经停止测试, 拿到名额后再检查一次, 停止后不再发出请求
+        if stop_event is not None and stop_event.is_set():
+            raise StopRequested()
+        await bucket.acquire()
+        await limiter.acquire()
+        if stop_event is not None and stop_event.is_set():
+            await limiter.release(FAILED)
+            raise StopRequested()
+        outcome = FAILED
+        try:
+            start_time = time.perf_counter()
+            response = await client.chat.completions.create(
+                model=model,
+                messages=[
+                    {"role": "user", "content": prompt},
+                ],
+                stream=False,
+                timeout=REQUEST_TIMEOUT_S,
+            )
+            latency = time.perf_counter() - start_time
+            outcome = SUCCESS
+            return response.choices[0].message.content, latency
+        except Exception as e:
+            # 最后一次重试失败时同样是限流信号, 需要在抛出前确定
+            outcome = THROTTLED if is_retryable(e) else FAILED
+            if outcome == FAILED or attempt == MAX_RETRIES:
+                raise ConnectionError(f"API 请求失败: {e}")
+            delay = retry_delay(e, attempt)
+        finally:
+            await limiter.release(outcome)
+        await asyncio.sleep(delay)
+
+
+async def run_model(client, model_name, dataset, progress, log_f):
+    bucket = TokenBucket(REQUESTS_PER_SECOND, BURST_SIZE)
+    limiter = AdaptiveConcurrency(INITIAL_CONCURRENCY, MIN_CONCURRENCY, MAX_CONCURRENCY)
+
+    try:
+        print(f"  - [预检] 正在测试 API 连通性 ({model_name})...")
+        await query_cloud_api_async(client, bucket, limiter, "Hello", model_name)
+        print("  - [预检] API 连通性正常。")
+    except Exception as e:
+        print(f"  - [错误] 模型 {model_name} API 连通性测试失败: {e}。将跳过此模型。")
+        return {'failed_warmup': True, 'error_message': str(e)}
+
+    model_results = {'total_count': 0, 'failed_count': 0}
+    pending = progress.pending_indices(model_name, len(dataset))
+    print(f"  - 待测试 {len(pending)} 条, 已跳过 {len(dataset) - len(pending)} 条已完成记录。")
+    stop_event = asyncio.Event()
+    start_time = time.perf_counter()
+
+    async def run_item(i):
+        if stop_event.is_set():
+            return
+        query, expected_response = dataset[i]['query'], dataset[i]['response']
+        try:
+            actual_response, latency = await query_cloud_api_async(client, bucket, limiter, query, model_name,
+                                                                   stop_event)
+        except StopRequested:
+            return
+        except Exception as e:
+            model_results['failed_count'] += 1
+            progress.record_failure(model_name)
+            print(f"  - [错误] 数据项 {i + 1}/{len(dataset)} | {e}")
+            if model_results['failed_count'] > MAX_FAILED_ITEMS and not stop_event.is_set():
+                print("  - 重试后仍失败的数据项过多，跳过该模型的剩余测试。")
+                stop_event.set()
+            return
+
+        response_len = len(actual_response)
+        score = score_response(task_of(query), expected_response, actual_response)
+        is_correct = score['exact']
+        model_results['total_count'] += 1
+
+        log_entry = {
+            'model_name': model_name, 'index': i,
+            'latency': latency,
+            'is_correct': is_correct,
+            'structured_correct': score['match'],
+            'error_field': score['error'],
+            'response_length': response_len
+        }
+        if not is_correct:
+            log_entry['failure_details'] = {
+                "expected_response": expected_response,
+                "actual_response": actual_response,
+                "expected_semicolons": expected_response.count(';'),
+                "actual_semicolons": actual_response.count(';')
+            }
+        append_log_entry(log_f, progress, log_entry)
+
+        done = model_results['total_count']
+        if done % PROGRESS_PRINT_EVERY == 0:
+            elapsed = time.perf_counter() - start_time
+            print(f"  - [进度] {done}/{len(pending)} | 吞吐量: {done / elapsed:.2f} req/s | "
+                  f"当前并发上限: {int(limiter.limit)}")
+
+    await asyncio.gather(*(run_item(i) for i in pending))
+    model_results['wall_time_s'] = time.perf_counter() - start_time
+    return model_results
+
+
+async def main_async():
+    print("--- Cloud API 异步批量测试 ---")
+
+    eligible_models = [{'name': name} for name in MODELS_TO_TEST]
+    print(f"\n[1/5] 准备测试 {len(eligible_models)} 个指定的云端模型...")
+
+    print(f"\n[2/5] 正在加载数据集 '{DATASET_FILE}'...")
+    dataset = load_dataset(DATASET_FILE)
+    print(f"  - 加载完成，共 {len(dataset)} 条数据。")
+
+    print(f"\n[3/5] 正在检查进度日志 '{LOG_FILE}'...")
+    progress = ProgressIndex(LOG_FILE)
+    print(f"  - 发现 {progress.completed_count()} 条已完成记录，将直接跳过。")
+
+    print(f"\n[4/5] 开始执行测试 (限流 {REQUESTS_PER_SECOND} req/s, 初始并发 {INITIAL_CONCURRENCY})...")
+    results = {}
+    client = AsyncOpenAI(api_key=API_KEY, base_url=BASE_URL, max_retries=0)
+    with open_log_for_append(LOG_FILE) as log_f:
+        for model_info in eligible_models:
+            model_name = model_info['name']
+            print(f"\n--- 开始测试模型: {model_name} ---")
+            results[model_name] = await run_model(client, model_name, dataset, progress, log_f)
+            print(f"--- 模型 {model_name} 测试完成 ---")
+    await client.close()
+
+    print("\n[5/5] 所有测试完成，生成总结报告...")
+    print("\n==================================== 测试总结 ====================================")
+    print(f"{'模型名称':<40} | {'平均延迟 (s)':<15} | {'吞吐量 (req/s)':<15} | {'准确率':<15} | {'测试数':<10}")
+    print("-" * 115)
+    for model_name, res in results.items():
+        if res.get('failed_warmup'):
+            print(f"{model_name:<40} | {'N/A':<15} | {'N/A':<15} | {'N/A':<15} | {'API连通性失败':<15}")
+            continue
+        # 平均延迟与准确率来自进度索引 (包含历次运行), 吞吐量只统计本次运行
+        summary = progress.summary(model_name)
+        if summary['total_count'] > 0:
+            avg_latency = f"{summary['latency_sum'] / summary['total_count']:.2f}"
+            throughput = f"{res['total_count'] / res['wall_time_s']:.2f}" if res['total_count'] else 'N/A'
+            accuracy = f"{(summary['correct_count'] / summary['total_count']) * 100:.2f}%"
+            count_str = f"{summary['correct_count']}/{summary['total_count']}"
+            print(f"{model_name:<40} | {avg_latency:<15} | {throughput:<15} | {accuracy:<15} | {count_str:<10}")
+        else:
+            print(f"{model_name:<40} | {'N/A':<15} | {'N/A':<15} | {'N/A':<15} | {'无有效测试':<10}")
+    print("=" * 115)
+    print(f"\n详细测试日志已保存在 '{LOG_FILE}' 文件中。")
+    progress.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main_async())
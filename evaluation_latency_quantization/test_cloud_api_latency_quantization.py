@@ -1,11 +1,21 @@
 import json
 import time
 import os
+import sys
 from openai import OpenAI
 
+from progress_index import ProgressIndex, append_log_entry, open_log_for_append
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common.prompts import task_of
+from common.scoring import score_response
+from common.val_store import open_val_store
+
 
 API_KEY = "sk-xxxxxx"  # IMPORTANT: Replace with your actual key
-BASE_URL = "https://api.deepseek.com"
+# 可通过环境变量指向本地 mock 服务 (见 mock_inference_server.py), 例如 http://127.0.0.1:18000/v1
+BASE_URL = os.environ.get("CLOUD_API_BASE_URL", "https://api.deepseek.com")
 
 MODELS_TO_TEST = [
     "deepseek-chat"
@@ -13,8 +23,14 @@ MODELS_TO_TEST = [
 
 DATASET_FILE = "val_dataset_swift_4_type_new_yolo_9.jsonl"
 
+# 为 True 时通过内存映射的验证集存储文件 (.lmvs, 首次运行时自动生成) 读取数据, 不再解析整个 jsonl
+USE_VAL_STORE = True
+
 LOG_FILE = "cloud_api_test_progress.jsonl"
 
+# 流式模式: 额外记录首 token 延迟 (TTFT)、token 间延迟以及 API 返回的 token 用量
+STREAM_MODE = False
+
 try:
     client = OpenAI(api_key=API_KEY, base_url=BASE_URL)
 except Exception as e:
@@ -40,27 +56,60 @@ def query_cloud_api(prompt="1+1=?", model="deepseek-chat"):
         raise ConnectionError(f"API 请求失败: {e}")
 
 
+def query_cloud_api_stream(prompt="1+1=?", model="deepseek-chat"):
+    if not client:
+        raise ConnectionError("API 客户端未成功初始化。")
+
+    chunks, token_times, usage = [], [], None
+    try:
+        start_time = time.perf_counter()
+        stream = client.chat.completions.create(
+            model=model,
+            messages=[
+                {"role": "user", "content": prompt},
+            ],
+            stream=True,
+            stream_options={"include_usage": True},
+            timeout=600,
+        )
+        for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                token_times.append(time.perf_counter())
+                chunks.append(chunk.choices[0].delta.content)
+            if chunk.usage:
+                usage = chunk.usage
+        end_time = time.perf_counter()
+    except Exception as e:
+        raise ConnectionError(f"API 请求失败: {e}")
+
+    result = {
+        'response': ''.join(chunks),
+        'latency': end_time - start_time,
+        'ttft': token_times[0] - start_time if token_times else None,
+        'inter_token_latency': (
+            (token_times[-1] - token_times[0]) / (len(token_times) - 1) if len(token_times) > 1 else None
+        ),
+    }
+    if usage:
+        result['prompt_eval_count'] = usage.prompt_tokens
+        result['eval_count'] = usage.completion_tokens
+        # 云端 API 不返回解码耗时, 用首 token 之后的客户端时间估算解码速度
+        decode_time = end_time - token_times[0] if token_times else 0
+        if usage.completion_tokens > 1 and decode_time > 0:
+            result['decode_tokens_per_s'] = (usage.completion_tokens - 1) / decode_time
+    return result
+
+
 def load_dataset(filename):
     if not os.path.exists(filename):
         print(f"错误: 数据集文件 '{filename}' 未找到。")
         exit()
+    if USE_VAL_STORE:
+        return open_val_store(filename)
     with open(filename, 'r', encoding='utf-8') as f:
         return [json.loads(line) for line in f]
 
 
-def load_progress(log_file):
-    completed = set()
-    if os.path.exists(log_file):
-        with open(log_file, 'r', encoding='utf-8') as f:
-            for line in f:
-                try:
-                    log_entry = json.loads(line)
-                    completed.add((log_entry['model_name'], log_entry['index']))
-                except json.JSONDecodeError:
-                    print(f"警告: 日志文件中发现无效行: {line.strip()}")
-    return completed
-
-
 def main():
     print("--- Cloud API 模型性能与错误分析测试 ---")
 
@@ -82,17 +131,24 @@ def main():
     print(f"  - 加载完成，共 {len(dataset)} 条数据。")
 
     print(f"\n[3/5] 正在检查进度日志 '{LOG_FILE}'...")
-    completed_tasks = load_progress(LOG_FILE)
-    print(f"  - 发现 {len(completed_tasks)} 条已完成记录，将自动跳过。")
+    progress = ProgressIndex(LOG_FILE)
+    print(f"  - 发现 {progress.completed_count()} 条已完成记录，将直接跳过。")
 
     print("\n[4/5] 开始执行测试...")
     results = {}
 
-    with open(LOG_FILE, 'a', encoding='utf-8') as log_f:
+    with open_log_for_append(LOG_FILE) as log_f:
         for model_info in eligible_models:
             model_name = model_info['name']
             print(f"\n--- 开始测试模型: {model_name} ---")
 
+            pending = progress.pending_indices(model_name, len(dataset))
+            if not pending:
+                print(f"  - 模型 {model_name} 的 {len(dataset)} 条数据均已完成，跳过。")
+                results[model_name] = {}
+                continue
+            print(f"  - 待测试 {len(pending)} 条，跳过 {len(dataset) - len(pending)} 条已完成记录。")
+
             try:
                 print(f"  - [预检] 正在测试 API 连通性 ({model_name})...")
                 _ = query_cloud_api(prompt="Hello", model=model_name)
@@ -102,40 +158,37 @@ def main():
                 results[model_name] = {'failed_warmup': True, 'error_message': str(e)}
                 continue
 
-            model_results = {
-                'latencies': [], 'response_lengths': [],
-                'correct_count': 0, 'total_count': 0,
-                'failed_count': 0, 'failed_cases': []
-            }
+            model_results = {'failed_count': 0, 'failed_cases': []}
 
-            for i, item in enumerate(dataset):
-                if (model_name, i) in completed_tasks:
-                    print(f"  - [跳过] 数据项 {i + 1}/{len(dataset)} (已在日志中)")
-                    continue
-
-                query, expected_response = item['query'], item['response']
+            for i in pending:
+                query, expected_response = dataset[i]['query'], dataset[i]['response']
                 log_entry = {'model_name': model_name, 'index': i}
 
                 try:
-                    start_time = time.time()
-                    actual_response = query_cloud_api(prompt=query, model=model_name)
-                    latency = time.time() - start_time
+                    stream_stats = {}
+                    if STREAM_MODE:
+                        result = query_cloud_api_stream(prompt=query, model=model_name)
+                        actual_response, latency = result.pop('response'), result.pop('latency')
+                        stream_stats = {k: v for k, v in result.items() if v is not None}
+                    else:
+                        start_time = time.time()
+                        actual_response = query_cloud_api(prompt=query, model=model_name)
+                        latency = time.time() - start_time
 
                     response_len = len(actual_response)
-                    is_correct = actual_response.strip() == expected_response.strip()
-
-                    model_results['latencies'].append(latency)
-                    model_results['response_lengths'].append(response_len)
-                    model_results['total_count'] += 1
+                    score = score_response(task_of(query), expected_response, actual_response)
+                    is_correct = score['exact']
 
                     log_entry.update({
                         'latency': latency,
                         'is_correct': is_correct,
-                        'response_length': response_len
+                        'structured_correct': score['match'],
+                        'error_field': score['error'],
+                        'response_length': response_len,
+                        **stream_stats
                     })
 
                     if is_correct:
-                        model_results['correct_count'] += 1
                         print(
                             f"  - [测试] 数据项 {i + 1}/{len(dataset)} | 状态: 正确 | 延迟: {latency:.2f}s | 长度: {response_len}")
                     else:
@@ -156,11 +209,11 @@ def main():
                         print(f"  - 期望: '{expected_response}' ({expected_semicolons} commands)")
                         print(f"  - 得到: '{actual_response}' ({actual_semicolons} commands)")
 
-                    log_f.write(json.dumps(log_entry, ensure_ascii=False) + '\n')
-                    log_f.flush()
+                    append_log_entry(log_f, progress, log_entry)
 
                 except Exception as e:
                     print(f"  - [错误] 数据项 {i + 1}/{len(dataset)} | 请求失败: {e}")
+                    progress.record_failure(model_name)
                     model_results['failed_count'] += 1
                     if model_results['failed_count'] > 5:
                         print("  - 模型已连续失败多次，跳过该模型的剩余测试。")
@@ -179,11 +232,13 @@ def main():
             print(f"{model_name:<40} | {'N/A':<15} | {'N/A':<20} | {'N/A':<15} | {'API连通性失败':<15}")
             continue
 
-        if res['total_count'] > 0:
-            avg_latency = f"{sum(res['latencies']) / len(res['latencies']):.2f}"
-            avg_len = f"{sum(res['response_lengths']) / len(res['response_lengths']):.0f}"
-            accuracy = f"{(res['correct_count'] / res['total_count']) * 100:.2f}%"
-            count_str = f"{res['correct_count']}/{res['total_count']}"
+        # 汇总数据来自进度索引, 包含历次运行 (而不只是本次运行) 完成的全部数据项
+        summary = progress.summary(model_name)
+        if summary['total_count'] > 0:
+            avg_latency = f"{summary['latency_sum'] / summary['total_count']:.2f}"
+            avg_len = f"{summary['response_length_sum'] / summary['total_count']:.0f}"
+            accuracy = f"{(summary['correct_count'] / summary['total_count']) * 100:.2f}%"
+            count_str = f"{summary['correct_count']}/{summary['total_count']}"
 
             print(f"{model_name:<40} | {avg_latency:<15} | {avg_len:<20} | {accuracy:<15} | {count_str:<10}")
         else:
@@ -191,6 +246,7 @@ def main():
 
     print("=" * 115)
     print(f"\n详细测试日志已保存在 '{LOG_FILE}' 文件中。")
+    progress.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,144 @@
+import json
+import os
+import sys
+from collections import defaultdict
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common.output_grammar import is_valid, truncate_to_grammar
+from common.prompts import TASK_TYPES, task_of
+from test_edge_latency_quantization import DATASET_FILE, constrained_kwargs, load_dataset, ollama_stream
+
+MODEL = "qwen2.5_0.5b_drone_q4:latest"
+
+# 每类任务抽取的样本数; 每条样本分别以 不约束 / 约束 两种方式各请求一次
+SAMPLE_PER_TASK = 100
+
+# 为 True 时约束请求同时发送 GBNF 文法 (服务端需支持 grammar 字段, 例如 llama.cpp server)
+SEND_GBNF_GRAMMAR = False
+
+CONSTRAINED_LOG_FILE = "test_constrained_decoding.jsonl"
+
+VARIANTS = ['unconstrained', 'constrained']
+
+
+def sample_items(dataset):
+    counts = defaultdict(int)
+    sampled = []
+    for i, item in enumerate(dataset):
+        task = task_of(item['query'])
+        if task in TASK_TYPES and counts[task] < SAMPLE_PER_TASK:
+            counts[task] += 1
+            sampled.append({'index': i, 'task': task, 'query': item['query'], 'response': item['response']})
+    return sampled
+
+
+def run_variant(item, variant):
+    # 两种方式都使用流式请求, 延迟包含完整的网络往返; 约束方式在文法完整时断开连接, 并截断到文法完整处
+    if variant == 'constrained':
+        result = ollama_stream(prompt=item['query'], model=MODEL,
+                               **constrained_kwargs(item['query'], True, SEND_GBNF_GRAMMAR))
+        response = truncate_to_grammar(item['task'], result['response'])
+    else:
+        result = ollama_stream(prompt=item['query'], model=MODEL)
+        response = result['response']
+    return {
+        'task': item['task'],
+        'variant': variant,
+        'latency': result['latency'],
+        'eval_count': result.get('eval_count'),
+        'early_stopped': result.get('done_reason') == 'early_stop',
+        'grammar_valid': is_valid(item['task'], response),
+        'is_correct': response.strip() == item['response'].strip(),
+    }
+
+
+def summarize(records):
+    summary = {}
+    for task in TASK_TYPES:
+        task_summary = {}
+        for variant in VARIANTS:
+            rs = [r for r in records if r['task'] == task and r['variant'] == variant]
+            if not rs:
+                continue
+            eval_counts = [r['eval_count'] for r in rs if r['eval_count'] is not None]
+            task_summary[variant] = {
+                'sample_count': len(rs),
+                'accuracy_percent': sum(r['is_correct'] for r in rs) / len(rs) * 100,
+                'grammar_valid_percent': sum(r['grammar_valid'] for r in rs) / len(rs) * 100,
+                'early_stop_percent': sum(r['early_stopped'] for r in rs) / len(rs) * 100,
+                'average_latency_s': float(np.mean([r['latency'] for r in rs])),
+                'p90_latency_s': float(np.percentile([r['latency'] for r in rs], 90)),
+                'average_eval_count': float(np.mean(eval_counts)) if eval_counts else None,
+            }
+        if len(task_summary) == len(VARIANTS):
+            base, constrained = task_summary['unconstrained'], task_summary['constrained']
+            task_summary['latency_saved_percent'] = (
+                (1 - constrained['average_latency_s'] / base['average_latency_s']) * 100
+                if base['average_latency_s'] else 0.0
+            )
+            task_summary['accuracy_gain_points'] = constrained['accuracy_percent'] - base['accuracy_percent']
+        if task_summary:
+            summary[task] = task_summary
+    return summary
+
+
+def main():
+    print("--- 约束解码 (任务文法 + num_predict + 提前停止) 测试 ---")
+
+    print(f"\n[1/3] 正在加载数据集 '{DATASET_FILE}'...")
+    dataset = load_dataset(DATASET_FILE)
+    if not dataset:
+        return
+    items = sample_items(dataset)
+
+    print(f"\n[2/3] 每类任务抽取 {SAMPLE_PER_TASK} 条, 在模型 {MODEL} 上对比 不约束 / 约束 两种解码...")
+    try:
+        ollama_stream(prompt="Hello", model=MODEL)
+    except Exception as e:
+        print(f"  - [错误] 模型 {MODEL} 预热失败: {e}")
+        return
+
+    records = []
+    for n, item in enumerate(items):
+        # 两种方式交替请求同一条样本, 避免服务端负载随时间变化造成偏差
+        for variant in (VARIANTS if n % 2 == 0 else VARIANTS[::-1]):
+            try:
+                records.append(run_variant(item, variant))
+            except Exception as e:
+                print(f"    - [错误] 数据项 {item['index'] + 1} ({variant}) 请求失败: {e}")
+        if (n + 1) % 50 == 0:
+            print(f"  - 已完成 {n + 1}/{len(items)} 条")
+
+    summary = summarize(records)
+    print("\n[3/3] 测试结果:")
+    print(f"{'任务':<12} | {'方式':<14} | {'准确率':<9} | {'文法合法':<9} | {'提前停止':<9} | {'平均延迟 (s)':<12} | "
+          f"{'P90 (s)':<8} | {'平均输出 token':<12}")
+    print("-" * 110)
+    for task, task_summary in summary.items():
+        for variant in VARIANTS:
+            s = task_summary.get(variant)
+            if s is None:
+                continue
+            accuracy = f"{s['accuracy_percent']:.2f}%"
+            valid = f"{s['grammar_valid_percent']:.2f}%"
+            early_stop = f"{s['early_stop_percent']:.2f}%"
+            eval_count = f"{s['average_eval_count']:.1f}" if s['average_eval_count'] is not None else 'N/A'
+            print(f"{task:<12} | {variant:<14} | {accuracy:<9} | {valid:<9} | {early_stop:<9} | "
+                  f"{s['average_latency_s']:<12.3f} | {s['p90_latency_s']:<8.3f} | {eval_count:<12}")
+        if 'latency_saved_percent' in task_summary:
+            print(f"{'':<12}   延迟节省 {task_summary['latency_saved_percent']:.2f}%, "
+                  f"准确率变化 {task_summary['accuracy_gain_points']:+.2f} 个百分点")
+
+    with open(CONSTRAINED_LOG_FILE, 'a', encoding='utf-8') as log_f:
+        log_f.write(json.dumps({
+            'model_name': MODEL,
+            'send_gbnf_grammar': SEND_GBNF_GRAMMAR,
+            'summary': summary,
+        }, ensure_ascii=False) + '\n')
+    print(f"\n详细结果已保存在 '{CONSTRAINED_LOG_FILE}' 文件中。")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+import json
+import os
+import sys
+import time
+from collections import defaultdict
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common.fast_path import FAST_PATH_PARSERS, fast_path
+from common.prompts import split_query
+from test_edge_latency_quantization import DATASET_FILE, load_dataset, ollama_generate
+
+# 规则不确定时回退到的端侧模型
+FALLBACK_MODEL = "qwen2.5_0.5b_drone_q4:latest"
+
+# 端到端对比时每类任务抽取的样本数 (这些样本全部再请求一次模型作为基线); 规则本身在全部验证集上评估
+SAMPLE_PER_TASK = 200
+
+# 为 False 时只评估规则的覆盖率、准确率与耗时, 不请求模型
+QUERY_MODEL = True
+
+FAST_PATH_LOG_FILE = "test_fast_path.jsonl"
+
+
+def evaluate_rules(dataset):
+    # 在全部 problem_3 / problem_4 样本上运行规则, 返回每条样本的规则结果
+    items = []
+    for i, item in enumerate(dataset):
+        task, _, user_input, _ = split_query(item['query'])
+        if task not in FAST_PATH_PARSERS:
+            continue
+        start_time = time.perf_counter()
+        answer = fast_path(task, user_input)
+        rule_latency = time.perf_counter() - start_time
+        items.append({
+            'index': i,
+            'task': task,
+            'query': item['query'],
+            'response': item['response'],
+            'answer': answer,
+            'rule_latency': rule_latency,
+        })
+    return items
+
+
+def summarize_rules(items):
+    summary = {}
+    for task in FAST_PATH_PARSERS:
+        task_items = [item for item in items if item['task'] == task]
+        covered = [item for item in task_items if item['answer'] is not None]
+        summary[task] = {
+            'total_count': len(task_items),
+            'covered_count': len(covered),
+            'coverage_percent': len(covered) / max(len(task_items), 1) * 100,
+            'covered_accuracy_percent': (
+                sum(item['answer'].strip() == item['response'].strip() for item in covered) / len(covered) * 100
+                if covered else None
+            ),
+            'average_rule_latency_us': float(np.mean([item['rule_latency'] for item in task_items]) * 1e6)
+            if task_items else None,
+        }
+    return summary
+
+
+def sample_items(items):
+    counts = defaultdict(int)
+    sampled = []
+    for item in items:
+        if counts[item['task']] < SAMPLE_PER_TASK:
+            counts[item['task']] += 1
+            sampled.append(item)
+    return sampled
+
+
+def compare_with_model(items):
+    # 基线: 全部请求模型; 快速通道: 规则命中时直接返回, 否则再请求模型 (延迟为规则耗时 + 模型耗时)
+    records = []
+    for item in items:
+        try:
+            start_time = time.perf_counter()
+            result = ollama_generate(prompt=item['query'], model=FALLBACK_MODEL)
+            model_latency = time.perf_counter() - start_time
+        except Exception as e:
+            print(f"    - [错误] 数据项 {item['index'] + 1} 请求失败: {e}")
+            continue
+        model_correct = result['response'].strip() == item['response'].strip()
+        covered = item['answer'] is not None
+        records.append({
+            'task': item['task'],
+            'covered': covered,
+            'baseline_latency': model_latency,
+            'baseline_correct': model_correct,
+            'fast_path_latency': item['rule_latency'] + (0 if covered else model_latency),
+            'fast_path_correct': item['answer'].strip() == item['response'].strip() if covered else model_correct,
+        })
+
+    summary = {}
+    for task in FAST_PATH_PARSERS:
+        task_records = [r for r in records if r['task'] == task]
+        if not task_records:
+            continue
+        baseline_latency = float(np.mean([r['baseline_latency'] for r in task_records]))
+        fast_path_latency = float(np.mean([r['fast_path_latency'] for r in task_records]))
+        summary[task] = {
+            'sample_count': len(task_records),
+            'baseline_accuracy_percent': sum(r['baseline_correct'] for r in task_records) / len(task_records) * 100,
+            'fast_path_accuracy_percent': sum(r['fast_path_correct'] for r in task_records) / len(task_records) * 100,
+            'baseline_average_latency_s': baseline_latency,
+            'fast_path_average_latency_s': fast_path_latency,
+            'latency_saved_percent': (1 - fast_path_latency / baseline_latency) * 100 if baseline_latency else 0.0,
+        }
+    return summary
+
+
+def main():
+    print("--- 规则快速通道测试 ---")
+
+    print(f"\n[1/3] 正在加载数据集 '{DATASET_FILE}'...")
+    dataset = load_dataset(DATASET_FILE)
+    if not dataset:
+        return
+
+    print(f"\n[2/3] 在全部 {', '.join(FAST_PATH_PARSERS)} 样本上运行规则...")
+    items = evaluate_rules(dataset)
+    rule_summary = summarize_rules(items)
+    print(f"{'任务':<12} | {'样本数':<8} | {'命中数':<8} | {'覆盖率':<10} | {'命中准确率':<12} | {'规则耗时 (us/条)':<16}")
+    print("-" * 85)
+    for task, s in rule_summary.items():
+        accuracy = f"{s['covered_accuracy_percent']:.2f}%" if s['covered_accuracy_percent'] is not None else 'N/A'
+        latency = f"{s['average_rule_latency_us']:.1f}" if s['average_rule_latency_us'] is not None else 'N/A'
+        coverage = f"{s['coverage_percent']:.2f}%"
+        print(f"{task:<12} | {s['total_count']:<8} | {s['covered_count']:<8} | {coverage:<10} | {accuracy:<12} | "
+              f"{latency:<16}")
+
+    model_summary = {}
+    if QUERY_MODEL:
+        sampled = sample_items(items)
+        print(f"\n[3/3] 每类任务抽取 {SAMPLE_PER_TASK} 条, 与模型 {FALLBACK_MODEL} 对比端到端延迟...")
+        try:
+            ollama_generate(prompt="Hello", model=FALLBACK_MODEL)
+        except Exception as e:
+            print(f"  - [错误] 模型 {FALLBACK_MODEL} 预热失败: {e}。只报告规则结果。")
+        else:
+            model_summary = compare_with_model(sampled)
+            print(f"{'任务':<12} | {'模型准确率':<10} | {'快速通道准确率':<12} | {'模型延迟 (s)':<12} | "
+                  f"{'快速通道延迟 (s)':<15} | {'延迟节省':<10}")
+            print("-" * 95)
+            for task, s in model_summary.items():
+                baseline_accuracy = f"{s['baseline_accuracy_percent']:.2f}%"
+                fast_path_accuracy = f"{s['fast_path_accuracy_percent']:.2f}%"
+                print(f"{task:<12} | {baseline_accuracy:<10} | {fast_path_accuracy:<12} | "
+                      f"{s['baseline_average_latency_s']:<12.3f} | {s['fast_path_average_latency_s']:<15.3f} | "
+                      f"{s['latency_saved_percent']:.2f}%")
+    else:
+        print("\n[3/3] QUERY_MODEL = False, 跳过模型对比。")
+
+    with open(FAST_PATH_LOG_FILE, 'a', encoding='utf-8') as log_f:
+        log_f.write(json.dumps({
+            'fallback_model': FALLBACK_MODEL,
+            'rules': rule_summary,
+            'end_to_end': model_summary,
+        }, ensure_ascii=False) + '\n')
+    print(f"\n详细结果已保存在 '{FAST_PATH_LOG_FILE}' 文件中。")
+
+
+if __name__ == "__main__":
+    main()
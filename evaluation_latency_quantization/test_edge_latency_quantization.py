@@ -1,17 +1,131 @@
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import json
 import time
 import os
+import random
+import sys
 import re
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import nullcontext
+import numpy as np
 
-OLLAMA_API_URL = "http://192.168.137.37:11434/api/generate"
+from model_scheduler import (
+    MEMORY_BUDGET_GB, MODEL_LOAD_LOG_FILE, api_base_url, exclusive_models, list_server_models, measure_cold_start,
+    plan_phases, run_schedule
+)
+from progress_index import ProgressIndex, append_log_entry, open_log_for_append
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common.output_grammar import GBNF_GRAMMARS, generation_options, is_valid, truncate_to_grammar
+from common.prompts import (
+    CLASS_TASKS, FUSED_TASK, OTHER_CLASS, render_query, split_fused_response, split_query, task_of
+)
+from common.response_cache import ResponseCache
+from common.scoring import score_response
+from common.val_store import open_val_store
+
+# 可通过环境变量指向本地 mock 服务 (见 mock_inference_server.py), 例如 http://127.0.0.1:18000/api/generate
+OLLAMA_API_URL = os.environ.get("OLLAMA_API_URL", "http://192.168.137.37:11434/api/generate")
 
 DATASET_FILE = "val_dataset_swift_4_type_new_yolo_9.jsonl"
 
+# 为 True 时通过内存映射的验证集存储文件 (.lmvs, 首次运行时自动生成) 读取数据, 不再解析整个 jsonl
+USE_VAL_STORE = True
+
 LOG_FILE = "test_progress.jsonl"
 
+OLLAMA_BASE_URL = api_base_url(OLLAMA_API_URL)
+
 MAX_SIZE_GB = 3.0
 
+# 为 True 时从服务端读取模型列表, 按 MEMORY_BUDGET_GB 规划各阶段同时常驻的模型, 阶段之间显式卸载,
+# 并将冷启动 (加载) 耗时与热推理延迟分开记录到 MODEL_LOAD_LOG_FILE
+USE_SCHEDULER = True
+
+# 测试模式: "sequential" 逐条测试并写入 LOG_FILE; "concurrent" 按并发度扫描吞吐量;
+# "pipeline" 对比 "先分类再抽取" 的两次调用与合并任务 (fused) 的单次调用;
+# "cache_replay" 按重复分布回放验证集, 对比有无回答缓存时的延迟
+# 注意: Ollama 服务端需设置 OLLAMA_NUM_PARALLEL >= 最大并发度, 否则请求会在服务端排队
+BENCHMARK_MODE = "sequential"
+
+CONCURRENCY_LEVELS = [1, 2, 4, 8]
+
+# 单个模型允许的最大并发度, 未列出的模型使用 CONCURRENCY_LEVELS 中的全部档位
+MODEL_MAX_CONCURRENCY = {
+    "qwen2.5_3b_drone_q4:latest": 4,
+    "phi3.5-mini_drone_q4:latest": 4,
+}
+
+CONCURRENCY_SAMPLE_SIZE = 400
+
+CONCURRENCY_LOG_FILE = "test_concurrency.jsonl"
+
+# pipeline 模式: 两次调用链使用的模型 (problem_1 分类 + problem_2/3/4 抽取) 与在合并任务数据集
+# (merge_data.py 生成的 *_fused_* 数据集) 上微调的模型
+CHAINED_MODEL = "qwen2.5_0.5b_drone_q4:latest"
+
+FUSED_MODEL = "qwen2.5_0.5b_drone_fused_q4:latest"
+
+# pipeline 模式下每个类别 (A/B/C/D) 抽取的样本数
+PIPELINE_SAMPLE_PER_CLASS = 100
+
+PIPELINE_LOG_FILE = "test_pipeline.jsonl"
+
+# 为 True 时 ollama() 先查回答缓存 (键为模板 + 归一化的用户输入), 命中时不再请求模型
+USE_RESPONSE_CACHE = False
+
+RESPONSE_CACHE_MAX_ENTRIES = 4096
+
+# 缓存条目的有效期 (秒), None 表示不过期
+RESPONSE_CACHE_TTL_S = 24 * 3600
+
+# 缓存的 sqlite 持久化文件, None 表示只保存在内存中
+RESPONSE_CACHE_FILE = "response_cache.sqlite"
+
+# cache_replay 模式: 请求总数、被重复使用的不同指令数, 以及指令热度服从的 Zipf 分布指数
+# (操作员反复下达少数几条常用指令, 排名第 k 的指令被选中的概率与 1 / k^s 成正比)
+CACHE_REPLAY_MODEL = "qwen2.5_0.5b_drone_q4:latest"
+
+CACHE_REPLAY_REQUESTS = 1000
+
+CACHE_REPLAY_DISTINCT = 300
+
+CACHE_ZIPF_S = 1.1
+
+# 重复下达时改变大小写、标点、全角/半角或空白的概率, 模拟操作员每次的输入不完全一致
+CACHE_VARIANT_RATE = 0.5
+
+CACHE_REPLAY_SEED = 0
+
+CACHE_REPLAY_LOG_FILE = "test_cache_replay.jsonl"
+
+# 是否复用 HTTP 连接 (keep-alive 连接池); 关闭时每个请求都新建 TCP 连接
+USE_CONNECTION_POOL = True
+
+# 为 True 时, 正式测试前对每个模型分别在 复用/不复用 连接下测试一小批数据并对比延迟
+COMPARE_CONNECTION_REUSE = False
+
+CONNECTION_COMPARE_SAMPLE_SIZE = 50
+
+CONNECTION_COMPARE_LOG_FILE = "test_connection_reuse.jsonl"
+
+# 流式模式: 额外记录首 token 延迟 (TTFT)、token 间延迟以及服务端返回的 eval/prompt_eval 统计
+STREAM_MODE = False
+
+# 约束解码: 按任务附加 num_predict 上限与换行停止符 (common/output_grammar.py), 并把回答截断到任务文法
+# 第一次完整的位置; 流式模式下文法一旦完整就断开连接, 不再等待模型输出结束 token
+CONSTRAINED_DECODING = False
+
+# 同时在请求中发送任务的 GBNF 文法 (grammar 字段), 仅当服务端支持时有效 (例如 llama.cpp server)
+SEND_GBNF_GRAMMAR = False
+
+HTTP_MAX_RETRIES = 3
+
+HTTP_BACKOFF_FACTOR = 0.5
+
 OLLAMA_LIST_OUTPUT = """
 NAME                                     ID            SIZE      MODIFIED      
 qwen2.5_0.5b_drone_f16:latest            f8f9bcb1d4c7  994 MB    15 minutes ago  
@@ -33,13 +147,455 @@ deepseek-r1-qwen2.5-1.5b_drone_q4:latest   c802c1a9151b  1.1 GB    30 minutes ag
 """
 
 
-def ollama(prompt="1+1=?", model="xxx", system=''):
-    t_json = {"model": model, "prompt": prompt, 'stream': False, "keep_alive": -1}
+def create_session(pool_size):
+    retry = Retry(total=HTTP_MAX_RETRIES, backoff_factor=HTTP_BACKOFF_FACTOR,
+                  status_forcelist=[429, 500, 502, 503, 504], allowed_methods=None)
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+SESSION = create_session(max(CONCURRENCY_LEVELS))
+
+
+def request_payload(prompt, model, system, stream, options=None, grammar=None):
+    t_json = {"model": model, "prompt": prompt, 'stream': stream, "keep_alive": -1}
     if system:
         t_json['system'] = system
-    r = requests.post(OLLAMA_API_URL, timeout=600, json=t_json)
+    if options:
+        t_json['options'] = options
+    if grammar:
+        # GBNF 文法, 只有支持 grammar 字段的服务端 (llama.cpp server 等) 会在解码时使用, Ollama 会忽略该字段
+        t_json['grammar'] = grammar
+    return t_json
+
+
+def ollama_generate(prompt="1+1=?", model="xxx", system='', reuse_connection=None, options=None, grammar=None):
+    if reuse_connection is None:
+        reuse_connection = USE_CONNECTION_POOL
+    t_json = request_payload(prompt, model, system, False, options, grammar)
+    if reuse_connection:
+        r = SESSION.post(OLLAMA_API_URL, timeout=600, json=t_json)
+    else:
+        r = requests.post(OLLAMA_API_URL, timeout=600, json=t_json, headers={'Connection': 'close'})
     r.raise_for_status()
-    return r.json()['response']
+    return r.json()
+
+
+def ollama_stream(prompt="1+1=?", model="xxx", system='', reuse_connection=None, options=None, grammar=None,
+                  stop_when=None):
+    # stop_when(已生成的文本) 返回 True 时提前关闭连接, 服务端随之停止生成 (例如输出已满足任务文法)
+    if reuse_connection is None:
+        reuse_connection = USE_CONNECTION_POOL
+    t_json = request_payload(prompt, model, system, True, options, grammar)
+    post = SESSION.post if reuse_connection else requests.post
+
+    chunks, token_times, final = [], [], {}
+    start_time = time.perf_counter()
+    with post(OLLAMA_API_URL, timeout=600, json=t_json, stream=True) as r:
+        r.raise_for_status()
+        for line in r.iter_lines(chunk_size=None):
+            if not line:
+                continue
+            data = json.loads(line)
+            if data.get('response'):
+                token_times.append(time.perf_counter())
+                chunks.append(data['response'])
+                if stop_when is not None and stop_when(''.join(chunks)):
+                    break
+            if data.get('done'):
+                final = data
+    end_time = time.perf_counter()
+
+    result = dict(final)
+    if not final and stop_when is not None:
+        # 提前停止时没有服务端的最终统计, 以收到的 token 数作为 eval_count
+        result.update({'eval_count': len(chunks), 'done_reason': 'early_stop'})
+    result.update({
+        'response': ''.join(chunks),
+        'latency': end_time - start_time,
+        'ttft': token_times[0] - start_time if token_times else None,
+        'inter_token_latency': (
+            (token_times[-1] - token_times[0]) / (len(token_times) - 1) if len(token_times) > 1 else None
+        ),
+    })
+    return result
+
+
+RESPONSE_CACHE = ResponseCache(RESPONSE_CACHE_MAX_ENTRIES, RESPONSE_CACHE_TTL_S, RESPONSE_CACHE_FILE) \
+    if USE_RESPONSE_CACHE else None
+
+
+def constrained_kwargs(query, stream, send_grammar=None):
+    # ollama_generate / ollama_stream 的约束解码参数; 不匹配任何任务模板的 query 不加约束
+    if send_grammar is None:
+        send_grammar = SEND_GBNF_GRAMMAR
+    task = task_of(query)
+    if task is None:
+        return {}
+    kwargs = {'options': generation_options(task)}
+    if send_grammar:
+        kwargs['grammar'] = GBNF_GRAMMARS[task]
+    if stream:
+        kwargs['stop_when'] = lambda text: is_valid(task, text)
+    return kwargs
+
+
+def ollama(prompt="1+1=?", model="xxx", system='', cache=None):
+    cache = cache or RESPONSE_CACHE
+    if cache is not None:
+        response = cache.get(model, prompt, system)
+        if response is not None:
+            return response
+    response = ollama_generate(prompt=prompt, model=model, system=system)['response']
+    if cache is not None:
+        cache.put(model, prompt, response, system)
+    return response
+
+
+def server_latency(result):
+    # Ollama 返回的 total_duration 单位为纳秒, 不包含网络与连接建立时间
+    total_duration = result.get('total_duration')
+    return total_duration / 1e9 if total_duration else None
+
+
+def server_stats(result):
+    # 服务端统计的各项耗时单位为纳秒, 统一换算为秒
+    stats = {}
+    for key in ('prompt_eval_count', 'eval_count'):
+        if result.get(key) is not None:
+            stats[key] = result[key]
+    for key in ('prompt_eval_duration', 'eval_duration', 'load_duration'):
+        if result.get(key) is not None:
+            stats[key] = result[key] / 1e9
+    if stats.get('eval_count') and stats.get('eval_duration'):
+        stats['decode_tokens_per_s'] = stats['eval_count'] / stats['eval_duration']
+    for key in ('ttft', 'inter_token_latency'):
+        if result.get(key) is not None:
+            stats[key] = result[key]
+    return stats
+
+
+def compare_connection_reuse(model_name, items):
+    summary = {'model_name': model_name, 'sample_size': len(items)}
+    for reuse_connection in (False, True):
+        latencies, overheads = [], []
+        for item in items:
+            try:
+                start_time = time.perf_counter()
+                result = ollama_generate(prompt=item['query'], model=model_name, reuse_connection=reuse_connection)
+                latency = time.perf_counter() - start_time
+            except Exception as e:
+                print(f"    - [错误] 请求失败: {e}")
+                continue
+            latencies.append(latency)
+            server_time = server_latency(result)
+            if server_time is not None:
+                overheads.append(latency - server_time)
+
+        key = 'reuse' if reuse_connection else 'no_reuse'
+        summary[f'{key}_average_latency_s'] = float(np.mean(latencies)) if latencies else None
+        summary[f'{key}_p95_latency_s'] = float(np.percentile(latencies, 95)) if latencies else None
+        summary[f'{key}_average_overhead_s'] = float(np.mean(overheads)) if overheads else None
+
+    with open(CONNECTION_COMPARE_LOG_FILE, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(summary, ensure_ascii=False) + '\n')
+
+    for key, label in (('no_reuse', '不复用连接'), ('reuse', '复用连接')):
+        avg = summary[f'{key}_average_latency_s']
+        overhead = summary[f'{key}_average_overhead_s']
+        avg_str = f"{avg:.4f}s" if avg is not None else 'N/A'
+        overhead_str = f"{overhead * 1000:.2f}ms" if overhead is not None else 'N/A'
+        print(f"  - [连接对比] {label}: 平均延迟 {avg_str} | 平均网络/连接开销 {overhead_str}")
+    return summary
+
+
+def timed_ollama(prompt, model):
+    start_time = time.perf_counter()
+    actual_response = ollama(prompt=prompt, model=model)
+    return actual_response, time.perf_counter() - start_time
+
+
+def run_concurrency_level(model_name, items, concurrency):
+    latencies = []
+    correct_count = 0
+    failed_count = 0
+
+    wall_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = {pool.submit(timed_ollama, item['query'], model_name): item for item in items}
+        for future in as_completed(futures):
+            item = futures[future]
+            try:
+                actual_response, latency = future.result()
+            except Exception as e:
+                print(f"    - [错误] 并发请求失败: {e}")
+                failed_count += 1
+                continue
+            latencies.append(latency)
+            if actual_response.strip() == item['response'].strip():
+                correct_count += 1
+    wall_time = time.perf_counter() - wall_start
+
+    summary = {
+        'model_name': model_name,
+        'concurrency': concurrency,
+        'total_count': len(latencies),
+        'failed_count': failed_count,
+        'wall_time_s': wall_time,
+        'throughput_rps': len(latencies) / wall_time if wall_time > 0 else 0,
+        'accuracy_percent': correct_count / len(latencies) * 100 if latencies else 0,
+    }
+    if latencies:
+        summary.update({
+            'average_latency_s': float(np.mean(latencies)),
+            'p50_latency_s': float(np.percentile(latencies, 50)),
+            'p95_latency_s': float(np.percentile(latencies, 95)),
+            'max_latency_s': float(np.max(latencies)),
+        })
+    return summary
+
+
+def run_concurrency_sweep(models, dataset):
+    items = dataset[:CONCURRENCY_SAMPLE_SIZE]
+    print(f"\n[3/4] 并发模式: 每个并发档位测试 {len(items)} 条数据, 档位 {CONCURRENCY_LEVELS}")
+
+    print("\n[4/4] 开始执行并发测试...")
+    summaries = []
+    with open(CONCURRENCY_LOG_FILE, 'a', encoding='utf-8') as log_f:
+        for model_info in models:
+            model_name = model_info['name']
+            print(f"\n--- 开始并发测试模型: {model_name} ---")
+
+            try:
+                _ = ollama(prompt="Hello", model=model_name)
+            except Exception as e:
+                print(f"  - [错误] 模型 {model_name} 预热失败: {e}。将跳过此模型。")
+                continue
+
+            max_concurrency = MODEL_MAX_CONCURRENCY.get(model_name, max(CONCURRENCY_LEVELS))
+            for concurrency in [c for c in CONCURRENCY_LEVELS if c <= max_concurrency]:
+                summary = run_concurrency_level(model_name, items, concurrency)
+                summaries.append(summary)
+                log_f.write(json.dumps(summary, ensure_ascii=False) + '\n')
+                log_f.flush()
+                print(f"  - [并发 {concurrency}] 吞吐量: {summary['throughput_rps']:.2f} req/s | "
+                      f"平均延迟: {summary.get('average_latency_s', 0):.2f}s | "
+                      f"P95: {summary.get('p95_latency_s', 0):.2f}s | 失败: {summary['failed_count']}")
+
+    print("\n================================ 并发测试总结 ================================")
+    print(f"{'模型名称':<40} | {'并发度':<6} | {'吞吐量 (req/s)':<15} | {'平均延迟 (s)':<12} | {'P95 (s)':<10} | {'准确率':<10}")
+    print("-" * 115)
+    for s in summaries:
+        print(f"{s['model_name']:<40} | {s['concurrency']:<6} | {s['throughput_rps']:<15.2f} | "
+              f"{s.get('average_latency_s', 0):<12.2f} | {s.get('p95_latency_s', 0):<10.2f} | "
+              f"{s['accuracy_percent']:.2f}%")
+    print("=" * 115)
+    print(f"\n并发测试结果已保存在 '{CONCURRENCY_LOG_FILE}' 文件中。")
+
+
+def pipeline_items(dataset):
+    # 从验证集中取出用户输入及其类别与期望的抽取结果: problem_2/3/4 的样本对应 A/B/C,
+    # problem_1 中回答为 "D." 的样本对应其他类 (没有抽取结果)
+    task_classes = {task: label for label, task in CLASS_TASKS.items()}
+    counts = {}
+    items = []
+    for i, item in enumerate(dataset):
+        task, _, user_input, _ = split_query(item['query'])
+        if task in task_classes:
+            label, expected = task_classes[task], item['response'].strip()
+        elif task == 'problem_1' and item['response'].strip() == f"{OTHER_CLASS}.":
+            label, expected = OTHER_CLASS, ''
+        else:
+            continue
+        if counts.get(label, 0) < PIPELINE_SAMPLE_PER_CLASS:
+            counts[label] = counts.get(label, 0) + 1
+            items.append({'index': i, 'label': label, 'user_input': user_input, 'expected': expected})
+    return items
+
+
+def timed_generate(prompt, model):
+    start_time = time.perf_counter()
+    result = ollama_generate(prompt=prompt, model=model)
+    return result, time.perf_counter() - start_time
+
+
+def run_chained(item):
+    # 第一次调用分类, 类别为 A/B/C 时再用对应任务的模板调用一次抽取
+    result, latency = timed_generate(render_query('problem_1', item['user_input']), CHAINED_MODEL)
+    label = split_fused_response(result['response'])[0]
+    prompt_eval_count, calls, output = result.get('prompt_eval_count', 0), 1, ''
+    if label in CLASS_TASKS:
+        result, extract_latency = timed_generate(render_query(CLASS_TASKS[label], item['user_input']), CHAINED_MODEL)
+        latency += extract_latency
+        prompt_eval_count += result.get('prompt_eval_count', 0)
+        calls += 1
+        output = result['response'].strip()
+    return label, output, latency, calls, prompt_eval_count
+
+
+def run_fused(item):
+    result, latency = timed_generate(render_query(FUSED_TASK, item['user_input']), FUSED_MODEL)
+    label, output = split_fused_response(result['response'])
+    return label, output, latency, 1, result.get('prompt_eval_count', 0)
+
+
+def summarize_pipeline(mode, records):
+    summary = {'mode': mode, 'total_count': len(records)}
+    if records:
+        latencies = [r['latency'] for r in records]
+        summary.update({
+            'accuracy_percent': sum(r['is_correct'] for r in records) / len(records) * 100,
+            'class_accuracy_percent': sum(r['class_correct'] for r in records) / len(records) * 100,
+            'average_latency_s': float(np.mean(latencies)),
+            'p95_latency_s': float(np.percentile(latencies, 95)),
+            'average_calls': float(np.mean([r['calls'] for r in records])),
+            'average_prompt_eval_count': float(np.mean([r['prompt_eval_count'] for r in records])),
+        })
+    return summary
+
+
+def run_pipeline_comparison(dataset):
+    items = pipeline_items(dataset)
+    print(f"\n[3/4] pipeline 模式: 每个类别抽取至多 {PIPELINE_SAMPLE_PER_CLASS} 条, 共 {len(items)} 条")
+
+    print("\n[4/4] 开始对比两次调用链与合并任务...")
+    summaries = []
+    with open(PIPELINE_LOG_FILE, 'a', encoding='utf-8') as log_f:
+        for mode, model_name, run in (('chained', CHAINED_MODEL, run_chained), ('fused', FUSED_MODEL, run_fused)):
+            print(f"\n--- [{mode}] 模型: {model_name} ---")
+            try:
+                _ = ollama(prompt="Hello", model=model_name)
+            except Exception as e:
+                print(f"  - [错误] 模型 {model_name} 预热失败: {e}。将跳过此模式。")
+                continue
+            records = []
+            for item in items:
+                try:
+                    label, output, latency, calls, prompt_eval_count = run(item)
+                except Exception as e:
+                    print(f"    - [错误] 数据项 {item['index'] + 1} 请求失败: {e}")
+                    continue
+                class_correct = label == item['label']
+                records.append({
+                    'label': item['label'],
+                    'latency': latency,
+                    'calls': calls,
+                    'prompt_eval_count': prompt_eval_count,
+                    'class_correct': class_correct,
+                    'is_correct': class_correct and output == item['expected'],
+                })
+            for label in [None] + sorted({item['label'] for item in items}):
+                summary = summarize_pipeline(mode, [r for r in records if label is None or r['label'] == label])
+                summary.update({'model_name': model_name, 'label': label or 'all'})
+                summaries.append(summary)
+                log_f.write(json.dumps(summary, ensure_ascii=False) + '\n')
+
+    print("\n================================ 调用链 vs 合并任务 ================================")
+    print(f"{'模式':<8} | {'类别':<4} | {'样本数':<6} | {'准确率':<8} | {'分类准确率':<10} | {'平均延迟 (s)':<12} | "
+          f"{'P95 (s)':<8} | {'调用次数':<8} | {'Prompt tokens':<13}")
+    print("-" * 115)
+    for s in summaries:
+        if not s['total_count']:
+            continue
+        accuracy, class_accuracy = f"{s['accuracy_percent']:.2f}%", f"{s['class_accuracy_percent']:.2f}%"
+        print(f"{s['mode']:<8} | {s['label']:<4} | {s['total_count']:<6} | {accuracy:<8} | {class_accuracy:<10} | "
+              f"{s['average_latency_s']:<12.3f} | {s['p95_latency_s']:<8.3f} | {s['average_calls']:<8.2f} | "
+              f"{s['average_prompt_eval_count']:<13.1f}")
+    print("=" * 115)
+    print("注意: 准确率要求类别与抽取结果都正确; 调用链中分类错误时会用错误的模板抽取 (或不抽取)。")
+    print(f"\n详细结果已保存在 '{PIPELINE_LOG_FILE}' 文件中。")
+
+
+def perturb_input(text, rng):
+    # 生成同一条指令的另一种写法: 大小写、结尾标点、全角/半角或空白的变化
+    choice = rng.randrange(4)
+    if choice == 0:
+        return text.upper() if rng.random() < 0.5 else text.lower()
+    if choice == 1:
+        return text.rstrip('.!?。！？') + rng.choice(['', '!', '。', '?', '..'])
+    if choice == 2:
+        return ''.join(chr(ord(ch) + 0xFEE0) if '!' <= ch <= '~' else '\u3000' if ch == ' ' else ch for ch in text)
+    return '  '.join(text.split(' ')) + ' '
+
+
+def cache_replay_stream(dataset):
+    # 从验证集中取 CACHE_REPLAY_DISTINCT 条作为常用指令, 按 Zipf 分布抽取 CACHE_REPLAY_REQUESTS 次请求
+    rng = random.Random(CACHE_REPLAY_SEED)
+    indices = rng.sample(range(len(dataset)), min(CACHE_REPLAY_DISTINCT, len(dataset)))
+    weights = [1 / rank ** CACHE_ZIPF_S for rank in range(1, len(indices) + 1)]
+    stream = []
+    for i in rng.choices(indices, weights=weights, k=CACHE_REPLAY_REQUESTS):
+        item = dataset[i]
+        task, prefix, user_input, suffix = split_query(item['query'])
+        if task is not None and rng.random() < CACHE_VARIANT_RATE:
+            user_input = perturb_input(user_input, rng)
+        stream.append({'index': i, 'query': prefix + user_input + suffix, 'response': item['response']})
+    return stream
+
+
+def replay_requests(stream, cache):
+    latencies, correct_count = [], 0
+    for item in stream:
+        try:
+            start_time = time.perf_counter()
+            actual_response = ollama(prompt=item['query'], model=CACHE_REPLAY_MODEL, cache=cache) if cache \
+                else ollama_generate(prompt=item['query'], model=CACHE_REPLAY_MODEL)['response']
+            latencies.append(time.perf_counter() - start_time)
+        except Exception as e:
+            print(f"    - [错误] 数据项 {item['index'] + 1} 请求失败: {e}")
+            continue
+        correct_count += actual_response.strip() == item['response'].strip()
+    summary = {'total_count': len(latencies),
+               'accuracy_percent': correct_count / len(latencies) * 100 if latencies else 0}
+    if latencies:
+        summary.update({
+            'average_latency_s': float(np.mean(latencies)),
+            'p50_latency_s': float(np.percentile(latencies, 50)),
+            'p95_latency_s': float(np.percentile(latencies, 95)),
+        })
+    return summary
+
+
+def run_cache_replay(dataset):
+    stream = cache_replay_stream(dataset)
+    distinct = len({item['index'] for item in stream})
+    print(f"\n[3/4] cache_replay 模式: {len(stream)} 次请求, 涉及 {distinct} 条不同指令 "
+          f"(Zipf s={CACHE_ZIPF_S}, 变体比例 {CACHE_VARIANT_RATE:.0%})")
+
+    print(f"\n[4/4] 使用模型 {CACHE_REPLAY_MODEL} 回放...")
+    try:
+        _ = ollama_generate(prompt="Hello", model=CACHE_REPLAY_MODEL)
+    except Exception as e:
+        print(f"  - [错误] 模型 {CACHE_REPLAY_MODEL} 预热失败: {e}")
+        return
+    # 对比用的缓存只保存在内存中且为空, 避免受到 RESPONSE_CACHE_FILE 中已有条目的影响
+    cache = ResponseCache(RESPONSE_CACHE_MAX_ENTRIES, RESPONSE_CACHE_TTL_S)
+    summaries = {'no_cache': replay_requests(stream, None), 'cache': replay_requests(stream, cache)}
+    summaries['cache'].update(cache.stats())
+
+    print("\n================================ 回答缓存回放 ================================")
+    print(f"{'模式':<10} | {'请求数':<6} | {'平均延迟 (s)':<12} | {'P50 (s)':<8} | {'P95 (s)':<8} | {'准确率':<8} | {'命中率':<8}")
+    print("-" * 85)
+    for mode, s in summaries.items():
+        if not s['total_count']:
+            continue
+        hit_rate = f"{s['hit_rate_percent']:.2f}%" if 'hit_rate_percent' in s else '-'
+        accuracy = f"{s['accuracy_percent']:.2f}%"
+        print(f"{mode:<10} | {s['total_count']:<6} | {s['average_latency_s']:<12.4f} | {s['p50_latency_s']:<8.4f} | "
+              f"{s['p95_latency_s']:<8.4f} | {accuracy:<8} | {hit_rate:<8}")
+    print("=" * 85)
+    if summaries['no_cache'].get('average_latency_s') and summaries['cache'].get('average_latency_s'):
+        reduction = 1 - summaries['cache']['average_latency_s'] / summaries['no_cache']['average_latency_s']
+        print(f"平均延迟降低 {reduction:.2%}")
+
+    with open(CACHE_REPLAY_LOG_FILE, 'a', encoding='utf-8') as f:
+        f.write(json.dumps({'model_name': CACHE_REPLAY_MODEL, 'requests': len(stream), 'distinct': distinct,
+                            'zipf_s': CACHE_ZIPF_S, 'variant_rate': CACHE_VARIANT_RATE, **summaries},
+                           ensure_ascii=False) + '\n')
+    print(f"\n详细结果已保存在 '{CACHE_REPLAY_LOG_FILE}' 文件中。")
 
 
 def parse_ollama_list(output):
@@ -58,27 +614,23 @@ def load_dataset(filename):
     if not os.path.exists(filename):
         print(f"错误: 数据集文件 '{filename}' 未找到。")
         exit()
+    if USE_VAL_STORE:
+        return open_val_store(filename)
     with open(filename, 'r', encoding='utf-8') as f:
         return [json.loads(line) for line in f]
 
 
-def load_progress(log_file):
-    completed = set()
-    if os.path.exists(log_file):
-        with open(log_file, 'r', encoding='utf-8') as f:
-            for line in f:
-                try:
-                    log_entry = json.loads(line)
-                    completed.add((log_entry['model_name'], log_entry['index']))
-                except json.JSONDecodeError:
-                    print(f"警告: 日志文件中发现无效行: {line.strip()}")
-    return completed
-
-
 def main():
     print("--- Ollama 模型性能与错误分析测试 ---")
 
-    all_models = parse_ollama_list(OLLAMA_LIST_OUTPUT)
+    all_models = []
+    if USE_SCHEDULER:
+        try:
+            all_models = list_server_models(SESSION, OLLAMA_BASE_URL)
+        except Exception as e:
+            print(f"  - [警告] 无法从服务端获取模型列表 ({e})，使用内置的 ollama list 输出。")
+    if not all_models:
+        all_models = parse_ollama_list(OLLAMA_LIST_OUTPUT)
     eligible_models = [m for m in all_models if m['size_gb'] <= MAX_SIZE_GB]
     print(f"\n[1/5] 筛选出 {len(eligible_models)} 个小于等于 {MAX_SIZE_GB} GB 的模型...")
     for model in all_models:
@@ -89,66 +641,108 @@ def main():
         print("\n没有找到符合大小限制的模型，程序退出。")
         return
 
+    if USE_SCHEDULER:
+        phases, skipped = plan_phases(eligible_models, MEMORY_BUDGET_GB)
+        print(f"  - 按 {MEMORY_BUDGET_GB} GB 内存预算规划为 {len(phases)} 个阶段。")
+        for model in skipped:
+            print(f"  - [跳过] {model['name']} 超出内存预算")
+        scheduled_models = run_schedule(SESSION, OLLAMA_BASE_URL, phases)
+    else:
+        scheduled_models = eligible_models
+
     print(f"\n[2/5] 正在加载数据集 '{DATASET_FILE}'...")
     dataset = load_dataset(DATASET_FILE)
     print(f"  - 加载完成，共 {len(dataset)} 条数据。")
 
+    if BENCHMARK_MODE == "concurrent":
+        # 与 sequential 模式相同, 按调度计划逐个测试, 超出预算的模型不测试, 阶段之间卸载
+        run_concurrency_sweep(scheduled_models, dataset)
+        return
+
+    # pipeline / cache_replay 只使用固定的模型, 测试期间卸载其他模型, 结束后卸载所用模型
+    mode_models = {"pipeline": [CHAINED_MODEL, FUSED_MODEL], "cache_replay": [CACHE_REPLAY_MODEL]}
+    if BENCHMARK_MODE in mode_models:
+        with exclusive_models(SESSION, OLLAMA_BASE_URL, mode_models[BENCHMARK_MODE]) if USE_SCHEDULER \
+                else nullcontext():
+            if BENCHMARK_MODE == "pipeline":
+                run_pipeline_comparison(dataset)
+            else:
+                run_cache_replay(dataset)
+        return
+
     print(f"\n[3/5] 正在检查进度日志 '{LOG_FILE}'...")
-    completed_tasks = load_progress(LOG_FILE)
-    print(f"  - 发现 {len(completed_tasks)} 条已完成记录，将自动跳过。")
+    progress = ProgressIndex(LOG_FILE)
+    print(f"  - 发现 {progress.completed_count()} 条已完成记录，将直接跳过。")
 
     print("\n[4/5] 开始执行测试...")
     results = {}
 
-    with open(LOG_FILE, 'a', encoding='utf-8') as log_f:
-        for model_info in eligible_models:
+    with open_log_for_append(LOG_FILE) as log_f:
+        for model_info in scheduled_models:
             model_name = model_info['name']
             print(f"\n--- 开始测试模型: {model_name} ---")
 
+            pending = progress.pending_indices(model_name, len(dataset))
+            if not pending:
+                print(f"  - 模型 {model_name} 的 {len(dataset)} 条数据均已完成，跳过。")
+                results[model_name] = {'failed_cases': []}
+                continue
+            print(f"  - 待测试 {len(pending)} 条，跳过 {len(dataset) - len(pending)} 条已完成记录。")
+
             try:
                 print(f"  - [预热] 正在加载模型 {model_name}...")
-                _ = ollama(prompt="Hello", model=model_name)
-                print("  - [预热] 模型加载完成。")
+                if USE_SCHEDULER:
+                    load_stats = measure_cold_start(SESSION, OLLAMA_BASE_URL, model_info)
+                    print(f"  - [预热] 模型加载完成。冷启动 {load_stats['cold_start_latency']:.2f}s "
+                          f"(加载 {load_stats['load_duration']:.2f}s)，热启动 {load_stats['warm_latency']:.2f}s")
+                else:
+                    _ = ollama(prompt="Hello", model=model_name)
+                    print("  - [预热] 模型加载完成。")
             except Exception as e:
                 print(f"  - [错误] 模型 {model_name} 预热失败: {e}。将跳过此模型。")
                 results[model_name] = {'failed_warmup': True}
                 continue
 
-            model_results = {
-                'latencies': [], 'response_lengths': [],
-                'correct_count': 0, 'total_count': 0,
-                'failed_count': 0, 'failed_cases': []
-            }
+            if COMPARE_CONNECTION_REUSE:
+                compare_connection_reuse(model_name, dataset[:CONNECTION_COMPARE_SAMPLE_SIZE])
 
-            for i, item in enumerate(dataset):
-                if (model_name, i) in completed_tasks:
-                    print(f"  - [跳过] 数据项 {i + 1}/{len(dataset)} (已在日志中)")
-                    continue
+            model_results = {'failed_count': 0, 'failed_cases': []}
 
-                query, expected_response = item['query'], item['response']
+            for i in pending:
+                query, expected_response = dataset[i]['query'], dataset[i]['response']
 
                 log_entry = {'model_name': model_name, 'index': i}
 
                 try:
-                    start_time = time.time()
-                    actual_response = ollama(prompt=query, model=model_name)
-                    latency = time.time() - start_time
+                    decoding = constrained_kwargs(query, STREAM_MODE) if CONSTRAINED_DECODING else {}
+                    if STREAM_MODE:
+                        result = ollama_stream(prompt=query, model=model_name, **decoding)
+                        latency = result['latency']
+                    else:
+                        start_time = time.perf_counter()
+                        result = ollama_generate(prompt=query, model=model_name, **decoding)
+                        latency = time.perf_counter() - start_time
+                    actual_response = result['response']
+                    if CONSTRAINED_DECODING:
+                        actual_response = truncate_to_grammar(task_of(query), actual_response)
+                        log_entry['constrained_decoding'] = True
 
                     response_len = len(actual_response)
-                    is_correct = actual_response.strip() == expected_response.strip()
-
-                    model_results['latencies'].append(latency)
-                    model_results['response_lengths'].append(response_len)
-                    model_results['total_count'] += 1
+                    score = score_response(task_of(query), expected_response, actual_response)
+                    is_correct = score['exact']
 
                     log_entry.update({
                         'latency': latency,
+                        'server_latency': server_latency(result),
+                        'connection_reuse': USE_CONNECTION_POOL,
                         'is_correct': is_correct,
-                        'response_length': response_len
+                        'structured_correct': score['match'],
+                        'error_field': score['error'],
+                        'response_length': response_len,
+                        **server_stats(result)
                     })
 
                     if is_correct:
-                        model_results['correct_count'] += 1
                         print(
                             f"  - [测试] 数据项 {i + 1}/{len(dataset)} | 状态: 正确 | 延迟: {latency:.2f}s | 长度: {response_len}")
                     else:
@@ -169,12 +763,12 @@ def main():
                         print(f"    - 期望: '{expected_response}' ({expected_semicolons} commands)")
                         print(f"    - 得到: '{actual_response}' ({actual_semicolons} commands)")
 
-                    # 将完整的 log_entry 写入文件
-                    log_f.write(json.dumps(log_entry, ensure_ascii=False) + '\n')
-                    log_f.flush()
+                    # 将完整的 log_entry 写入文件, 并同步更新进度索引
+                    append_log_entry(log_f, progress, log_entry)
 
                 except Exception as e:
                     print(f"  - [错误] 数据项 {i + 1}/{len(dataset)} | 请求失败: {e}")
+                    progress.record_failure(model_name)
                     model_results['failed_count'] += 1
                     if model_results['failed_count'] > 5:
                         print("  - 模型已连续失败多次，跳过该模型的剩余测试。")
@@ -193,11 +787,13 @@ def main():
             print(f"{model_name:<40} | {'N/A':<15} | {'N/A':<20} | {'N/A':<15} | {'预热失败':<10}")
             continue
 
-        if res['total_count'] > 0:
-            avg_latency = f"{sum(res['latencies']) / len(res['latencies']):.2f}"
-            avg_len = f"{sum(res['response_lengths']) / len(res['response_lengths']):.0f}"
-            accuracy = f"{(res['correct_count'] / res['total_count']) * 100:.2f}%"
-            count_str = f"{res['correct_count']}/{res['total_count']}"
+        # 汇总数据来自进度索引, 包含历次运行 (而不只是本次运行) 完成的全部数据项
+        summary = progress.summary(model_name)
+        if summary['total_count'] > 0:
+            avg_latency = f"{summary['latency_sum'] / summary['total_count']:.2f}"
+            avg_len = f"{summary['response_length_sum'] / summary['total_count']:.0f}"
+            accuracy = f"{(summary['correct_count'] / summary['total_count']) * 100:.2f}%"
+            count_str = f"{summary['correct_count']}/{summary['total_count']}"
 
             print(f"{model_name:<40} | {avg_latency:<15} | {avg_len:<20} | {accuracy:<15} | {count_str:<10}")
         else:
@@ -220,6 +816,9 @@ def main():
         print("\n所有模型在测试中均未出现错误。")
     print("=" * 82)
     print(f"\n详细测试日志已保存在 '{LOG_FILE}' 文件中。")
+    if USE_SCHEDULER:
+        print(f"模型冷启动耗时已保存在 '{MODEL_LOAD_LOG_FILE}' 文件中。")
+    progress.close()
 
 
 if __name__ == "__main__":
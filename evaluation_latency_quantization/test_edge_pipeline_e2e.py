@@ -0,0 +1,251 @@
+import json
+import os
+import re
+import sys
+import time
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common.fast_path import fast_path
+from common.output_grammar import COMMAND, is_valid, truncate_to_grammar
+from common.prompts import CLASS_TASKS, OTHER_CLASS, ROOT_DIR, render_query, split_fused_response
+from common.scoring import parse_response, score_response
+from common.yolo_classes import YOLO_CLASS_NAMES, yolo_class_filter
+from test_edge_latency_quantization import (
+    DATASET_FILE, constrained_kwargs, load_dataset, ollama_generate, ollama_stream, pipeline_items
+)
+
+# 按实际控制流程逐条处理语音识别后的文本: problem_1 分类 -> 按类别调用 problem_2/3/4 抽取 -> 解析 ->
+# (搜索任务) 把对象列表转换为 YOLO 的类别过滤参数 -> (可选) 运行一次检测, 记录每个阶段的耗时
+MODEL = "qwen2.5_0.5b_drone_q4:latest"
+
+# 为 True 时两次调用都使用流式请求, 并记录输出中第一次出现可执行指令的时刻 (例如 problem_3 的第一条完整指令)
+STREAM = True
+
+# 为 True 时使用任务文法约束 (num_predict + stop, 流式时文法完整即断开), 与 test_edge_constrained_decoding.py 相同
+CONSTRAINED_DECODING = True
+
+# 为 True 时 problem_3/4 先尝试规则快速通道 (common/fast_path.py), 规则不确定时再调用模型
+USE_FAST_PATH = False
+
+# 为 True 时对搜索任务按类别过滤运行一次 YOLO 检测 (需要 ultralytics); DETECT_SOURCE 为 None 时使用空白图像
+RUN_DETECTION = False
+
+YOLO_WEIGHTS = os.path.join(ROOT_DIR, 'model', 'yolo', 'yolo11n-lite_v3.pt')
+
+YOLO_IMGSZ = 960
+
+DETECT_SOURCE = None
+
+E2E_TRACE_FILE = "test_pipeline_e2e_trace.jsonl"
+
+E2E_LOG_FILE = "test_pipeline_e2e.jsonl"
+
+STAGES = ['classify', 'extract', 'parse', 'yolo_filter', 'detect']
+
+COMMAND_PATTERN = re.compile(COMMAND)
+
+
+def first_actionable(task, text):
+    # 输出中是否已经出现可以交给飞控/检测执行的内容: problem_3 只需第一条指令完整
+    # (后面跟 ';' 或 '.', 且符合指令文法, 避免把 "move_up 1." 中的小数点当作结尾), 其他任务需整个输出完整
+    if task == 'problem_3':
+        stripped = text.strip()
+        head, sep, _ = stripped.partition(';')
+        if not sep and stripped.endswith('.'):
+            head = stripped[:-1]
+        if (sep or stripped.endswith('.')) and COMMAND_PATTERN.fullmatch(head.strip()):
+            return True
+    return is_valid(task, text)
+
+
+def call_model(task, user_input):
+    # 返回 (回答, 首 token 时间, 第一次可执行的时刻); 非流式请求时可执行时刻为 None, 即请求结束时
+    query = render_query(task, user_input)
+    kwargs = constrained_kwargs(query, STREAM) if CONSTRAINED_DECODING else {}
+    if not STREAM:
+        response = ollama_generate(prompt=query, model=MODEL, **kwargs)['response']
+        return (truncate_to_grammar(task, response) if CONSTRAINED_DECODING else response), None, None
+
+    stop_when = kwargs.pop('stop_when', None)
+    marks = {}
+
+    def observe(text):
+        if 'actionable' not in marks and first_actionable(task, text):
+            marks['actionable'] = time.perf_counter()
+        return stop_when is not None and stop_when(text)
+
+    result = ollama_stream(prompt=query, model=MODEL, stop_when=observe, **kwargs)
+    response = truncate_to_grammar(task, result['response']) if CONSTRAINED_DECODING else result['response']
+    return response, result.get('ttft'), marks.get('actionable')
+
+
+def load_detector():
+    if not RUN_DETECTION:
+        return None
+    try:
+        from ultralytics import YOLO
+    except ImportError:
+        print("  - [警告] 未安装 ultralytics, 跳过检测阶段。")
+        return None
+    model = YOLO(YOLO_WEIGHTS)
+    if DETECT_SOURCE is not None:
+        import cv2
+        frame = cv2.imread(DETECT_SOURCE)
+    else:
+        frame = np.zeros((YOLO_IMGSZ, YOLO_IMGSZ, 3), dtype=np.uint8)
+    # 预热, 避免第一次检测计入模型初始化时间
+    model.predict(frame, imgsz=YOLO_IMGSZ, verbose=False)
+    return lambda classes: model.predict(frame, imgsz=YOLO_IMGSZ, classes=classes, verbose=False)
+
+
+def run_utterance(item, detect):
+    stages, ttft = {}, {}
+    start_time = time.perf_counter()
+    action_time = None
+
+    response, ttft['classify'], _ = call_model('problem_1', item['user_input'])
+    stages['classify'] = time.perf_counter() - start_time
+    label = split_fused_response(response)[0]
+    trace = {'index': item['index'], 'label': item['label'], 'predicted_label': label, 'extract_path': None}
+
+    task = CLASS_TASKS.get(label)
+    output, items = '', None
+    if task is None:
+        # 其他类 (或分类输出无法解析) 没有后续任务, 分类完成即可回复用户
+        action_time = time.perf_counter()
+    else:
+        stage_start = time.perf_counter()
+        output = fast_path(task, item['user_input']) if USE_FAST_PATH else None
+        if output is not None:
+            trace['extract_path'] = 'fast_path'
+        else:
+            trace['extract_path'] = 'model'
+            output, ttft['extract'], action_time = call_model(task, item['user_input'])
+        stages['extract'] = time.perf_counter() - stage_start
+
+        stage_start = time.perf_counter()
+        items = parse_response(task, output)
+        stages['parse'] = time.perf_counter() - stage_start
+        if task == 'problem_2':
+            stage_start = time.perf_counter()
+            class_ids, trace['unknown_objects'] = yolo_class_filter(items)
+            stages['yolo_filter'] = time.perf_counter() - stage_start
+            trace['yolo_classes'] = [YOLO_CLASS_NAMES[i] for i in class_ids]
+            # 搜索任务在检测器拿到类别过滤参数时才可执行, 抽取阶段的可执行时刻不适用
+            action_time = time.perf_counter()
+            if detect is not None and class_ids:
+                stage_start = time.perf_counter()
+                detect(class_ids)
+                stages['detect'] = time.perf_counter() - stage_start
+        elif action_time is None:
+            # 非流式、快速通道或流式输出中未出现可执行前缀时, 解析完成即为可执行时刻
+            action_time = time.perf_counter()
+
+    class_correct = label == item['label']
+    trace.update({
+        'stages': stages,
+        'ttft': ttft,
+        'first_action_s': action_time - start_time,
+        'total_s': time.perf_counter() - start_time,
+        'output': output,
+        'class_correct': class_correct,
+        'is_correct': class_correct and (task is None or score_response(task, item['expected'], output)['match']),
+    })
+    return trace
+
+
+def percentiles(values):
+    return {
+        'mean_ms': float(np.mean(values)) * 1000,
+        'p50_ms': float(np.percentile(values, 50)) * 1000,
+        'p99_ms': float(np.percentile(values, 99)) * 1000,
+    }
+
+
+def summarize(traces):
+    summary = {'count': len(traces)}
+    if not traces:
+        return summary
+    total = [t['total_s'] for t in traces]
+    summary.update({
+        'accuracy_percent': sum(t['is_correct'] for t in traces) / len(traces) * 100,
+        'class_accuracy_percent': sum(t['class_correct'] for t in traces) / len(traces) * 100,
+        'first_action': percentiles([t['first_action_s'] for t in traces]),
+        'total': percentiles(total),
+        'stages': {},
+    })
+    for stage in STAGES:
+        values = [t['stages'][stage] for t in traces if stage in t['stages']]
+        if values:
+            # share_percent: 该阶段耗时总和占所有语句全程耗时总和的比例; 流式时可执行指令可能早于抽取阶段结束,
+            # 因此按全程而不是按 "到第一条可执行指令" 计算, 各阶段占比之和不超过 100%
+            summary['stages'][stage] = {
+                'count': len(values),
+                **percentiles(values),
+                'share_percent': sum(values) / sum(total) * 100,
+            }
+    return summary
+
+
+def main():
+    print("--- 端到端指令流水线延迟测试 (分类 -> 抽取 -> 解析 -> YOLO 类别过滤) ---")
+
+    print(f"\n[1/3] 正在加载数据集 '{DATASET_FILE}'...")
+    dataset = load_dataset(DATASET_FILE)
+    if not dataset:
+        return
+    items = pipeline_items(dataset)
+
+    print(f"\n[2/3] 在模型 {MODEL} 上逐条运行 {len(items)} 条语句 (流式: {STREAM}, 约束解码: {CONSTRAINED_DECODING}, "
+          f"快速通道: {USE_FAST_PATH}, 检测: {RUN_DETECTION})...")
+    try:
+        ollama_generate(prompt="Hello", model=MODEL)
+    except Exception as e:
+        print(f"  - [错误] 模型 {MODEL} 预热失败: {e}")
+        return
+    detect = load_detector()
+
+    traces = []
+    with open(E2E_TRACE_FILE, 'a', encoding='utf-8') as trace_f:
+        for n, item in enumerate(items):
+            try:
+                trace = run_utterance(item, detect)
+            except Exception as e:
+                print(f"    - [错误] 数据项 {item['index'] + 1} 处理失败: {e}")
+                continue
+            traces.append(trace)
+            trace_f.write(json.dumps({'model_name': MODEL, **trace}, ensure_ascii=False) + '\n')
+            if (n + 1) % 50 == 0:
+                print(f"  - 已完成 {n + 1}/{len(items)} 条")
+
+    summary = {label: summarize([t for t in traces if label == 'all' or t['label'] == label])
+               for label in ['all'] + sorted(set(CLASS_TASKS) | {OTHER_CLASS})}
+    print("\n[3/3] 测试结果 (到第一条可执行指令的耗时, 以及各阶段的耗时与占比):")
+    print(f"{'类别':<4} | {'样本数':<6} | {'准确率':<8} | {'首个指令 P50 (ms)':<16} | {'P99 (ms)':<10} | "
+          f"{'全程 P50 (ms)':<13} | {'P99 (ms)':<10}")
+    print("-" * 95)
+    for label, s in summary.items():
+        if not s['count']:
+            continue
+        print(f"{label:<4} | {s['count']:<6} | {s['accuracy_percent']:<7.2f}% | {s['first_action']['p50_ms']:<16.1f} | "
+              f"{s['first_action']['p99_ms']:<10.1f} | {s['total']['p50_ms']:<13.1f} | {s['total']['p99_ms']:<10.1f}")
+        for stage, st in s['stages'].items():
+            print(f"{'':<4}   - {stage:<12} 平均 {st['mean_ms']:8.1f} ms | P50 {st['p50_ms']:8.1f} ms | "
+                  f"P99 {st['p99_ms']:8.1f} ms | 占比 {st['share_percent']:6.2f}%")
+
+    with open(E2E_LOG_FILE, 'a', encoding='utf-8') as log_f:
+        log_f.write(json.dumps({
+            'model_name': MODEL,
+            'stream': STREAM,
+            'constrained_decoding': CONSTRAINED_DECODING,
+            'use_fast_path': USE_FAST_PATH,
+            'run_detection': detect is not None,
+            'summary': summary,
+        }, ensure_ascii=False) + '\n')
+    print(f"\n逐条记录已保存在 '{E2E_TRACE_FILE}', 汇总结果已保存在 '{E2E_LOG_FILE}' 文件中。")
+
+
+if __name__ == "__main__":
+    main()
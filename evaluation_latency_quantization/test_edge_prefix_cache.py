@@ -0,0 +1,129 @@
+import json
+import os
+import sys
+import time
+from collections import defaultdict
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common.prompts import TASK_TYPES, split_system_prompt, task_of
+from test_edge_latency_quantization import DATASET_FILE, load_dataset, ollama_generate, server_stats
+
+MODELS_TO_TEST = [
+    "qwen2.5_0.5b_drone_q4:latest",
+    "qwen2.5_0.5b_drone_f16:latest",
+]
+
+# 每类任务抽取的样本数
+SAMPLE_PER_TASK = 100
+
+# interleaved: 保持数据集原有顺序 (四类任务交替出现, 基线)
+# grouped:     按任务类型分组连续发送, 相邻请求共享同一段指令前缀, 服务端可复用前缀的 KV cache
+# system:      按任务分组, 且把固定指令移到 system 字段, 只在 prompt 中保留 user input 部分
+MODES = ["interleaved", "grouped", "system"]
+
+PREFIX_CACHE_LOG_FILE = "test_prefix_cache.jsonl"
+
+
+def sample_items(dataset):
+    counts = defaultdict(int)
+    items = []
+    for i, item in enumerate(dataset):
+        task = task_of(item['query'])
+        if task and counts[task] < SAMPLE_PER_TASK:
+            counts[task] += 1
+            items.append({'index': i, 'task': task, **item})
+    return items
+
+
+def order_items(items, mode):
+    if mode == "interleaved":
+        return items
+    return sorted(items, key=lambda item: (TASK_TYPES.index(item['task']), item['index']))
+
+
+def run_mode(model_name, items, mode):
+    records = []
+    for item in order_items(items, mode):
+        if mode == "system":
+            system, prompt = split_system_prompt(item['query'])
+        else:
+            system, prompt = '', item['query']
+        try:
+            start_time = time.perf_counter()
+            result = ollama_generate(prompt=prompt, model=model_name, system=system)
+            latency = time.perf_counter() - start_time
+        except Exception as e:
+            print(f"    - [错误] 数据项 {item['index'] + 1} 请求失败: {e}")
+            continue
+        records.append({
+            'task': item['task'],
+            'latency': latency,
+            'is_correct': result['response'].strip() == item['response'].strip(),
+            **server_stats(result)
+        })
+
+    summary = {'model_name': model_name, 'mode': mode, 'total_count': len(records)}
+    if records:
+        summary.update({
+            'accuracy_percent': sum(r['is_correct'] for r in records) / len(records) * 100,
+            'average_latency_s': float(np.mean([r['latency'] for r in records])),
+            'average_prompt_eval_count': float(np.mean([r.get('prompt_eval_count', 0) for r in records])),
+            'average_prompt_eval_duration_s': float(np.mean([r.get('prompt_eval_duration', 0) for r in records])),
+            'total_prompt_eval_duration_s': float(np.sum([r.get('prompt_eval_duration', 0) for r in records])),
+        })
+    return summary
+
+
+def main():
+    print("--- Prompt 前缀 KV cache 复用测试 ---")
+
+    print(f"\n[1/3] 正在加载数据集 '{DATASET_FILE}'...")
+    items = sample_items(load_dataset(DATASET_FILE))
+    print(f"  - 每类任务抽取 {SAMPLE_PER_TASK} 条，共 {len(items)} 条。")
+
+    print(f"\n[2/3] 开始测试, 模式: {MODES}")
+    summaries = []
+    with open(PREFIX_CACHE_LOG_FILE, 'a', encoding='utf-8') as log_f:
+        for model_name in MODELS_TO_TEST:
+            print(f"\n--- 开始测试模型: {model_name} ---")
+            try:
+                ollama_generate(prompt="Hello", model=model_name)
+            except Exception as e:
+                print(f"  - [错误] 模型 {model_name} 预热失败: {e}。将跳过此模型。")
+                continue
+            for mode in MODES:
+                summary = run_mode(model_name, items, mode)
+                summaries.append(summary)
+                log_f.write(json.dumps(summary, ensure_ascii=False) + '\n')
+                log_f.flush()
+                if summary['total_count']:
+                    print(f"  - [{mode}] 平均延迟 {summary['average_latency_s']:.3f}s | "
+                          f"平均 prompt eval {summary['average_prompt_eval_count']:.1f} tokens / "
+                          f"{summary['average_prompt_eval_duration_s'] * 1000:.1f} ms | "
+                          f"准确率 {summary['accuracy_percent']:.2f}%")
+
+    print("\n[3/3] 生成总结报告...")
+    print("\n================================ 前缀复用测试总结 ================================")
+    print(f"{'模型名称':<35} | {'模式':<12} | {'平均延迟 (s)':<12} | {'Prompt Eval (ms)':<17} | "
+          f"{'节省 (ms/条)':<12} | {'准确率':<10}")
+    print("-" * 115)
+    baselines = {s['model_name']: s for s in summaries if s['mode'] == 'interleaved' and s['total_count']}
+    for s in summaries:
+        if not s['total_count']:
+            continue
+        baseline = baselines.get(s['model_name'])
+        saved = (
+            f"{(baseline['average_prompt_eval_duration_s'] - s['average_prompt_eval_duration_s']) * 1000:.1f}"
+            if baseline else 'N/A'
+        )
+        print(f"{s['model_name']:<35} | {s['mode']:<12} | {s['average_latency_s']:<12.3f} | "
+              f"{s['average_prompt_eval_duration_s'] * 1000:<17.1f} | {saved:<12} | {s['accuracy_percent']:.2f}%")
+    print("=" * 115)
+    print("注意: system 模式改变了模型看到的对话模板, 其准确率变化需与延迟收益一起评估。")
+    print(f"\n详细结果已保存在 '{PREFIX_CACHE_LOG_FILE}' 文件中。")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,44 @@
 import os
+import sys
 import json
-import numpy as np
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 import pandas as pd
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common.metrics import RunningStats, StreamingSummary
+from common.prompts import prompt_templates
+from common.scoring import ERROR_FIELDS, ScoreSummary, guess_task, response_task, score_response
+
+try:
+    import pyarrow.json as pa_json
+except ImportError:
+    pa_json = None
+
+# rows:     单进程逐行读取, 以流式统计量 (Welford 均值/方差 + 延迟 sketch) 汇总, 内存不随样本数增长
+# columnar: 一次性载入 pandas 后按列计算, P95 为精确值, 在大规模语料上更快;
+#           需要 pyarrow 的 JSON 解析, 未安装时改用 parallel
+# parallel: 多进程按文件/字节块并行解析, 各进程返回与 rows 相同的可合并汇总量
+#           (rows/parallel 的 P95 为 sketch 估计值, 相对误差不超过 1%)
+ANALYSIS_MODE = "columnar"
+
+# parallel 模式的进程数与大文件的切块大小
+INGEST_WORKERS = os.cpu_count() or 1
+
+CHUNK_SIZE_BYTES = 64 * 1024 * 1024
+
+# (模型名关键字, 回答起始标记, 需要去除的结束标记), 与 extract_response_from_model_ans 的规则一致
+CHAT_TEMPLATE_RULES = [
+    ('deepseek_r1', '<｜Assistant｜><think>\n', ['<｜end▁of▁sentence｜>']),
+    ('qwen2.5', '<|im_start|>assistant\n', ['<|im_end|>']),
+    ('llama3.2', 'assistant<|end_header_id|>\n\n', ['<|eot_id|>']),
+    ('gemma2', '<start_of_turn>model\n', ['<end_of_turn><eos>']),
+    ('phi3.5', ' <|end|><|assistant|> ', ['<|end|>']),
+]
+
+FALLBACK_TEMPLATE_RULE = ('<start_of_turn>model\n', ['\n<end_of_turn>', '<end_of_turn>'])
+
 
 def is_true(data: dict) -> bool:
     model_ans_raw = data.get("model_ans", "")
@@ -45,47 +80,67 @@ def extract_response_from_model_ans(model_ans, model_name) -> str:
     return response.strip()
 
 
-def analyze_files(file_paths: list):
-    stats = defaultdict(lambda: {
-        "latencies": [],
-        "throughputs": [],
-        "exact_matches": 0,
-        "contains_matches": 0,
-        "total_count": 0
-    })
+def evaluate_record(data: dict, model_name: str):
+    ground_truth = data.get("response", "").strip()
+    model_ans_raw = data.get("model_ans", "")
+    sp_time = data.get("sp_time")
 
-    for file_path in file_paths:
-        model_name = os.path.basename(file_path).replace('.jsonl', '')
+    if not all([ground_truth, model_ans_raw, sp_time and sp_time > 0]):
+        return None
 
-        try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                for line in f:
-                    try:
-                        data = json.loads(line)
+    model_response_cleaned = extract_response_from_model_ans(model_ans_raw, model_name)
+    task = response_task(data.get("query"), ground_truth)
+    return {
+        "sp_time": sp_time,
+        "throughput": len(model_response_cleaned) / sp_time,
+        "exact": model_response_cleaned == ground_truth,
+        "contains": is_true(data),
+        "score": score_response(task, ground_truth, model_response_cleaned),
+    }
 
-                        ground_truth = data.get("response", "").strip()
-                        model_ans_raw = data.get("model_ans", "")
-                        sp_time = data.get("sp_time")
 
-                        if not all([ground_truth, model_ans_raw, sp_time and sp_time > 0]):
-                            continue
+def new_aggregate() -> dict:
+    return {
+        "total_count": 0,
+        "exact_matches": 0,
+        "contains_matches": 0,
+        "latency": StreamingSummary(),
+        "throughput": RunningStats(),
+        "scores": ScoreSummary(),
+    }
 
-                        model_response_cleaned = extract_response_from_model_ans(model_ans_raw, model_name)
-                        response_len = len(model_response_cleaned)
 
-                        stats[model_name]["total_count"] += 1
-                        stats[model_name]["latencies"].append(sp_time)
+def add_record(aggregate: dict, record: dict):
+    aggregate["total_count"] += 1
+    aggregate["exact_matches"] += record["exact"]
+    aggregate["contains_matches"] += record["contains"]
+    aggregate["latency"].add(record["sp_time"])
+    aggregate["throughput"].add(record["throughput"])
+    aggregate["scores"].add(record["score"])
 
-                        if sp_time > 0:
-                            throughput = response_len / sp_time
-                            stats[model_name]["throughputs"].append(throughput)
 
-                        if model_response_cleaned == ground_truth:
-                            stats[model_name]["exact_matches"] += 1
+def merge_aggregate(into: dict, other: dict) -> dict:
+    for key in ["total_count", "exact_matches", "contains_matches"]:
+        into[key] += other[key]
+    into["latency"].merge(other["latency"])
+    into["throughput"].merge(other["throughput"])
+    into["scores"].merge(other["scores"])
+    return into
 
-                        if is_true(data):
-                            stats[model_name]["contains_matches"] += 1
 
+def analyze_files(file_paths: list):
+    stats = defaultdict(new_aggregate)
+
+    for file_path in file_paths:
+        model_name = os.path.basename(file_path).replace('.jsonl', '')
+
+        try:
+            with open(file_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = evaluate_record(json.loads(line), model_name)
+                        if record is not None:
+                            add_record(stats[model_name], record)
                     except (json.JSONDecodeError, KeyError) as e:
                         print(f"Skipping malformed line in {file_path}: {e}")
         except FileNotFoundError:
@@ -94,35 +149,208 @@ def analyze_files(file_paths: list):
     return stats
 
 
-def calculate_and_present_results(stats: dict):
-    results = []
-    for model_name, data in stats.items():
-        count = data["total_count"]
-        if count == 0:
+def file_chunks(file_path: str, chunk_size: int) -> list:
+    # 按字节切块, 块边界对齐到下一个换行符之后, 保证每一行只属于一个块
+    file_size = os.path.getsize(file_path)
+    boundaries = [0]
+    with open(file_path, 'rb') as f:
+        while boundaries[-1] + chunk_size < file_size:
+            f.seek(boundaries[-1] + chunk_size)
+            f.readline()
+            if f.tell() >= file_size:
+                break
+            boundaries.append(f.tell())
+    boundaries.append(file_size)
+    return [(file_path, start, end) for start, end in zip(boundaries, boundaries[1:])]
+
+
+def aggregate_chunk(chunk: tuple):
+    file_path, start, end = chunk
+    model_name = os.path.basename(file_path).replace('.jsonl', '')
+    aggregate = new_aggregate()
+    with open(file_path, 'rb') as f:
+        f.seek(start)
+        position = start
+        while position < end:
+            line = f.readline()
+            if not line:
+                break
+            position += len(line)
+            try:
+                record = evaluate_record(json.loads(line), model_name)
+            except (json.JSONDecodeError, KeyError) as e:
+                print(f"Skipping malformed line in {file_path}: {e}")
+                continue
+            if record is not None:
+                add_record(aggregate, record)
+    return model_name, aggregate
+
+
+def analyze_files_parallel(file_paths: list, workers: int = INGEST_WORKERS, chunk_size: int = CHUNK_SIZE_BYTES):
+    chunks = []
+    for file_path in file_paths:
+        if not os.path.exists(file_path):
+            print(f"Warning: File not found at {file_path}. Skipping.")
             continue
+        chunks.extend(file_chunks(file_path, chunk_size))
 
-        latencies = np.array(data["latencies"])
-        throughputs = np.array(data["throughputs"]) if data["throughputs"] else np.array([0])
+    if workers <= 1:
+        partials = [aggregate_chunk(chunk) for chunk in chunks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            partials = list(executor.map(aggregate_chunk, chunks))
+
+    aggregates = defaultdict(new_aggregate)
+    for model_name, aggregate in partials:
+        merge_aggregate(aggregates[model_name], aggregate)
+    return aggregates
+
+
+def read_jsonl_columns(file_path, columns):
+    # 优先使用 pyarrow 的多线程 JSON 解析, 未安装时退回逐行解析
+    if pa_json is not None:
+        table = pa_json.read_json(file_path)
+        return pd.DataFrame({c: table.column(c).to_pandas() if c in table.column_names else None for c in columns})
+    data = {c: [] for c in columns}
+    with open(file_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                print(f"Skipping malformed line in {file_path}: {e}")
+                continue
+            for c in columns:
+                data[c].append(record.get(c))
+    return pd.DataFrame(data)
+
+
+def load_frame(file_paths: list) -> pd.DataFrame:
+    frames = []
+    for file_path in file_paths:
+        if not os.path.exists(file_path):
+            print(f"Warning: File not found at {file_path}. Skipping.")
+            continue
+        df = read_jsonl_columns(file_path, ["query", "response", "model_ans", "sp_time"])
+        df["model"] = os.path.basename(file_path).replace('.jsonl', '')
+        frames.append(df)
+    if not frames:
+        return pd.DataFrame(columns=["query", "response", "model_ans", "sp_time", "model"])
+    df = pd.concat(frames, ignore_index=True)
+    df["model"] = df["model"].astype("category")
+    return df
 
-        result_row = {
-            "Model": model_name,
-            "Total Samples": count,
-            "Exact Match Acc (%)": (data["exact_matches"] / count) * 100,
-            "Contains Acc (%)": (data["contains_matches"] / count) * 100,
-            "Avg Latency (s)": np.mean(latencies),
-            "std_dev_latency_s":np.std(latencies),
-            "inferences_per_second (IPS)":1 / np.mean(latencies) if np.mean(latencies) > 0 else 0,
-            "P95 Latency (s)": np.percentile(latencies, 95),
-            "Max Latency (s)": np.max(latencies),
-            "Avg Throughput (chars/s)": np.mean(throughputs)
-        }
-        results.append(result_row)
 
-    if not results:
+def strip_chat_template_columnar(model_ans: pd.Series, model_name: str) -> pd.Series:
+    model_name_lower = model_name.lower()
+    for keyword, marker, end_tokens in CHAT_TEMPLATE_RULES:
+        if keyword in model_name_lower:
+            response = model_ans.str.rpartition(marker)[2]
+            break
+    else:
+        marker, end_tokens = FALLBACK_TEMPLATE_RULE
+        parts = model_ans.str.rpartition(marker)
+        response = parts[2].where(parts[1] != "", "")
+    for end_token in end_tokens:
+        response = response.str.replace(end_token, "", regex=False)
+    return response.str.strip()
+
+
+def contains_all_columnar(response: pd.Series, model_ans: pd.Series) -> pd.Series:
+    # 与 is_true 相同: 真值按 ';' 切分、去掉 '.' 后, 每个对象都需出现在原始回答中;
+    # 展开为 (行, 对象) 后按对象分组, 每个不同的对象只做一次整列的子串查找
+    objects = response.str.replace('.', '', regex=False).str.split(';').explode().str.strip()
+    answers = model_ans.loc[objects.index].reset_index(drop=True)
+    found = pd.Series(False, index=answers.index)
+    for obj, rows in pd.Series(objects.to_numpy()).groupby(objects.to_numpy(), sort=False).groups.items():
+        found[rows] = answers[rows].str.contains(obj, regex=False).to_numpy()
+    return found.groupby(objects.index.to_numpy()).all().reindex(response.index, fill_value=True)
+
+
+def response_task_columnar(query: pd.Series, ground_truth: pd.Series) -> pd.Series:
+    # 与 response_task 相同: 按 prompt 模板的前后缀识别任务, 不匹配任何模板时由标准答案推断
+    task = pd.Series(None, index=query.index, dtype=object)
+    lengths = query.str.len()
+    for name, template in prompt_templates().items():
+        prefix, suffix = template.split('{}', 1)
+        matched = (task.isna() & (query != "") & query.str.startswith(prefix) & query.str.endswith(suffix)
+                   & (lengths >= len(prefix) + len(suffix)))
+        task[matched] = name
+    unknown = task.isna()
+    task[unknown] = ground_truth[unknown].map(guess_task)
+    return task
+
+
+def score_columns(df: pd.DataFrame, cleaned: pd.Series) -> pd.DataFrame:
+    # 评分只取决于 (任务, 标准答案, 清洗后的回答); 每种不同的组合调用一次 common.scoring, 再按行展开,
+    # 返回与 df 对齐的 match/tp/fp/fn/error 列
+    keys = pd.MultiIndex.from_arrays([
+        response_task_columnar(df["query"].fillna("").astype(str), df["ground_truth"]),
+        df["ground_truth"],
+        cleaned,
+    ])
+    codes, uniques = pd.factorize(keys)
+    scores = pd.DataFrame([score_response(*key) for key in uniques], columns=["match", "tp", "fp", "fn", "error"])
+    return scores.iloc[codes].set_index(df.index)
+
+
+def structured_metrics(summary: dict) -> dict:
+    row = {
+        "Structured Acc (%)": summary["structured_match_percent"],
+        "Item F1 (%)": summary["item_f1_percent"],
+    }
+    row.update({f"{field} errors": summary["errors"].get(field, 0) for field in ERROR_FIELDS})
+    return row
+
+
+def analyze_frame(df: pd.DataFrame) -> pd.DataFrame:
+    df = df.assign(
+        ground_truth=df["response"].fillna("").astype(str).str.strip(),
+        model_ans=df["model_ans"].fillna("").astype(str),
+        sp_time=pd.to_numeric(df["sp_time"], errors="coerce"),
+    )
+    df = df[(df["ground_truth"] != "") & (df["model_ans"] != "") & (df["sp_time"] > 0)]
+
+    cleaned = pd.Series("", index=df.index, dtype=object)
+    for model_name, index in df.groupby("model", observed=True).groups.items():
+        cleaned.loc[index] = strip_chat_template_columnar(df.loc[index, "model_ans"], model_name)
+
+    df = df.assign(
+        exact=cleaned == df["ground_truth"],
+        contains=contains_all_columnar(df["response"].astype(str), df["model_ans"]),
+        throughput=cleaned.str.len() / df["sp_time"],
+    )
+    df = df.join(score_columns(df, cleaned))
+
+    grouped = df.groupby("model", observed=True)
+    latency = grouped["sp_time"]
+    result = pd.DataFrame({
+        "Total Samples": grouped.size(),
+        "Exact Match Acc (%)": grouped["exact"].mean() * 100,
+        "Contains Acc (%)": grouped["contains"].mean() * 100,
+        "Avg Latency (s)": latency.mean(),
+        "std_dev_latency_s": latency.std(ddof=0),
+        "inferences_per_second (IPS)": 1 / latency.mean(),
+        "P95 Latency (s)": latency.quantile(0.95),
+        "Max Latency (s)": latency.max(),
+        "Avg Throughput (chars/s)": grouped["throughput"].mean(),
+    })
+
+    # 与 ScoreSummary.summary() 相同的口径: precision/recall 由各模型 tp/fp/fn 的总和计算
+    items = grouped[["tp", "fp", "fn"]].sum()
+    precision = (items["tp"] / (items["tp"] + items["fp"])).fillna(0)
+    recall = (items["tp"] / (items["tp"] + items["fn"])).fillna(0)
+    result["Structured Acc (%)"] = grouped["match"].mean() * 100
+    result["Item F1 (%)"] = (2 * precision * recall / (precision + recall)).fillna(0) * 100
+    errors = pd.crosstab(df["model"], df["error"]).reindex(index=result.index, columns=ERROR_FIELDS, fill_value=0)
+    result = result.join(errors.rename(columns=lambda field: f"{field} errors"))
+    return result.rename_axis("Model").reset_index()
+
+
+def present_results(df: pd.DataFrame):
+    if df.empty:
         print("No data processed. Please check your file paths and content.")
         return
 
-    df = pd.DataFrame(results)
     pd.set_option('display.max_rows', 500)
     pd.set_option('display.max_columns', 500)
     pd.set_option('display.width', 1000)
@@ -131,7 +359,7 @@ def calculate_and_present_results(stats: dict):
     df.to_excel('a.xlsx', index=False)
 
     float_cols = [
-        'Exact Match Acc (%)', 'Contains Acc (%)', 'Avg Latency (s)',
+        'Exact Match Acc (%)', 'Contains Acc (%)', 'Structured Acc (%)', 'Item F1 (%)', 'Avg Latency (s)',
         'P95 Latency (s)', 'Max Latency (s)', 'Avg Throughput (chars/s)'
     ]
     for col in float_cols:
@@ -141,6 +369,39 @@ def calculate_and_present_results(stats: dict):
     print(df)
 
 
+def calculate_results(stats: dict) -> pd.DataFrame:
+    # P95 来自延迟 sketch (相对误差不超过 1%), 其余指标与逐条计算的结果一致
+    results = []
+    for model_name, data in stats.items():
+        count = data["total_count"]
+        if count == 0:
+            continue
+
+        latency = data["latency"]
+        mean_latency = latency.mean()
+
+        result_row = {
+            "Model": model_name,
+            "Total Samples": count,
+            "Exact Match Acc (%)": (data["exact_matches"] / count) * 100,
+            "Contains Acc (%)": (data["contains_matches"] / count) * 100,
+            "Avg Latency (s)": mean_latency,
+            "std_dev_latency_s": latency.std(),
+            "inferences_per_second (IPS)": 1 / mean_latency if mean_latency > 0 else 0,
+            "P95 Latency (s)": latency.quantile(0.95),
+            "Max Latency (s)": latency.max(),
+            "Avg Throughput (chars/s)": data["throughput"].mean
+        }
+        result_row.update(structured_metrics(data["scores"].summary()))
+        results.append(result_row)
+
+    return pd.DataFrame(results)
+
+
+def calculate_and_present_results(stats: dict):
+    present_results(calculate_results(stats))
+
+
 if __name__ == "__main__":
     if not os.path.isdir('./before') or not os.path.isdir('./after'):
         print("Error: Make sure 'before' and 'after' directories exist in the same location as the script.")
@@ -151,6 +412,10 @@ if __name__ == "__main__":
 
         if not all_files:
             print("No '.jsonl' files found in 'before' or 'after' directories.")
+        elif ANALYSIS_MODE == "columnar" and pa_json is not None:
+            present_results(analyze_frame(load_frame(all_files)))
+        elif ANALYSIS_MODE in ("columnar", "parallel"):
+            calculate_and_present_results(analyze_files_parallel(all_files))
         else:
             raw_stats = analyze_files(all_files)
             calculate_and_present_results(raw_stats)
\ No newline at end of file
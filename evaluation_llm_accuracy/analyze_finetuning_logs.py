@@ -0,0 +1,210 @@
+import os
+import re
+import sys
+import json
+import pandas as pd
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+sys.path.append(ROOT_DIR)
+sys.path.append(os.path.join(ROOT_DIR, 'evaluation_latency_quantization'))
+
+from analyze_accuracy_and_time import analyze_frame, load_frame
+from parse_edge_device_logs import analyze_jetson_logs
+
+FINETUNING_LOG_DIR = os.path.join(ROOT_DIR, 'finetuning_logs')
+
+# 微调日志文件 -> (模型名, 端侧 Ollama 模型名); 微调后的离线评测结果在 AFTER_DIR 中, 文件名为 "<模型名>_after.jsonl"
+MODELS = {
+    'qwen2_5-0_5b-logging.jsonl': ('qwen2.5_0.5b', 'qwen2.5_0.5b_drone_q4:latest'),
+    'qwen2_5-1_5blogging.jsonl': ('qwen2.5_1.5b', 'qwen2.5_1.5b_drone_q4:latest'),
+    'Qwen2___5-3B-logging.jsonl': ('qwen2.5_3b', 'qwen2.5_3b_drone_q4:latest'),
+    'llama3_2-1-b.jsonl': ('llama3.2_1b', 'llama3.2_1b_drone_q4:latest'),
+    'Llama-3___2-3B-logging.jsonl': ('llama3.2_3b', 'llama3.2_3b_drone_q4:latest'),
+    'gemma2_2b-logging.jsonl': ('gemma2_2b', 'gemma2-2b_drone_q4:latest'),
+    'phi3_5-minilogging.jsonl': ('phi3.5_mini', 'phi3.5-mini_drone_q4:latest'),
+    'deepseek_r1v1-logging.jsonl': ('deepseek_r1_qwen2.5_1.5b', 'deepseek-r1-qwen2.5-1.5b_drone_q4:latest'),
+}
+
+# 所有模型都在同一台 A100 服务器上单卡训练; GPU 时 = 训练时长 (小时) * GPU 数
+NUM_GPUS = 1
+
+# 收敛目标: 验证集 loss 首次不高于 TARGET_EVAL_LOSS / token 准确率首次不低于 TARGET_EVAL_ACC 时的 GPU 时
+TARGET_EVAL_LOSS = 0.05
+
+TARGET_EVAL_ACC = 0.98
+
+AFTER_DIR = './after'
+
+EDGE_LOG_FILE = os.path.join(ROOT_DIR, 'evaluation_latency_quantization', 'test_progress.jsonl')
+
+OUTPUT_FILE = 'finetuning_summary.csv'
+
+DURATION_PATTERN = re.compile(r'(\d+(?:\.\d+)?)\s*([dhms])')
+
+DURATION_SECONDS = {'d': 86400, 'h': 3600, 'm': 60, 's': 1}
+
+SIZE_PATTERN = re.compile(r'size=(\d+)')
+
+
+def parse_duration(text: str) -> float:
+    # MS-Swift 的时长格式, 例如 "2h 55m 5s" / "58m 15s" / "30s"
+    return sum(float(value) * DURATION_SECONDS[unit] for value, unit in DURATION_PATTERN.findall(text or ''))
+
+
+def parse_step(text: str) -> tuple:
+    # "42/177" -> (42, 177)
+    step, _, max_steps = (text or '').partition('/')
+    return int(step), int(max_steps)
+
+
+def parse_memory_gib(memory) -> float:
+    # 训练结束时的显存记录: 旧版为 {"cuda": "76.34GiB"}, 新版直接记录 GiB 数值
+    if isinstance(memory, dict):
+        memory = memory.get('cuda')
+    return float(str(memory).replace('GiB', '')) if memory else None
+
+
+def normalize_record(record: dict):
+    # 返回 (记录类型, 统一字段名后的记录); 新旧版本 MS-Swift 的准确率字段分别为 token_acc / acc
+    if 'global_step/max_steps' in record:
+        step, max_steps = parse_step(record['global_step/max_steps'])
+        common = {'step': step, 'max_steps': max_steps, 'epoch': record.get('epoch'),
+                  'elapsed_s': parse_duration(record.get('elapsed_time'))}
+        if 'eval_loss' in record:
+            return 'eval', {**common, 'eval_loss': record['eval_loss'],
+                            'eval_acc': record.get('eval_token_acc', record.get('eval_acc'))}
+        if 'loss' in record:
+            return 'train', {**common, 'loss': record['loss'], 'acc': record.get('token_acc', record.get('acc')),
+                             'memory_gib': record.get('memory(GiB)'),
+                             'train_speed_iter_s': record.get('train_speed(iter/s)')}
+        if 'train_runtime' in record:
+            return 'summary', {**common, 'train_runtime_s': record['train_runtime'],
+                               'train_samples_per_second': record.get('train_samples_per_second'),
+                               'train_loss': record.get('train_loss')}
+    if 'last_model_checkpoint' in record:
+        size = SIZE_PATTERN.search(str(record.get('train_dataset', record.get('dataset_info', ''))))
+        return 'info', {'peak_memory_gib': parse_memory_gib(record.get('memory')),
+                        'train_size': int(size.group(1)) if size else None,
+                        'best_metric': record.get('best_metric')}
+    return None, record
+
+
+def load_run(file_path: str) -> dict:
+    run = {'train': [], 'eval': [], 'summary': {}, 'info': {}}
+    with open(file_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                kind, record = normalize_record(json.loads(line))
+            except (json.JSONDecodeError, ValueError) as e:
+                print(f"Skipping malformed line in {file_path}: {e}")
+                continue
+            if kind in ('train', 'eval'):
+                run[kind].append(record)
+            elif kind in ('summary', 'info'):
+                run[kind] = record
+    return run
+
+
+def gpu_hours_to(records: list, reached) -> float:
+    for record in records:
+        if reached(record):
+            return record['elapsed_s'] * NUM_GPUS / 3600
+    return None
+
+
+def summarize_run(run: dict) -> dict:
+    train, evals, summary, info = run['train'], run['eval'], run['summary'], run['info']
+    last = summary or (train[-1] if train else {})
+    runtime_s = summary.get('train_runtime_s') or last.get('elapsed_s')
+    step_memory = [r['memory_gib'] for r in train if r['memory_gib'] is not None]
+    peak_memory = max(step_memory + ([info['peak_memory_gib']] if info.get('peak_memory_gib') else []), default=None)
+    samples_per_s = summary.get('train_samples_per_second')
+    if not samples_per_s and info.get('train_size') and runtime_s:
+        # 没有最终汇总记录时按 训练集大小 * 已训练 epoch 数 / 时长 估算
+        samples_per_s = info['train_size'] * last.get('epoch', 0) / runtime_s
+    eval_accs = [r['eval_acc'] for r in evals if r['eval_acc'] is not None]
+    return {
+        "Steps": last.get('step'),
+        "Epochs": last.get('epoch'),
+        "Train Runtime (h)": runtime_s / 3600 if runtime_s else None,
+        "GPU Hours": runtime_s * NUM_GPUS / 3600 if runtime_s else None,
+        "Samples/s": samples_per_s,
+        "Peak Memory (GiB)": peak_memory,
+        "Final Train Loss": train[-1]['loss'] if train else None,
+        "Best Eval Loss": min((r['eval_loss'] for r in evals), default=None),
+        "Best Eval Acc": max(eval_accs, default=None),
+        f"GPU Hours to Eval Loss <= {TARGET_EVAL_LOSS}": gpu_hours_to(
+            evals, lambda r: r['eval_loss'] <= TARGET_EVAL_LOSS),
+        f"GPU Hours to Eval Acc >= {TARGET_EVAL_ACC}": gpu_hours_to(
+            evals, lambda r: r['eval_acc'] is not None and r['eval_acc'] >= TARGET_EVAL_ACC),
+    }
+
+
+def analyze_finetuning_logs(log_dir: str = FINETUNING_LOG_DIR) -> pd.DataFrame:
+    rows = []
+    for file_name, (model_name, edge_model) in MODELS.items():
+        file_path = os.path.join(log_dir, file_name)
+        if not os.path.exists(file_path):
+            print(f"Warning: File not found at {file_path}. Skipping.")
+            continue
+        rows.append({"Model": model_name, "Edge Model": edge_model, **summarize_run(load_run(file_path))})
+    return pd.DataFrame(rows)
+
+
+def accuracy_results(after_dir: str = AFTER_DIR) -> pd.DataFrame:
+    # 微调后模型的离线评测结果 (analyze_accuracy_and_time.py 的 columnar 输出), 以模型名关联
+    if not os.path.isdir(after_dir):
+        print(f"Warning: '{after_dir}' not found. Offline accuracy columns will be empty.")
+        return pd.DataFrame(columns=["Model"])
+    files = [os.path.join(after_dir, i) for i in os.listdir(after_dir) if i.endswith('.jsonl')]
+    df = analyze_frame(load_frame(files))
+    df["Model"] = df["Model"].astype(str).str.replace(r'_after$', '', regex=True)
+    return df[["Model", "Exact Match Acc (%)", "Structured Acc (%)", "Avg Latency (s)"]].rename(
+        columns={"Avg Latency (s)": "Server Latency (s)"})
+
+
+def edge_results(edge_log_file: str = EDGE_LOG_FILE) -> pd.DataFrame:
+    # 端侧 (Jetson) 实测结果, 以 Ollama 模型名关联
+    metrics = analyze_jetson_logs(edge_log_file) if os.path.exists(edge_log_file) else None
+    if not metrics:
+        print(f"Warning: no edge results in '{edge_log_file}'. Edge columns will be empty.")
+        return pd.DataFrame(columns=["Edge Model"])
+    return pd.DataFrame([{
+        "Edge Model": model_name,
+        "Edge Accuracy (%)": m['accuracy_percent'],
+        "Edge Avg Latency (ms)": m['average_latency_s'] * 1000,
+        "Edge P95 Latency (ms)": m['p95_latency_s'] * 1000,
+    } for model_name, m in metrics.items()])
+
+
+def join_results(finetune: pd.DataFrame, accuracy: pd.DataFrame, edge: pd.DataFrame) -> pd.DataFrame:
+    df = finetune.merge(accuracy, on="Model", how="left").merge(edge, on="Edge Model", how="left")
+    # 选型指标: 优先使用端侧实测准确率 (量化后的部署模型), 没有端侧结果时使用离线 Exact Match
+    accuracy_percent = df.get("Edge Accuracy (%)", pd.Series(index=df.index, dtype=float)).fillna(
+        df.get("Exact Match Acc (%)", pd.Series(index=df.index, dtype=float)))
+    df["Accuracy per GPU Hour"] = accuracy_percent / df["GPU Hours"]
+    if "Edge Avg Latency (ms)" in df:
+        df["Accuracy per Edge ms"] = accuracy_percent / df["Edge Avg Latency (ms)"]
+    return df
+
+
+def present_results(df: pd.DataFrame):
+    if df.empty:
+        print("No fine-tuning logs processed. Please check FINETUNING_LOG_DIR.")
+        return
+
+    pd.set_option('display.max_rows', 500)
+    pd.set_option('display.max_columns', 500)
+    pd.set_option('display.width', 1000)
+
+    df = df.sort_values(by="Model").reset_index(drop=True)
+    df.to_csv(OUTPUT_FILE, index=False)
+
+    print("\n--- Fine-tuning Cost and Convergence ---\n")
+    print(df.round(4))
+    print(f"\nSaved to '{OUTPUT_FILE}'.")
+
+
+if __name__ == "__main__":
+    present_results(join_results(analyze_finetuning_logs(), accuracy_results(), edge_results()))
@@ -0,0 +1,99 @@
+import json
+import os
+import random
+import tempfile
+import time
+import numpy as np
+
+from analyze_accuracy_and_time import (
+    analyze_files, analyze_files_parallel, analyze_frame, calculate_results, load_frame, pa_json
+)
+
+# 合成语料的总记录数 (平均分配到各个模型文件)
+NUM_RECORDS = 2_000_000
+
+SEED = 0
+
+# 合成模型名覆盖 extract_response_from_model_ans 中的全部模板分支
+SYNTHETIC_MODELS = {
+    'qwen2.5_0.5b_after': ('<|im_start|>user\n{q}<|im_end|>\n<|im_start|>assistant\n', '{a}<|im_end|>'),
+    'llama3.2_1b_after': ('<|start_header_id|>user<|end_header_id|>\n\n{q}<|eot_id|>'
+                          '<|start_header_id|>assistant<|end_header_id|>\n\n', '{a}<|eot_id|>'),
+    'gemma2_2b_after': ('<start_of_turn>user\n{q}<end_of_turn>\n<start_of_turn>model\n', '{a}<end_of_turn><eos>'),
+    'phi3.5_mini_after': ('<|user|> {q} <|end|><|assistant|> ', '{a}<|end|>'),
+    'deepseek_r1_1.5b_after': ('<｜User｜>{q}<｜Assistant｜><think>\n', '{a}<｜end▁of▁sentence｜>'),
+    'unknown_before': ('<start_of_turn>user\n{q}<end_of_turn>\n<start_of_turn>model\n', '{a}\n<end_of_turn>'),
+}
+
+ANSWERS = ["A.", "B.", "人; 牙刷; 背包; 披萨.", "couch; dog; wine glass.", "take_off; move_up 3 ft; land.",
+           "pause_search_task.", "None."]
+
+
+def write_synthetic_corpus(directory, num_records, seed=SEED):
+    rng = random.Random(seed)
+    per_model = num_records // len(SYNTHETIC_MODELS)
+    file_paths = []
+    for model_name, (prefix, suffix) in SYNTHETIC_MODELS.items():
+        file_path = os.path.join(directory, f"{model_name}.jsonl")
+        with open(file_path, 'w', encoding='utf-8') as f:
+            for i in range(per_model):
+                truth = rng.choice(ANSWERS)
+                answer = truth if rng.random() < 0.7 else rng.choice(ANSWERS)
+                record = {
+                    "query": f"user input: sample {i}\nresponse: ",
+                    "response": truth,
+                    "model_ans": prefix.format(q=f"sample {i}") + suffix.format(a=answer),
+                    "sp_time": round(rng.lognormvariate(-1.0, 0.5), 6),
+                }
+                f.write(json.dumps(record, ensure_ascii=False) + '\n')
+        file_paths.append(file_path)
+    return file_paths
+
+
+def main():
+    print(f"--- Columnar vs. row-wise analyzer benchmark ({NUM_RECORDS:,} records) ---")
+    with tempfile.TemporaryDirectory() as directory:
+        start = time.perf_counter()
+        file_paths = write_synthetic_corpus(directory, NUM_RECORDS)
+        print(f"Generated synthetic corpus in {time.perf_counter() - start:.2f}s")
+
+        start = time.perf_counter()
+        row_result = calculate_results(analyze_files(file_paths))
+        row_time = time.perf_counter() - start
+        print(f"Row-wise path:  {row_time:.2f}s")
+
+        start = time.perf_counter()
+        df = load_frame(file_paths)
+        load_time = time.perf_counter() - start
+        start = time.perf_counter()
+        columnar_result = analyze_frame(df)
+        compute_time = time.perf_counter() - start
+        print(f"Columnar path:  {load_time + compute_time:.2f}s "
+              f"(load {load_time:.2f}s + compute {compute_time:.2f}s)")
+        print(f"Speedup:        {row_time / (load_time + compute_time):.2f}x "
+              f"(pyarrow JSON reader: {'yes' if pa_json is not None else 'no, per-line fallback'})")
+
+        start = time.perf_counter()
+        parallel_result = calculate_results(analyze_files_parallel(file_paths))
+        parallel_time = time.perf_counter() - start
+        print(f"Parallel path:  {parallel_time:.2f}s ({os.cpu_count()} CPUs, "
+              f"{row_time / parallel_time:.2f}x vs. row-wise)")
+
+    row_result = row_result.sort_values("Model").reset_index(drop=True)
+    columnar_result = columnar_result.sort_values("Model").reset_index(drop=True)
+    parallel_result = parallel_result.sort_values("Model").reset_index(drop=True)
+    numeric_cols = [c for c in row_result.columns if c != "Model"]
+    # 逐行与并行路径的 P95 来自延迟 sketch, 与列式路径的精确 P95 只要求在其相对误差范围内
+    exact_cols = [c for c in numeric_cols if c != "P95 Latency (s)"]
+    same = (list(row_result["Model"]) == list(columnar_result["Model"].astype(str)) and
+            np.allclose(row_result[exact_cols].to_numpy(float), columnar_result[exact_cols].to_numpy(float)))
+    p95_error = (row_result["P95 Latency (s)"] / columnar_result["P95 Latency (s)"] - 1).abs().max()
+    print(f"Columnar results identical: {same} (max P95 relative error of the sketch {p95_error:.4%})")
+
+    same = (list(row_result["Model"]) == list(parallel_result["Model"]) and
+            np.allclose(row_result[numeric_cols].to_numpy(float), parallel_result[numeric_cols].to_numpy(float)))
+    print(f"Parallel results identical: {same}")
+
+
+if __name__ == "__main__":
+    main()
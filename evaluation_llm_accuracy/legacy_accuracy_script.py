@@ -1,6 +1,15 @@
 import json
+import os
+import sys
 
-with open('./before/llama3.2_3b_instruct_before.jsonl', 'r', encoding='utf-8') as file:
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from analyze_accuracy_and_time import extract_response_from_model_ans
+from common.scoring import response_task, score_response
+
+MODEL_NAME = 'llama3.2_3b_instruct_before'
+
+with open(f'./before/{MODEL_NAME}.jsonl', 'r', encoding='utf-8') as file:
     val_res_data = json.loads('[' + ','.join(file.readlines()) + ']')
 
 print(val_res_data[0])
@@ -21,12 +30,18 @@ def is_true(t_data: dict):
 
 true_count = 0
 all_true = 0
+structured_true = 0
 for i in val_res_data:
     if i['response'] in i['model_ans']:
         all_true += 1
     if is_true(i):
         true_count += 1
+    # 去掉对话模板后按结构化结果比较 (common/scoring.py), 不受大小写、方括号、等价单位等格式差异影响
+    answer = extract_response_from_model_ans(i['model_ans'], MODEL_NAME)
+    if score_response(response_task(i.get('query'), i['response']), i['response'], answer)['match']:
+        structured_true += 1
 
 print(true_count)
 print('包含答案：', true_count / len(val_res_data))
-print('完全相同：', all_true / len(val_res_data))
\ No newline at end of file
+print('完全相同：', all_true / len(val_res_data))
+print('结构化相同：', structured_true / len(val_res_data))
\ No newline at end of file
@@ -0,0 +1,235 @@
+import glob
+import importlib.util
+import multiprocessing
+import os
+import resource
+import shutil
+import sys
+import time
+import numpy as np
+import pandas as pd
+
+# 在没有 GPU 的机器 (例如 CI) 上复现各 YOLO 结构的速度: 从 YAML (或 .pt) 构建模型, 在 CPU 上按不同输入尺寸与
+# batch 计时 PyTorch 以及可用的导出格式 (ONNX Runtime / OpenVINO), 并与基线结果比较, 延迟变慢超过容差时以非零状态退出。
+# 依赖: ultralytics (含 torch); 导出格式需要 onnx + onnxruntime / openvino, 未安装时跳过对应格式
+
+MODEL_DIR = os.path.dirname(os.path.abspath(__file__))
+
+MODELS = [
+    'yolo11n.yaml',
+    'yolo11n-lite_v1.yaml',
+    'yolo11n-lite_v2.yaml',
+    'yolov11n-v3-lite.yaml',
+    'yolo11n-lite_v3.pt',
+]
+
+# 960 为 Jetson 上实际部署的输入尺寸 (见 Jetson Xavier NX 8g-yolo-benchmark.log)
+IMAGE_SIZES = [960, 640, 480, 320]
+
+BATCH_SIZES = [1, 4]
+
+FORMATS = ['pytorch', 'onnx', 'openvino']
+
+# 各导出格式所需的 Python 包
+FORMAT_REQUIREMENTS = {
+    'pytorch': ['torch', 'ultralytics'],
+    'onnx': ['onnx', 'onnxruntime'],
+    'openvino': ['openvino'],
+}
+
+WARMUP_RUNS = 5
+
+TIMED_RUNS = 30
+
+# 固定推理线程数, 不同机器/不同次运行的结果才可比较
+NUM_THREADS = 4
+
+EXPORT_DIR = './yolo_cpu_exports'
+
+OUTPUT_FILE = 'yolo_cpu_benchmark.csv'
+
+# 基线结果 (此前某次运行的 OUTPUT_FILE); 存在时比较 P50 延迟, 超过基线 (1 + REGRESSION_TOLERANCE) 倍视为变慢
+BASELINE_FILE = 'yolo_cpu_baseline.csv'
+
+REGRESSION_TOLERANCE = 0.15
+
+# 为 True 时用本次结果覆盖基线文件
+UPDATE_BASELINE = False
+
+CASE_KEYS = ['model', 'format', 'imgsz', 'batch']
+
+
+def format_available(fmt):
+    return all(importlib.util.find_spec(name) is not None for name in FORMAT_REQUIREMENTS[fmt])
+
+
+def case_source(model_file, imgsz, batch):
+    # 每个 (尺寸, batch) 组合单独复制一份模型文件再导出, 避免导出文件互相覆盖, 也不会写入 model/yolo 目录;
+    # 复制后的文件名仍以 "yolo11n" / "yolov11n" 开头, ultralytics 据此识别模型规模 (n)
+    stem, ext = os.path.splitext(model_file)
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    source = os.path.join(EXPORT_DIR, f"{stem}_{imgsz}_b{batch}{ext}")
+    if not os.path.exists(source):
+        shutil.copy(os.path.join(MODEL_DIR, model_file), source)
+    return source
+
+
+def prepare_case(model_file, imgsz, batch):
+    # 在主进程中构建模型、统计参数量与 FLOPs 并导出各格式, 计时在单独的子进程中进行, 导出的内存开销不计入峰值内存
+    from ultralytics import YOLO
+    from ultralytics.utils.torch_utils import get_flops
+
+    source = case_source(model_file, imgsz, batch)
+    model = YOLO(source)
+    info = {
+        'params_m': sum(p.numel() for p in model.model.parameters()) / 1e6,
+        # get_flops 依赖 thop, 未安装时返回 0
+        'gflops': get_flops(model.model, imgsz) or None,
+    }
+    artifacts = {}
+    for fmt in FORMATS:
+        if not format_available(fmt):
+            continue
+        if fmt == 'pytorch':
+            artifacts[fmt] = source
+            continue
+        try:
+            path = model.export(format=fmt, imgsz=imgsz, batch=batch, device='cpu', half=False, dynamic=False,
+                                simplify=False)
+        except Exception as e:
+            print(f"  - [警告] {model_file} 导出 {fmt} (imgsz={imgsz}, batch={batch}) 失败: {e}")
+            continue
+        if fmt == 'openvino':
+            xml_files = glob.glob(os.path.join(str(path), '*.xml'))
+            if not xml_files:
+                continue
+            path = xml_files[0]
+        artifacts[fmt] = str(path)
+    return info, artifacts
+
+
+def load_runner(fmt, path):
+    if fmt == 'pytorch':
+        import torch
+        from ultralytics import YOLO
+
+        torch.set_num_threads(NUM_THREADS)
+        # 与导出格式一致: 融合 Conv + BN, 推理模式
+        net = YOLO(path).model.float().fuse(verbose=False).eval()
+
+        def run(x):
+            with torch.inference_mode():
+                net(torch.from_numpy(x))
+        return run
+    if fmt == 'onnx':
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = NUM_THREADS
+        session = ort.InferenceSession(path, options, providers=['CPUExecutionProvider'])
+        input_name = session.get_inputs()[0].name
+        return lambda x: session.run(None, {input_name: x})
+    if fmt == 'openvino':
+        import openvino as ov
+
+        compiled = ov.Core().compile_model(path, 'CPU', {'INFERENCE_NUM_THREADS': NUM_THREADS})
+        request = compiled.create_infer_request()
+        return lambda x: request.infer([x])
+    raise ValueError(f"未知格式: {fmt}")
+
+
+def peak_rss_mb():
+    # ru_maxrss 在 Linux 上单位为 KB, 在 macOS 上为字节
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def time_case(fmt, path, imgsz, batch):
+    # 在全新的子进程中运行, 峰值内存只包含本格式的加载与推理
+    run = load_runner(fmt, path)
+    x = np.random.default_rng(0).random((batch, 3, imgsz, imgsz), dtype=np.float32)
+    for _ in range(WARMUP_RUNS):
+        run(x)
+    loaded_rss = peak_rss_mb()
+    latencies = []
+    for _ in range(TIMED_RUNS):
+        start_time = time.perf_counter()
+        run(x)
+        latencies.append((time.perf_counter() - start_time) * 1000)
+    p50 = float(np.percentile(latencies, 50))
+    return {
+        'mean_ms': float(np.mean(latencies)),
+        'p50_ms': p50,
+        'p90_ms': float(np.percentile(latencies, 90)),
+        'p99_ms': float(np.percentile(latencies, 99)),
+        'p50_ms_per_image': p50 / batch,
+        'images_per_second': batch * 1000 / p50 if p50 else None,
+        'peak_rss_mb': peak_rss_mb(),
+        'inference_rss_mb': peak_rss_mb() - loaded_rss,
+    }
+
+
+def find_regressions(df, baseline_file=BASELINE_FILE):
+    if not os.path.exists(baseline_file):
+        return pd.DataFrame()
+    baseline = pd.read_csv(baseline_file)[CASE_KEYS + ['p50_ms']]
+    merged = df.merge(baseline, on=CASE_KEYS, suffixes=('', '_baseline'))
+    merged['slowdown_percent'] = (merged['p50_ms'] / merged['p50_ms_baseline'] - 1) * 100
+    return merged[merged['p50_ms'] > merged['p50_ms_baseline'] * (1 + REGRESSION_TOLERANCE)]
+
+
+def main():
+    print("--- YOLO CPU 延迟基准测试 ---")
+    formats = [fmt for fmt in FORMATS if format_available(fmt)]
+    print(f"  - 可用格式: {', '.join(formats)} (未安装依赖的格式已跳过), 推理线程数: {NUM_THREADS}")
+    if 'pytorch' not in formats:
+        print("  - [错误] 需要安装 ultralytics (含 torch) 才能构建模型。")
+        return 1
+
+    rows = []
+    # maxtasksperchild=1: 每个计时任务使用新进程, ru_maxrss 不受之前任务的影响
+    with multiprocessing.get_context('spawn').Pool(1, maxtasksperchild=1) as pool:
+        for model_file in MODELS:
+            for imgsz in IMAGE_SIZES:
+                for batch in BATCH_SIZES:
+                    print(f"\n[{model_file}] imgsz={imgsz}, batch={batch}")
+                    info, artifacts = prepare_case(model_file, imgsz, batch)
+                    for fmt, path in artifacts.items():
+                        try:
+                            result = pool.apply(time_case, (fmt, path, imgsz, batch))
+                        except Exception as e:
+                            print(f"  - [错误] {fmt} 计时失败: {e}")
+                            continue
+                        print(f"  - {fmt:<9} P50 {result['p50_ms']:.1f} ms, P99 {result['p99_ms']:.1f} ms, "
+                              f"峰值内存 {result['peak_rss_mb']:.0f} MB")
+                        rows.append({'model': model_file, 'format': fmt, 'imgsz': imgsz, 'batch': batch,
+                                     **info, **result})
+
+    df = pd.DataFrame(rows)
+    if df.empty:
+        print("没有得到任何结果。")
+        return 1
+
+    pd.set_option('display.max_rows', 500)
+    pd.set_option('display.max_columns', 500)
+    pd.set_option('display.width', 1000)
+
+    df = df.sort_values(by=['imgsz', 'batch', 'format', 'p50_ms'], ascending=[False, True, True, True])
+    df.to_csv(OUTPUT_FILE, index=False)
+    print("\n--- 测试结果 ---\n")
+    print(df.reset_index(drop=True).round(3))
+    print(f"\n详细结果已保存在 '{OUTPUT_FILE}' 文件中。")
+
+    regressions = find_regressions(df)
+    if UPDATE_BASELINE:
+        df.to_csv(BASELINE_FILE, index=False)
+        print(f"基线已更新: '{BASELINE_FILE}'")
+    if not regressions.empty:
+        print(f"\n[警告] 以下组合的 P50 延迟比基线慢 {REGRESSION_TOLERANCE:.0%} 以上:\n")
+        print(regressions[CASE_KEYS + ['p50_ms_baseline', 'p50_ms', 'slowdown_percent']].round(2))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
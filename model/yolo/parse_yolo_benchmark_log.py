@@ -0,0 +1,196 @@
+import os
+import re
+import sys
+import pandas as pd
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+sys.path.append(ROOT_DIR)
+sys.path.append(os.path.join(ROOT_DIR, 'evaluation_latency_quantization'))
+
+from parse_edge_device_logs import analyze_jetson_logs
+
+LOG_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Jetson Xavier NX 8g-yolo-benchmark.log')
+
+OUTPUT_FILE = 'yolo_benchmark_summary.csv'
+
+# 与 YOLO 延迟并排对比的端侧 LLM 测试日志 (test_edge_latency_quantization.py 的输出), 不存在时只输出 YOLO 结果
+LLM_LOG_FILE = os.path.join(ROOT_DIR, 'evaluation_latency_quantization', 'test_progress.jsonl')
+
+# Pareto 前沿使用的延迟与精度指标: 延迟越低越好, 精度越高越好
+PARETO_LATENCY = 'total_ms'
+
+PARETO_ACCURACY = 'map50_95'
+
+MODEL_HEADER = re.compile(r'^([\w.\-]+):\s*$')
+
+BENCHMARK_COMMAND = re.compile(r'^yolo benchmark (.*)$')
+
+PYTORCH_SOURCE = re.compile(r"^PyTorch: starting from '([^']+)'.*\(([\d.]+) MB\)\s*$")
+
+EXPORT_SUCCESS = re.compile(r"^(\w[\w ]*?): export success \S+ ([\d.]+)s, saved as '([^']+)' \(([\d.]+) MB\)")
+
+EXPORT_FAILURE = re.compile(r"^(\w[\w ]*?): export failure \S+ ([\d.]+)s?:?\s*(.*)$")
+
+LOADING_FORMAT = re.compile(r'^Loading \S+ for (\w[\w ]*?) inference')
+
+# 验证结果汇总行: all <图片数> <实例数> <P> <R> <mAP50> <mAP50-95>
+VALIDATION_ALL = re.compile(r'^\s+all\s+(\d+)\s+(\d+)\s+([\d.]+)\s+([\d.]+)\s+([\d.]+)\s+([\d.]+)\s*$')
+
+SPEED = re.compile(
+    r'^Speed: ([\d.]+)ms preprocess, ([\d.]+)ms inference, ([\d.]+)ms loss, ([\d.]+)ms postprocess per image')
+
+# yolo benchmark 结束时打印的汇总表, 例如 "0  TorchScript  ✅  10.5  0.885  71.6  13.97";
+# 与逐段解析的结果合并, 只补充缺失的字段; 本日志只记录到 TorchScript 的验证, 没有汇总表
+SUMMARY_ROW = re.compile(
+    r'^\s*\d+\s+(\w[\w ]*?)\s+(\S)\s+([\d.]+|-)\s+([\d.]+|-|nan)\s+([\d.]+|-|nan)\s+([\d.]+|-|nan)\s*$')
+
+COLUMNS = ['model', 'format', 'status', 'size_mb', 'export_time_s', 'precision', 'recall', 'map50', 'map50_95',
+           'preprocess_ms', 'inference_ms', 'postprocess_ms', 'total_ms', 'fps', 'imgsz', 'half']
+
+
+def parse_args(text):
+    # "model=a.pt imgsz=960 half=True" -> {'model': 'a.pt', 'imgsz': '960', 'half': 'True'}
+    return dict(item.split('=', 1) for item in text.split() if '=' in item)
+
+
+def parse_benchmark_log(log_file_path):
+    # 按 "<模型名>:" 分段; 每段先验证 PyTorch 权重, 之后每个 "Loading ... for <格式> inference" 切换到导出格式,
+    # 随后的验证结果与 Speed 行都属于该格式
+    rows = {}
+    model = fmt = None
+    args = {}
+
+    def row(model_name, format_name):
+        key = (model_name, format_name)
+        if key not in rows:
+            rows[key] = {'model': model_name, 'format': format_name, 'status': 'ok',
+                         'imgsz': args.get('imgsz'), 'half': args.get('half')}
+        return rows[key]
+
+    with open(log_file_path, 'r', encoding='utf-8', errors='replace') as f:
+        for line in f:
+            line = line.rstrip('\n')
+            match = MODEL_HEADER.match(line)
+            if match:
+                model, fmt, args = match.group(1), 'PyTorch', {}
+                continue
+            match = BENCHMARK_COMMAND.match(line)
+            if match:
+                args = parse_args(match.group(1))
+                if model is None:
+                    model = os.path.splitext(os.path.basename(args.get('model', 'unknown')))[0]
+                fmt = 'PyTorch'
+                continue
+            if model is None:
+                continue
+            match = PYTORCH_SOURCE.match(line)
+            if match:
+                row(model, 'PyTorch')['size_mb'] = float(match.group(2))
+                continue
+            match = EXPORT_SUCCESS.match(line)
+            if match:
+                r = row(model, match.group(1))
+                r['export_time_s'], r['size_mb'] = float(match.group(2)), float(match.group(4))
+                continue
+            match = EXPORT_FAILURE.match(line)
+            if match:
+                row(model, match.group(1))['status'] = 'export_failed'
+                continue
+            match = LOADING_FORMAT.match(line)
+            if match:
+                fmt = match.group(1)
+                continue
+            match = VALIDATION_ALL.match(line)
+            if match:
+                r = row(model, fmt)
+                r['precision'], r['recall'], r['map50'], r['map50_95'] = map(float, match.groups()[2:])
+                continue
+            match = SPEED.match(line)
+            if match:
+                r = row(model, fmt)
+                r['preprocess_ms'], r['inference_ms'], _, r['postprocess_ms'] = map(float, match.groups())
+                continue
+            match = SUMMARY_ROW.match(line)
+            if match:
+                r = row(model, match.group(1))
+                if match.group(2) != '✅':
+                    r['status'] = 'failed'
+                for key, value in zip(('size_mb', 'map50_95', 'inference_ms'), match.groups()[2:5]):
+                    if value not in ('-', 'nan') and r.get(key) is None:
+                        r[key] = float(value)
+
+    df = pd.DataFrame(list(rows.values())).reindex(columns=COLUMNS)
+    df['total_ms'] = df[['preprocess_ms', 'inference_ms', 'postprocess_ms']].sum(axis=1, min_count=1)
+    df['fps'] = 1000 / df['total_ms']
+    return df
+
+
+def pareto_ranks(df, latency=PARETO_LATENCY, accuracy=PARETO_ACCURACY):
+    # 逐层剥离 Pareto 前沿: 第 1 层是不被任何其他行支配 (延迟不更高且精度不更低, 且至少一项更优) 的行,
+    # 去掉后剩余行的前沿为第 2 层, 以此类推; 缺少指标的行不参与排名
+    points = df[[latency, accuracy]].dropna()
+    ranks = pd.Series(pd.NA, index=df.index, dtype='Int64')
+    remaining = list(points.index)
+    rank = 1
+    while remaining:
+        front = [i for i in remaining if not any(
+            points.at[j, latency] <= points.at[i, latency] and points.at[j, accuracy] >= points.at[i, accuracy]
+            and (points.at[j, latency] < points.at[i, latency] or points.at[j, accuracy] > points.at[i, accuracy])
+            for j in remaining)]
+        ranks.loc[front] = rank
+        remaining = [i for i in remaining if i not in front]
+        rank += 1
+    return ranks
+
+
+def latency_budget(df, llm_log_file=LLM_LOG_FILE):
+    # 视觉与语言模型在同一设备上的延迟并排对比, 列与 LLM 分析脚本的输出一致 (延迟单位统一为 ms)
+    rows = [{
+        'Model': f"{r['model']} ({r['format']})",
+        'Type': 'vision',
+        'Accuracy': f"mAP50-95 {r['map50_95']:.3f}" if pd.notna(r['map50_95']) else 'N/A',
+        'Avg Latency (ms)': r['total_ms'],
+        'P95 Latency (ms)': None,
+        'inferences_per_second (IPS)': r['fps'],
+    } for _, r in df.iterrows() if pd.notna(r['total_ms'])]
+    llm_metrics = analyze_jetson_logs(llm_log_file) if os.path.exists(llm_log_file) else None
+    for model_name, m in (llm_metrics or {}).items():
+        rows.append({
+            'Model': model_name,
+            'Type': 'language',
+            'Accuracy': f"EM {m['accuracy_percent']:.2f}%",
+            'Avg Latency (ms)': m['average_latency_s'] * 1000,
+            'P95 Latency (ms)': m['p95_latency_s'] * 1000,
+            'inferences_per_second (IPS)': m['inferences_per_second (IPS)'],
+        })
+    return pd.DataFrame(rows)
+
+
+def present_results(df, budget):
+    if df.empty:
+        print("未在日志中找到 YOLO benchmark 结果。")
+        return
+
+    pd.set_option('display.max_rows', 500)
+    pd.set_option('display.max_columns', 500)
+    pd.set_option('display.width', 1000)
+
+    df = df.assign(pareto_rank=pareto_ranks(df)).sort_values(
+        by=['pareto_rank', PARETO_LATENCY], na_position='last').reset_index(drop=True)
+    df.to_csv(OUTPUT_FILE, index=False)
+
+    print("\n--- YOLO 各模型 × 导出格式 (按 Pareto 层级与延迟排序) ---\n")
+    print(df.round(4))
+    front = df[df['pareto_rank'] == 1]
+    print(f"\nPareto 前沿 ({PARETO_LATENCY} 越低越好, {PARETO_ACCURACY} 越高越好): "
+          + ', '.join(f"{r['model']} ({r['format']})" for _, r in front.iterrows()))
+
+    print("\n--- 端侧延迟预算: 视觉 vs 语言 ---\n")
+    print(budget.sort_values(by=['Type', 'Avg Latency (ms)']).reset_index(drop=True).round(3))
+    print(f"\n详细结果已保存在 '{OUTPUT_FILE}' 文件中。")
+
+
+if __name__ == "__main__":
+    results = parse_benchmark_log(LOG_FILE)
+    present_results(results, latency_budget(results))